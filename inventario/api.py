@@ -0,0 +1,203 @@
+"""
+API REST de solo lectura (v1) para integraciones.
+
+- Paginación por cursor: ?cursor=...&page_size=...
+- Selección de campos: ?fields=id,titulo
+- Consulta por lista de ids: ?ids=1,2,3 o POST <recurso>/lote/ con {"ids": [...]}
+- GET condicional: cada respuesta trae ETag y Last-Modified, y con
+  If-None-Match se responde 304 sin serializar nada.
+- Stock histórico: GET bodegas/<id>/stock/?fecha=AAAA-MM-DD[THH:MM]
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework import permissions, routers, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .fechas import leer_fecha
+from .instantaneas import stock_a_fecha
+from .models import Bodega, Existencia, Movimiento, MovimientoDetalle, Producto
+from .serializers import (
+    BodegaSerializer, ExistenciaSerializer, MovimientoDetalleSerializer,
+    MovimientoSerializer, ProductoSerializer,
+)
+
+# Máximo de ids aceptados en una consulta por lista
+MAX_IDS = 1000
+
+
+class PaginacionCursorApi(CursorPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = 'id'
+
+
+class EsPersonalDeBodega(permissions.BasePermission):
+    def has_permission(self, request, view):
+        usuario = request.user
+        return bool(usuario and usuario.is_authenticated
+                    and (usuario.is_jefe_bodega or usuario.is_bodeguero))
+
+
+class ApiViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Base de los recursos de la API.
+
+    - filtros: parámetros GET aceptados como igualdad exacta.
+    - campo_modificacion: campo cuyo máximo define Last-Modified y el ETag.
+    """
+    permission_classes = [EsPersonalDeBodega]
+    pagination_class = PaginacionCursorApi
+    filtros = []
+    campo_modificacion = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for filtro in self.filtros:
+            valor = self.request.query_params.get(filtro)
+            if valor is not None:
+                try:
+                    queryset = queryset.filter(**{filtro: valor})
+                except (TypeError, ValueError):
+                    raise ValidationError({filtro: "Valor inválido."})
+        ids = self.request.query_params.get('ids')
+        if ids is not None:
+            queryset = queryset.filter(pk__in=_leer_ids(ids.split(',')))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # Una agregación barata decide si hace falta armar la página
+        version = self.filter_queryset(self.get_queryset()).aggregate(
+            total=Count('pk'), ultima=Max(self.campo_modificacion))
+        return self.responder_condicional(
+            (version['total'], version['ultima']), version['ultima'],
+            lambda: super(ApiViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        objeto = self.get_object()
+        ultima = _valor_de(objeto, self.campo_modificacion)
+        return self.responder_condicional(
+            (objeto.pk, ultima), ultima,
+            lambda: Response(self.get_serializer(objeto).data))
+
+    @action(detail=False, methods=['post'])
+    def lote(self, request):
+        """
+        Consulta por lista de ids enviada en el cuerpo: {"ids": [1, 2, 3]}.
+        """
+        ids = request.data.get('ids')
+        if not isinstance(ids, list):
+            raise ValidationError({'ids': "Se espera una lista de ids."})
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            pk__in=_leer_ids(ids)).order_by('pk')
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    def responder_condicional(self, version, ultima, generar):
+        """
+        Responde 304 si el cliente ya tiene esta versión; si no, llama a
+        generar() y agrega ETag y Last-Modified a la respuesta.
+        """
+        # La representación también depende de la URL (filtros, campos,
+        # cursor) y del formato pedido
+        datos = f"{version}|{self.request.get_full_path()}|{self.request.accepted_renderer.format}"
+        etag = quote_etag(hashlib.md5(datos.encode()).hexdigest())
+
+        # Solo el ETag decide el 304: Last-Modified tiene resolución de un
+        # segundo y un cambio en el mismo segundo pasaría por no modificado
+        response = get_conditional_response(self.request, etag=etag)
+        if response is None:
+            response = generar()
+        response['ETag'] = etag
+        if ultima is not None:
+            response['Last-Modified'] = http_date(ultima.timestamp())
+        return response
+
+
+def _leer_ids(ids):
+    try:
+        ids = [int(pk) for pk in ids if str(pk).strip()]
+    except (TypeError, ValueError):
+        raise ValidationError({'ids': "Los ids deben ser enteros."})
+    if len(ids) > MAX_IDS:
+        raise ValidationError({'ids': f"Se aceptan como máximo {MAX_IDS} ids."})
+    return ids
+
+
+def _valor_de(objeto, ruta):
+    for parte in ruta.split('__'):
+        objeto = getattr(objeto, parte)
+    return objeto
+
+
+# -----------------------------------
+# Recursos
+# -----------------------------------
+
+class ProductoViewSet(ApiViewSet):
+    queryset = Producto.objects.prefetch_related('autores')
+    serializer_class = ProductoSerializer
+    filtros = ['tipo', 'editorial']
+    campo_modificacion = 'actualizado'
+
+
+class BodegaViewSet(ApiViewSet):
+    queryset = Bodega.objects.all()
+    serializer_class = BodegaSerializer
+    campo_modificacion = 'actualizado'
+
+    @action(detail=True)
+    def stock(self, request, pk=None):
+        """
+        Stock de la bodega a una fecha (?fecha=); una fecha sin hora se toma
+        al cierre del día. Sin fecha retorna el stock actual.
+        """
+        bodega = self.get_object()
+        valor = request.query_params.get('fecha')
+        fecha = leer_fecha(valor, fin_del_dia=True) if valor else timezone.now()
+        if fecha is None:
+            raise ValidationError({'fecha': "Se espera una fecha ISO 8601."})
+        stock = stock_a_fecha(bodega, fecha)
+        return Response({
+            'bodega': bodega.pk,
+            'fecha': fecha,
+            'stock': [
+                {'producto': producto_id, 'cantidad': cantidad}
+                for producto_id, cantidad in sorted(stock.items())
+            ],
+        })
+
+
+class ExistenciaViewSet(ApiViewSet):
+    queryset = Existencia.objects.all()
+    serializer_class = ExistenciaSerializer
+    filtros = ['producto', 'bodega']
+    campo_modificacion = 'actualizado'
+
+
+class MovimientoViewSet(ApiViewSet):
+    queryset = Movimiento.objects.select_related('usuario')
+    serializer_class = MovimientoSerializer
+    filtros = ['bodega_origen', 'bodega_destino']
+    campo_modificacion = 'fecha'
+
+
+class MovimientoDetalleViewSet(ApiViewSet):
+    queryset = MovimientoDetalle.objects.select_related('movimiento')
+    serializer_class = MovimientoDetalleSerializer
+    filtros = ['movimiento', 'producto']
+    campo_modificacion = 'movimiento__fecha'
+
+
+router = routers.DefaultRouter()
+router.register('productos', ProductoViewSet)
+router.register('bodegas', BodegaViewSet)
+router.register('existencias', ExistenciaViewSet)
+router.register('movimientos', MovimientoViewSet)
+router.register('movimiento-detalles', MovimientoDetalleViewSet)
@@ -0,0 +1,201 @@
+"""
+Archivo del historial de movimientos.
+
+Los períodos cerrados se mueven de Movimiento y MovimientoDetalle a
+MovimientoArchivado y DetalleArchivado, con los mismos ids, para que las
+tablas de uso diario solo tengan los movimientos recientes.
+
+Cada corte archiva los movimientos con id <= U, donde U es el mayor id tal que
+todos los movimientos hasta él son anteriores a la fecha de corte. Así el
+archivo es siempre un prefijo de ids y lo que sigue en Movimiento empieza
+donde termina el archivo, que es lo que necesitan las instantáneas de stock
+(definidas por id, ver instantaneas.py).
+
+Al archivar se toma además, por bodega, una instantánea de arrastre con el
+stock de los movimientos hasta U: las consultas de stock a una fecha posterior
+al período archivado parten de ella y no leen el archivo.
+"""
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q, Sum
+from django.utils import timezone
+
+from . import cache
+from .models import (
+    Bodega, DetalleArchivado, Existencia, InstantaneaStock, LineaInstantanea,
+    Movimiento, MovimientoArchivado, MovimientoDetalle, PeriodoArchivado,
+)
+
+# Filas por sentencia al guardar las instantáneas de arrastre y por lote al
+# leer el archivo
+LOTE = 2000
+
+
+def periodo_actual():
+    """
+    El último corte archivado, o None si no se archivó nada.
+    """
+    return PeriodoArchivado.objects.order_by('-ultimo_movimiento_id').first()
+
+
+def ultimo_movimiento_id():
+    """
+    Id del último movimiento registrado, esté en Movimiento o en el archivo.
+    """
+    ultimo = Movimiento.objects.aggregate(ultimo=Max('id'))['ultimo']
+    if ultimo is None:
+        periodo = periodo_actual()
+        return periodo.ultimo_movimiento_id if periodo else 0
+    return ultimo
+
+
+def necesita_archivo(desde=None, ultimo_movimiento_id=None):
+    """
+    Indica si una consulta debe leer también el archivo: hay movimientos
+    archivados con fecha >= desde (cualquiera si desde es None) o con id
+    mayor que ultimo_movimiento_id.
+    """
+    periodo = periodo_actual()
+    if periodo is None:
+        return False
+    if ultimo_movimiento_id is not None and ultimo_movimiento_id < periodo.ultimo_movimiento_id:
+        return True
+    return desde is None or desde <= periodo.ultima_fecha
+
+
+def periodos_cerrados(antes):
+    """
+    Primeros días de mes, desde el mes del movimiento más antiguo sin archivar
+    hasta `antes` (exclusivo): los cortes que archivan mes a mes.
+    """
+    primera = Movimiento.objects.filter(fecha__lt=antes).aggregate(primera=Min('fecha'))['primera']
+    if primera is None:
+        return []
+    primera = timezone.localtime(primera)
+    cortes = []
+    anio, mes = primera.year, primera.month
+    while True:
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+        corte = timezone.make_aware(datetime.datetime(anio, mes, 1))
+        if corte >= antes:
+            break
+        cortes.append(corte)
+    return cortes + [antes]
+
+
+def archivar(corte):
+    """
+    Mueve al archivo los movimientos anteriores a `corte` (ver el docstring
+    del módulo) y toma las instantáneas de arrastre. Retorna el
+    PeriodoArchivado creado, o None si no había nada que archivar.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Igual que al tomar instantáneas: el stock leído debe corresponder
+            # exactamente a los movimientos hasta el corte
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {Movimiento._meta.db_table} IN SHARE MODE")
+
+        primero_abierto = Movimiento.objects.filter(
+            fecha__gte=corte).aggregate(primero=Min('id'))['primero']
+        pendientes = Movimiento.objects.all()
+        if primero_abierto is not None:
+            pendientes = pendientes.filter(id__lt=primero_abierto)
+        resumen = pendientes.aggregate(ultimo=Max('id'), ultima_fecha=Max('fecha'))
+        if resumen['ultimo'] is None:
+            return None
+        ultimo = resumen['ultimo']
+
+        _tomar_instantaneas_de_arrastre(ultimo, resumen['ultima_fecha'])
+        movimientos, detalles = _mover_al_archivo(ultimo)
+        periodo = PeriodoArchivado.objects.create(
+            corte=corte,
+            ultimo_movimiento_id=ultimo,
+            ultima_fecha=resumen['ultima_fecha'],
+            movimientos=movimientos,
+            detalles=detalles,
+        )
+        # Los DELETE en SQL no emiten señales
+        cache.invalidar(Movimiento)
+        cache.invalidar(MovimientoDetalle)
+    return periodo
+
+
+def _tomar_instantaneas_de_arrastre(ultimo, fecha):
+    """
+    Stock de cada bodega con los movimientos hasta `ultimo`: el actual menos
+    lo que movieron los posteriores, que siguen en MovimientoDetalle.
+    """
+    posteriores = MovimientoDetalle.objects.filter(movimiento_id__gt=ultimo).order_by()
+    for bodega in Bodega.objects.all():
+        stock = dict(Existencia.objects.filter(
+            bodega=bodega, cantidad__gt=0).values_list('producto_id', 'cantidad'))
+        for campo, signo in (('movimiento__bodega_destino', -1), ('movimiento__bodega_origen', 1)):
+            for producto_id, cantidad in posteriores.filter(**{campo: bodega}).values(
+                    'producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total'):
+                stock[producto_id] = stock.get(producto_id, 0) + signo * cantidad
+
+        instantanea = InstantaneaStock.objects.create(
+            bodega=bodega, fecha=fecha, ultimo_movimiento_id=ultimo)
+        LineaInstantanea.objects.bulk_create(
+            (
+                LineaInstantanea(instantanea=instantanea, producto_id=producto_id, cantidad=cantidad)
+                for producto_id, cantidad in stock.items() if cantidad > 0
+            ),
+            batch_size=LOTE,
+        )
+
+
+def _mover_al_archivo(ultimo):
+    """
+    Copia y elimina los movimientos con id <= ultimo y sus detalles con
+    INSERT ... SELECT y DELETE en la base de datos, sin pasar por el ORM:
+    MovimientoDetalle.delete() revertiría el stock. Retorna la cantidad de
+    movimientos y de detalles archivados.
+    """
+    with connection.cursor() as cursor:
+        movimientos = _copiar(
+            cursor, Movimiento, MovimientoArchivado,
+            ['id', 'bodega_origen_id', 'bodega_destino_id', 'usuario_id', 'fecha', 'codigo'],
+            'id', ultimo)
+        detalles = _copiar(
+            cursor, MovimientoDetalle, DetalleArchivado,
+            ['id', 'movimiento_id', 'producto_id', 'cantidad'],
+            'movimiento_id', ultimo)
+        for modelo, columna in ((MovimientoDetalle, 'movimiento_id'), (Movimiento, 'id')):
+            cursor.execute(
+                f"DELETE FROM {_tabla(modelo)} "
+                f"WHERE {connection.ops.quote_name(columna)} <= %s", [ultimo])
+    return movimientos, detalles
+
+
+def _copiar(cursor, origen, destino, columnas, columna_corte, ultimo):
+    columnas = ', '.join(connection.ops.quote_name(columna) for columna in columnas)
+    cursor.execute(
+        f"INSERT INTO {_tabla(destino)} ({columnas}) "
+        f"SELECT {columnas} FROM {_tabla(origen)} "
+        f"WHERE {connection.ops.quote_name(columna_corte)} <= %s", [ultimo])
+    return cursor.rowcount
+
+
+def _tabla(modelo):
+    return connection.ops.quote_name(modelo._meta.db_table)
+
+
+def detalles_con_archivo(desde=None, hasta=None):
+    """
+    Querysets de detalles de movimientos entre dos fechas (hasta exclusivo):
+    el de DetalleArchivado primero, solo si el rango lo alcanza, y el de
+    MovimientoDetalle. Como los ids archivados son todos menores que los
+    actuales, recorrerlos en ese orden conserva el orden por id.
+    """
+    consultas = [MovimientoDetalle.objects.all()]
+    if necesita_archivo(desde):
+        consultas.insert(0, DetalleArchivado.objects.all())
+    filtro = Q()
+    if desde:
+        filtro &= Q(movimiento__fecha__gte=desde)
+    if hasta:
+        filtro &= Q(movimiento__fecha__lt=hasta)
+    return [consulta.filter(filtro) for consulta in consultas]
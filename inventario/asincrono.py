@@ -0,0 +1,65 @@
+"""
+Base de las vistas asíncronas (ASGI) de lectura: informes, búsqueda y
+consulta de stock.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.db import close_old_connections, connection
+from django.views import View
+
+from .consultas import PresupuestoConsultasMixin
+
+
+class VistaAsincrona(PresupuestoConsultasMixin, View):
+    """
+    Vista con handlers async. LoginRequiredMixin y UserPassesTestMixin leen
+    request.user de forma síncrona, así que el acceso se controla aquí con
+    await request.auser(); las subclases definen test_func() como en las
+    vistas síncronas. max_consultas se verifica después del control de
+    acceso, como en las vistas síncronas.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        usuario = await request.auser()
+        if not usuario.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        # Ya cargado: test_func() y las plantillas no vuelven a consultarlo
+        request.user = usuario
+        if not self.test_func():
+            raise PermissionDenied
+        return await super().dispatch(request, *args, **kwargs)
+
+    def test_func(self):
+        return True
+
+
+async def en_paralelo(*funciones):
+    """
+    Ejecuta funciones síncronas de consulta a la vez y retorna sus resultados
+    en el mismo orden.
+
+    El ORM async de Django pasa todas las consultas por un mismo hilo, una
+    detrás de otra; para que se superpongan, cada función corre en un hilo
+    del pool con su propia conexión. Dentro de una transacción (por ejemplo
+    en las pruebas) se ejecutan en orden en el hilo de la transacción, porque
+    otra conexión no vería sus cambios.
+    """
+    if await sync_to_async(lambda: connection.in_atomic_block)():
+        return [await sync_to_async(funcion)() for funcion in funciones]
+    return await asyncio.gather(*(
+        sync_to_async(_con_conexion_propia(funcion), thread_sensitive=False)()
+        for funcion in funciones
+    ))
+
+
+def _con_conexion_propia(funcion):
+    def ejecutar():
+        try:
+            return funcion()
+        finally:
+            # Cierra la conexión del hilo salvo que CONN_MAX_AGE la mantenga
+            close_old_connections()
+    return ejecutar
@@ -0,0 +1,200 @@
+"""
+Búsqueda de texto completo de productos sobre título, descripción, autores y
+editorial.
+
+El índice vive en una tabla aparte que depende del motor:
+
+- SQLite: tabla virtual FTS5 cuyo rowid es el id del producto.
+- PostgreSQL: tabla con una columna tsvector e índice GIN.
+
+Con otros motores se recurre a una búsqueda con icontains, sin ranking.
+La migración 0010 crea la tabla y la carga; las señales de signals.py
+mantienen el índice sincronizado al confirmar cada transacción.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Producto
+
+TABLA_FTS = 'inventario_producto_fts'
+TABLA_TSVECTOR = 'inventario_producto_busqueda'
+CONFIGURACION_PG = 'spanish'
+
+# Peso de cada columna en el ranking: título, descripción, autores, editorial
+PESOS_FTS = (10.0, 1.0, 5.0, 3.0)
+
+# Productos indexados por sentencia al reindexar en bloque
+LOTE = 500
+
+
+def motor(conexion=connection):
+    return conexion.vendor if conexion.vendor in ('sqlite', 'postgresql') else None
+
+
+def _documentos(ids):
+    """
+    Retorna (id, titulo, descripcion, autores, editorial) de los productos.
+    """
+    productos = Producto.objects.filter(pk__in=ids).select_related(
+        'editorial').prefetch_related('autores')
+    for producto in productos:
+        yield (
+            producto.pk,
+            producto.titulo,
+            producto.descripcion,
+            ' '.join(autor.nombre for autor in producto.autores.all()),
+            producto.editorial.nombre,
+        )
+
+
+def indexar_productos(ids):
+    """
+    (Re)indexa los productos indicados.
+    """
+    if motor() is None:
+        return
+    ids = list(ids)
+    for inicio in range(0, len(ids), LOTE):
+        indexar_documentos(_documentos(ids[inicio:inicio + LOTE]))
+
+
+def indexar_al_confirmar(ids):
+    """
+    Reindexa los productos al confirmar la transacción en curso (o de
+    inmediato si no hay una). Los ids se juntan por conexión: un producto que
+    se guarda y luego cambia de autores en la misma transacción se indexa una
+    sola vez, con sus datos finales.
+    """
+    pendientes = getattr(connection, '_productos_por_indexar', None)
+    if pendientes is None:
+        pendientes = connection._productos_por_indexar = set()
+    pendientes.update(ids)
+    # Cada llamada registra su callback por si la anterior se descarta con un
+    # rollback; el primero que corre indexa todo y los demás no encuentran nada
+    transaction.on_commit(_indexar_pendientes)
+
+
+def _indexar_pendientes():
+    pendientes = getattr(connection, '_productos_por_indexar', None)
+    connection._productos_por_indexar = None
+    if pendientes:
+        indexar_productos(pendientes)
+
+
+def indexar_documentos(filas):
+    """
+    (Re)indexa filas (id, titulo, descripcion, autores, editorial) ya armadas,
+    para quien ya tiene los datos en memoria (p. ej. la importación del catálogo).
+    """
+    vendor = motor()
+    if vendor is None:
+        return
+    filas = list(filas)
+    for inicio in range(0, len(filas), LOTE):
+        lote = filas[inicio:inicio + LOTE]
+        with connection.cursor() as cursor:
+            if vendor == 'sqlite':
+                _borrar(cursor, [fila[0] for fila in lote])
+                cursor.executemany(
+                    f"INSERT INTO {TABLA_FTS} "
+                    "(rowid, titulo, descripcion, autores, editorial) "
+                    "VALUES (%s, %s, %s, %s, %s)",
+                    lote,
+                )
+            else:
+                cursor.executemany(
+                    f"INSERT INTO {TABLA_TSVECTOR} (producto_id, documento) "
+                    "SELECT %s, "
+                    "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+                    "setweight(to_tsvector(%s::regconfig, %s), 'D') || "
+                    "setweight(to_tsvector(%s::regconfig, %s), 'B') || "
+                    "setweight(to_tsvector(%s::regconfig, %s), 'C') "
+                    "ON CONFLICT (producto_id) DO UPDATE SET documento = EXCLUDED.documento",
+                    [
+                        (pk,
+                         CONFIGURACION_PG, titulo, CONFIGURACION_PG, descripcion,
+                         CONFIGURACION_PG, autores, CONFIGURACION_PG, editorial)
+                        for pk, titulo, descripcion, autores, editorial in lote
+                    ],
+                )
+
+
+def eliminar_productos(ids):
+    """
+    Quita los productos del índice. En PostgreSQL lo hace la clave foránea.
+    """
+    if motor() != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        _borrar(cursor, list(ids))
+
+
+def _borrar(cursor, ids):
+    if ids:
+        marcadores = ', '.join(['%s'] * len(ids))
+        cursor.execute(
+            f"DELETE FROM {TABLA_FTS} WHERE rowid IN ({marcadores})", ids)
+
+
+def _terminos(texto):
+    return re.findall(r'\w+', texto.lower())
+
+
+def buscar(texto, limite=25, desplazamiento=0):
+    """
+    Retorna los productos que coinciden con todos los términos (el último
+    también como prefijo), ordenados por relevancia. Cada producto trae el
+    atributo `rango`.
+    """
+    terminos = _terminos(texto)
+    if not terminos:
+        return []
+
+    vendor = motor()
+    if vendor is None:
+        filtro = Q()
+        for termino in terminos:
+            filtro &= (
+                Q(titulo__icontains=termino) | Q(descripcion__icontains=termino)
+                | Q(autores__nombre__icontains=termino)
+                | Q(editorial__nombre__icontains=termino)
+            )
+        productos = list(
+            Producto.objects.filter(filtro).distinct().select_related(
+                'editorial').prefetch_related('autores')[desplazamiento:desplazamiento + limite]
+        )
+        for producto in productos:
+            producto.rango = None
+        return productos
+
+    with connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            consulta = ' '.join(f'"{termino}"' for termino in terminos) + '*'
+            pesos = ', '.join(str(peso) for peso in PESOS_FTS)
+            # bm25 es menor cuanto más relevante; se invierte el signo
+            cursor.execute(
+                f"SELECT rowid, -bm25({TABLA_FTS}, {pesos}) AS rango FROM {TABLA_FTS} "
+                f"WHERE {TABLA_FTS} MATCH %s ORDER BY rango DESC, rowid LIMIT %s OFFSET %s",
+                [consulta, limite, desplazamiento],
+            )
+        else:
+            consulta = ' & '.join(terminos) + ':*'
+            cursor.execute(
+                f"SELECT producto_id, ts_rank(documento, consulta) AS rango "
+                f"FROM {TABLA_TSVECTOR}, to_tsquery(%s::regconfig, %s) consulta "
+                "WHERE documento @@ consulta ORDER BY rango DESC, producto_id "
+                "LIMIT %s OFFSET %s",
+                [CONFIGURACION_PG, consulta, limite, desplazamiento],
+            )
+        rangos = dict(cursor.fetchall())
+
+    productos = Producto.objects.select_related('editorial').prefetch_related(
+        'autores').in_bulk(list(rangos))
+    resultado = []
+    for pk, rango in rangos.items():
+        if pk in productos:
+            productos[pk].rango = rango
+            resultado.append(productos[pk])
+    return resultado
@@ -0,0 +1,152 @@
+"""
+Caché de resultados con invalidación por eventos.
+
+Cada modelo tiene un contador de generación en la caché que las señales de
+signals.py incrementan cuando se guarda o elimina una instancia (al confirmar
+la transacción). La clave de un resultado incluye la generación de los modelos
+de los que depende, así que un cambio en cualquiera de ellos hace que la
+siguiente lectura use una clave nueva y las entradas viejas expiran solas.
+
+La caché usada es settings.INVENTARIO_CACHE (un alias de CACHES). Con varios
+procesos debe ser compartida (Redis, archivo, base de datos): con locmem cada
+proceso solo ve sus propias invalidaciones.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+# Duración de un resultado; la invalidación no depende de ella, es solo un
+# límite para los cambios hechos sin señales (p. ej. QuerySet.update)
+DURACION = 60 * 60
+
+# Duración del candado de cálculo: si quien calcula muere, otro puede hacerlo
+DURACION_CANDADO = 30
+
+# Espera máxima por el resultado que calcula otro proceso antes de calcularlo
+ESPERA_MAXIMA = 10
+INTERVALO_ESPERA = 0.05
+
+
+def obtener_cache():
+    return caches[getattr(settings, 'INVENTARIO_CACHE', 'default')]
+
+
+def _clave_generacion(modelo):
+    return f'inventario:generacion:{modelo._meta.label_lower}'
+
+
+def generaciones(modelos):
+    """
+    Retorna las generaciones actuales de los modelos, en el mismo orden.
+    """
+    cache = obtener_cache()
+    claves = [_clave_generacion(modelo) for modelo in modelos]
+    actuales = cache.get_many(claves)
+    for clave in claves:
+        if clave not in actuales:
+            # Si el contador se perdió, se reinicia en un valor que no puede
+            # coincidir con el de entradas viejas
+            cache.add(clave, time.time_ns(), timeout=None)
+            actuales[clave] = cache.get(clave)
+    return [actuales[clave] for clave in claves]
+
+
+def invalidar(modelo):
+    """
+    Incrementa la generación del modelo cuando se confirme la transacción en
+    curso (o de inmediato si no hay una): antes, otra conexión aún vería los
+    datos viejos y los volvería a guardar con la generación nueva.
+    """
+    transaction.on_commit(lambda: _incrementar(modelo))
+
+
+def _incrementar(modelo):
+    cache = obtener_cache()
+    clave = _clave_generacion(modelo)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.add(clave, time.time_ns(), timeout=None)
+
+
+def version(modelos):
+    """
+    Versión de los datos de los modelos: cambia cuando cambia cualquiera.
+    """
+    return '.'.join(str(generacion) for generacion in generaciones(modelos))
+
+
+def clave(nombre, modelos, parametros=None):
+    """
+    Clave de un resultado: nombre, generación de cada modelo y un hash de los
+    parámetros.
+    """
+    datos = json.dumps(parametros or {}, sort_keys=True, cls=DjangoJSONEncoder)
+    resumen = hashlib.md5(datos.encode()).hexdigest()
+    return f'inventario:{nombre}:{version(modelos)}:{resumen}'
+
+
+def en_cache(nombre, modelos, calcular, parametros=None, duracion=DURACION):
+    """
+    Retorna el resultado de calcular() guardado en la caché para `nombre` y
+    `parametros`, válido mientras no cambie ninguno de `modelos`.
+
+    Protección contra estampidas: si el resultado no está, solo el proceso que
+    obtiene el candado (cache.add) lo calcula; los demás esperan a que aparezca.
+    """
+    cache = obtener_cache()
+    clave_resultado = clave(nombre, modelos, parametros)
+    # El resultado se guarda en una tupla para distinguir un None calculado
+    # de una clave ausente
+    guardado = cache.get(clave_resultado)
+    if guardado is not None:
+        return guardado[0]
+
+    clave_candado = f'{clave_resultado}:calculando'
+    if not cache.add(clave_candado, 1, timeout=DURACION_CANDADO):
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while time.monotonic() < limite:
+            time.sleep(INTERVALO_ESPERA)
+            guardado = cache.get(clave_resultado)
+            if guardado is not None:
+                return guardado[0]
+            if cache.get(clave_candado) is None:
+                # Quien calculaba falló o terminó sin guardar: se calcula aquí
+                break
+        return calcular()
+
+    try:
+        resultado = calcular()
+        cache.set(clave_resultado, (resultado,), timeout=duracion)
+    finally:
+        cache.delete(clave_candado)
+    return resultado
+
+
+class FragmentoEnCacheMixin:
+    """
+    Mixin para vistas cuya plantilla guarda parte del HTML en la caché con
+
+        {% cache duracion_fragmento 'nombre' version_fragmento ... %}
+
+    modelos_fragmento son los modelos de los que depende el fragmento: al
+    cambiar cualquiera cambia version_fragmento y el fragmento se vuelve a
+    renderizar. El resto de argumentos del tag separa las variantes (rol del
+    usuario, parámetros de la página). Con PaginacionCursorMixin la página solo
+    se consulta si el fragmento no está en la caché.
+
+    Los fragmentos se guardan en la caché 'template_fragments' si existe, o en
+    'default'; las generaciones siempre en settings.INVENTARIO_CACHE.
+    """
+    modelos_fragmento = []
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['version_fragmento'] = version(self.modelos_fragmento)
+        context['duracion_fragmento'] = DURACION
+        return context
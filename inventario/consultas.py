@@ -0,0 +1,414 @@
+"""
+Optimización de consultas para las vistas: cada vista declara las relaciones
+que usa su plantilla y se aplican los JOIN o prefetch que correspondan.
+
+También el diagnóstico de consultas en desarrollo y staging: el presupuesto de
+consultas de cada vista (max_consultas) y el registro de cada sentencia con su
+origen para encontrar las consultas repetidas (N+1) y las lentas.
+"""
+import contextlib
+import contextvars
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.models import Prefetch, Q
+
+from . import metricas
+
+logger = logging.getLogger(__name__)
+
+# Veces que una misma forma de consulta puede ejecutarse en una petición
+# antes de considerarse repetida
+REPETICIONES_PERMITIDAS = 1
+
+_registros_activos = contextvars.ContextVar('registros_activos', default=())
+
+
+class LimiteConsultasExcedido(Exception):
+    pass
+
+
+def optimizar(queryset, relaciones):
+    """
+    Aplica select_related o prefetch_related a cada relación según su tipo.
+
+    Una ruta formada solo por claves foráneas se resuelve con JOIN. Si la ruta
+    pasa por una relación múltiple (inversa o ManyToMany), esa parte se
+    precarga y lo que sigue después, si son claves foráneas, se une con JOIN
+    dentro de la consulta de precarga.
+    """
+    for relacion in relaciones:
+        if isinstance(relacion, Prefetch):
+            queryset = queryset.prefetch_related(relacion)
+            continue
+
+        modelo = queryset.model
+        partes = relacion.split('__')
+        for i, parte in enumerate(partes):
+            campo = modelo._meta.get_field(parte)
+            if campo.many_to_many or campo.one_to_many:
+                resto = '__'.join(partes[i + 1:])
+                ruta = '__'.join(partes[:i + 1])
+                if not resto:
+                    queryset = queryset.prefetch_related(ruta)
+                elif _solo_claves_foraneas(campo.related_model, resto):
+                    queryset = queryset.prefetch_related(Prefetch(
+                        ruta, queryset=campo.related_model._default_manager.select_related(resto)))
+                else:
+                    queryset = queryset.prefetch_related(relacion)
+                break
+            modelo = campo.related_model
+        else:
+            queryset = queryset.select_related(relacion)
+    return queryset
+
+
+def filtro_prefijo(campo, prefijo):
+    """
+    Filtro "empieza con" que puede usar un índice B-tree. En SQLite LIKE no
+    distingue mayúsculas y no usa el índice, así que se expresa como rango;
+    en PostgreSQL Django crea un índice varchar_pattern_ops para LIKE.
+    """
+    if connection.vendor == 'sqlite':
+        if ord(prefijo[-1]) == sys.maxunicode:
+            # No hay carácter siguiente: el índice acota solo por abajo
+            return Q(**{f'{campo}__gte': prefijo, f'{campo}__startswith': prefijo})
+        siguiente = prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+        return Q(**{f'{campo}__gte': prefijo, f'{campo}__lt': siguiente})
+    return Q(**{f'{campo}__startswith': prefijo})
+
+
+def _solo_claves_foraneas(modelo, ruta):
+    for parte in ruta.split('__'):
+        campo = modelo._meta.get_field(parte)
+        if not (campo.many_to_one or campo.one_to_one):
+            return False
+        modelo = campo.related_model
+    return True
+
+
+class ContadorConsultas:
+    """
+    execute_wrapper que cuenta las sentencias ejecutadas.
+    """
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+Consulta = namedtuple('Consulta', ['sql', 'parametros', 'duracion', 'origen'])
+
+
+class RegistroConsultas:
+    """
+    Sentencias ejecutadas mientras el registro está activo (ver
+    registrar_consultas), con su duración y el código o la línea de plantilla
+    que las originó. Las consultas pueden llegar desde varios hilos a la vez
+    (en_paralelo), por eso el candado.
+    """
+
+    def __init__(self):
+        self.consultas = []
+        self._candado = threading.Lock()
+
+    def __len__(self):
+        return len(self.consultas)
+
+    def anotar(self, consulta):
+        with self._candado:
+            self.consultas.append(consulta)
+
+    def grupos(self):
+        """
+        Consultas agrupadas por forma (el SQL sin valores), de la forma más
+        repetida a la menos: [(forma, [Consulta, ...]), ...].
+        """
+        grupos = {}
+        for consulta in self.consultas:
+            grupos.setdefault(forma_sql(consulta.sql), []).append(consulta)
+        return sorted(
+            grupos.items(),
+            key=lambda grupo: (-len(grupo[1]), -sum(c.duracion for c in grupo[1])))
+
+    def repetidas(self):
+        return [(forma, consultas) for forma, consultas in self.grupos()
+                if len(consultas) > REPETICIONES_PERMITIDAS]
+
+    def lentas(self, umbral):
+        return [consulta for consulta in self.consultas if consulta.duracion >= umbral]
+
+    def informe(self, grupos=None):
+        """
+        Texto con el total y, por forma de consulta, cuántas veces se ejecutó
+        (y cuántas con parámetros distintos, si alguna se repitió idéntica),
+        su tiempo y sus orígenes.
+        """
+        if grupos is None:
+            grupos = self.grupos()
+        total = sum(consulta.duracion for consulta in self.consultas)
+        lineas = [f"{len(self.consultas)} consultas, {total * 1000:.1f} ms"]
+        for forma, consultas in grupos:
+            distintas = len({(c.sql, c.parametros) for c in consultas})
+            lineas.append(
+                f"  {len(consultas)}x"
+                + (f" ({distintas} distintas)" if distintas < len(consultas) else "")
+                + f" {sum(c.duracion for c in consultas) * 1000:.1f} ms  {_recortar(forma)}")
+            origenes = list(dict.fromkeys(consulta.origen for consulta in consultas))
+            for origen in origenes[:3]:
+                lineas.append(f"      desde {origen}")
+            if len(origenes) > 3:
+                lineas.append(f"      y {len(origenes) - 3} orígenes más")
+        return '\n'.join(lineas)
+
+
+@contextlib.contextmanager
+def registrar_consultas(registro=None):
+    """
+    Anota en el registro las consultas ejecutadas dentro del bloque, también
+    las de otros hilos lanzados desde él (sync_to_async copia el contexto).
+    Los registros pueden anidarse: cada consulta se anota en todos.
+    """
+    registro = RegistroConsultas() if registro is None else registro
+    token = _registros_activos.set(_registros_activos.get() + (registro,))
+    try:
+        yield registro
+    finally:
+        _registros_activos.reset(token)
+
+
+def anotar_consulta(execute, sql, params, many, context):
+    """
+    execute_wrapper que anota la consulta en los registros activos; signals.py
+    lo instala en cada conexión al abrirse.
+    """
+    registros = _registros_activos.get()
+    if not registros:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        consulta = Consulta(sql, repr(params), time.perf_counter() - inicio, _origen())
+        for registro in registros:
+            registro.anotar(consulta)
+
+
+_VALORES_SQL = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\((?:%s|\?)(?:, (?:%s|\?))*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def forma_sql(sql):
+    """
+    El SQL sin valores: los literales pasan a ?, las listas de IN a (...).
+    Dos consultas con la misma forma solo difieren en sus parámetros.
+    """
+    for patron, reemplazo in _VALORES_SQL:
+        sql = patron.sub(reemplazo, sql)
+    return sql.strip()
+
+
+def _recortar(sql, largo=300):
+    return sql if len(sql) <= largo else sql[:largo] + '...'
+
+
+_ARGUMENTOS_WRAPPER = ('execute', 'sql', 'params', 'many', 'context')
+# Módulos de instrumentación: sus middlewares y mixins no son el origen
+_ARCHIVOS_INSTRUMENTACION = {__file__, metricas.__file__}
+
+
+def _origen():
+    """
+    De dónde viene la consulta en ejecución: la línea de plantilla que la
+    dispara, si se está renderizando una, y la última línea de código del
+    proyecto en la pila, sin contar las dependencias, la instrumentación ni
+    los execute_wrapper.
+    Las consultas del ORM async corren en otro hilo, sin la corrutina en la
+    pila: para ellas solo se conoce la plantilla, si la hay.
+    """
+    raiz = str(settings.BASE_DIR) + os.sep
+    plantilla = codigo = None
+    frame = sys._getframe(2)
+    while frame is not None and codigo is None:
+        if plantilla is None and frame.f_code.co_name == 'render_annotated':
+            nodo = frame.f_locals.get('self')
+            origen, token = getattr(nodo, 'origin', None), getattr(nodo, 'token', None)
+            if origen is not None and token is not None:
+                plantilla = f"{origen.template_name}:{token.lineno}"
+        archivo = frame.f_code.co_filename
+        if (archivo.startswith(raiz) and archivo not in _ARCHIVOS_INSTRUMENTACION
+                and f'{os.sep}site-packages{os.sep}' not in archivo
+                and frame.f_code.co_varnames[:5] != _ARGUMENTOS_WRAPPER):
+            codigo = f"{os.path.relpath(archivo, raiz)}:{frame.f_lineno} en {frame.f_code.co_name}"
+        frame = frame.f_back
+    return ', '.join(parte for parte in (plantilla, codigo) if parte) or 'desconocido'
+
+
+class PresupuestoConsultasMixin:
+    """
+    max_consultas: consultas permitidas a la vista, incluido el render de la
+    plantilla y sin contar la sesión ni el usuario. Se verifica con
+    settings.INVENTARIO_VERIFICAR_CONSULTAS activo: si se supera se registra
+    en el log el informe de las consultas agrupadas por forma. Con el valor
+    'registrar' (por defecto con DEBUG) solo se deja el informe; con True se
+    lanza además LimiteConsultasExcedido.
+
+    Debe ir después de los mixins de autenticación para no contar sus
+    consultas. Funciona también con handlers async.
+    """
+    max_consultas = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.max_consultas is None or not getattr(settings, 'INVENTARIO_VERIFICAR_CONSULTAS', False):
+            return super().dispatch(request, *args, **kwargs)
+        if self.view_is_async:
+            return self._dispatch_con_presupuesto(request, *args, **kwargs)
+
+        with registrar_consultas() as registro:
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        self.verificar_presupuesto(registro)
+        return response
+
+    async def _dispatch_con_presupuesto(self, request, *args, **kwargs):
+        with registrar_consultas() as registro:
+            response = await super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                await sync_to_async(response.render)()
+        self.verificar_presupuesto(registro)
+        return response
+
+    def verificar_presupuesto(self, registro):
+        if len(registro) <= self.max_consultas:
+            return
+        mensaje = (f"{type(self).__name__} ejecutó {len(registro)} consultas "
+                   f"(máximo {self.max_consultas}).")
+        logger.warning("%s\n%s", mensaje, registro.informe())
+        if settings.INVENTARIO_VERIFICAR_CONSULTAS is True:
+            raise LimiteConsultasExcedido(mensaje)
+
+
+class ConsultaOptimizadaMixin(PresupuestoConsultasMixin):
+    """
+    Mixin para vistas de listado.
+
+    - relaciones: rutas (o Prefetch) que usa la plantilla; ver optimizar().
+    - max_consultas: ver PresupuestoConsultasMixin.
+    """
+    relaciones = []
+
+    def get_queryset(self):
+        return optimizar(super().get_queryset(), self.relaciones)
+
+
+class RegistroConsultasMiddleware:
+    """
+    Con settings.INVENTARIO_REGISTRO_CONSULTAS activo (por defecto igual a
+    DEBUG, salvo en las pruebas) anota cada consulta de la petición con su origen y al terminar deja
+    en el log las que se repiten con la misma forma (posibles N+1) y las que
+    tardan más de settings.INVENTARIO_CONSULTA_LENTA_MS. En las respuestas en
+    streaming solo cubre lo ejecutado antes de empezar el envío.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INVENTARIO_REGISTRO_CONSULTAS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with registrar_consultas() as registro:
+            response = self.get_response(request)
+        informar_consultas(request, registro)
+        return response
+
+    async def __acall__(self, request):
+        with registrar_consultas() as registro:
+            response = await self.get_response(request)
+        informar_consultas(request, registro)
+        return response
+
+
+def informar_consultas(request, registro):
+    coincidencia = getattr(request, 'resolver_match', None)
+    vista = coincidencia.view_name if coincidencia else request.path
+    umbral = getattr(settings, 'INVENTARIO_CONSULTA_LENTA_MS', 100) / 1000
+    for consulta in registro.lentas(umbral):
+        logger.warning(
+            "Consulta lenta en %s (%.1f ms) desde %s: %s",
+            vista, consulta.duracion * 1000, consulta.origen, _recortar(consulta.sql))
+    repetidas = registro.repetidas()
+    if repetidas:
+        logger.warning(
+            "Consultas repetidas en %s (posible N+1):\n%s", vista, registro.informe(repetidas))
+
+
+def plan(sql, params=None, conexion=connection):
+    """
+    Retorna el plan de ejecución de una consulta como lista de líneas.
+
+    En PostgreSQL se desactiva el recorrido secuencial mientras se explica: con
+    tablas pequeñas el planificador lo prefiere aunque exista un índice útil,
+    y así solo aparece cuando ningún índice sirve.
+    """
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [fila[-1] for fila in cursor.fetchall()]
+        if conexion.vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute(f'EXPLAIN {sql}', params)
+                return [fila[0] for fila in cursor.fetchall()]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return [' '.join(str(valor) for valor in fila) for fila in cursor.fetchall()]
+
+
+# Línea de plan que recorre una tabla completa: el grupo 1 es la tabla y el 2
+# el índice, si el recorrido sigue el orden de uno
+_RECORRIDO_COMPLETO = {
+    'sqlite': re.compile(r'^SCAN (\w+)(?: AS \w+)?( USING (?:COVERING )?INDEX \w+)?$'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)()'),
+}
+
+
+def tablas_recorridas(sql, params=None, conexion=connection):
+    """
+    Tablas que el plan de la consulta recorre completas. Recorrer un índice
+    en orden no cuenta si la consulta tiene LIMIT, porque se detiene al
+    completar la página.
+    """
+    patron = _RECORRIDO_COMPLETO.get(conexion.vendor)
+    if patron is None:
+        return set()
+    con_limite = re.search(r'\bLIMIT\b', sql) is not None
+    tablas = set()
+    for linea in plan(sql, params, conexion):
+        coincidencia = patron.search(linea.strip())
+        if coincidencia and not (coincidencia.group(2) and con_limite):
+            tablas.add(coincidencia.group(1))
+    return tablas
@@ -0,0 +1,112 @@
+"""
+Eventos de stock en vivo (Server-Sent Events).
+
+Cada cambio de stock publica, al confirmarse su transacción, un evento con los
+deltas por producto de una bodega. El hub reparte los eventos entre las
+conexiones SSE abiertas en este proceso; con varios procesos cada uno solo ve
+los cambios que él mismo confirma, así que para eso haría falta un broker
+compartido (por ejemplo Redis pub/sub) detrás de `publicar`.
+"""
+import asyncio
+import json
+import threading
+
+from django.db import transaction
+
+# Eventos en espera por conexión; si un cliente lento los acumula se descarta
+# lo pendiente y se le envía de nuevo el estado completo
+MAX_PENDIENTES = 100
+
+
+class Suscripcion:
+    """
+    Cola de eventos de una conexión, atada al event loop que la atiende.
+    """
+
+    def __init__(self, bodegas):
+        self.bodegas = frozenset(bodegas)
+        self.loop = asyncio.get_running_loop()
+        self.cola = asyncio.Queue(maxsize=MAX_PENDIENTES)
+        self.desbordada = False
+
+    def entregar(self, evento):
+        # Se ejecuta en el loop de la suscripción
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.desbordada = True
+
+    async def siguiente(self):
+        """
+        Retorna el próximo evento, o None si se perdieron eventos y el
+        cliente debe recibir el estado completo.
+        """
+        if self.desbordada:
+            self.desbordada = False
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            return None
+        return await self.cola.get()
+
+
+class Hub:
+    """
+    Pub/sub en memoria: publicar() puede llamarse desde cualquier hilo y
+    entrega el evento en el loop de cada suscripción interesada.
+    """
+
+    def __init__(self):
+        self._suscripciones = {}
+        self._candado = threading.Lock()
+
+    def suscribir(self, bodegas):
+        suscripcion = Suscripcion(bodegas)
+        with self._candado:
+            for bodega in suscripcion.bodegas:
+                self._suscripciones.setdefault(bodega, set()).add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._candado:
+            for bodega in suscripcion.bodegas:
+                suscritas = self._suscripciones.get(bodega)
+                if suscritas is not None:
+                    suscritas.discard(suscripcion)
+                    if not suscritas:
+                        del self._suscripciones[bodega]
+
+    def publicar(self, bodega, evento):
+        with self._candado:
+            suscritas = list(self._suscripciones.get(bodega, ()))
+        for suscripcion in suscritas:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion.entregar, evento)
+            except RuntimeError:
+                # El loop ya terminó: la conexión se cerró sin cancelar
+                self.cancelar(suscripcion)
+
+
+hub = Hub()
+
+
+def publicar_stock(bodega, deltas):
+    """
+    Publica {producto_id: delta} de una bodega cuando se confirme la
+    transacción en curso; si se revierte no se publica nada.
+    """
+    deltas = {producto: delta for producto, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    evento = {
+        'bodega': bodega.pk,
+        'productos': deltas,
+        'unidades': sum(deltas.values()),
+    }
+    transaction.on_commit(lambda: hub.publicar(bodega.pk, evento))
+
+
+def formatear(tipo, datos):
+    """
+    Mensaje SSE con un evento nombrado y datos JSON.
+    """
+    return f"event: {tipo}\ndata: {json.dumps(datos)}\n\n"
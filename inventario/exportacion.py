@@ -0,0 +1,190 @@
+"""
+Exportación de informes en CSV, JSON Lines y XLSX como respuestas en streaming.
+
+Las filas se consumen de un iterador (por ejemplo queryset.iterator()) y se
+envían a medida que se generan, así que la memoria usada no depende de la
+cantidad de filas y el primer byte sale de inmediato.
+"""
+import csv
+import datetime
+import json
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Filas leídas por viaje a la base de datos
+TAMANO_LOTE = 2000
+
+# Bytes acumulados antes de enviar un bloque del XLSX
+TAMANO_BLOQUE_XLSX = 64 * 1024
+
+# Límite de filas de una hoja de Excel (incluido el encabezado)
+MAX_FILAS_HOJA = 1048576
+
+
+class _Eco:
+    """
+    Pseudo archivo que retorna lo escrito, para usar csv.writer en streaming.
+    """
+
+    def write(self, valor):
+        return valor
+
+
+def _csv(encabezados, filas):
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel reconozca UTF-8
+    yield '﻿' + escritor.writerow(encabezados)
+    for fila in filas:
+        yield escritor.writerow(fila)
+
+
+def _jsonl(encabezados, filas):
+    for fila in filas:
+        yield json.dumps(
+            dict(zip(encabezados, fila)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+# -----------------------------------
+# XLSX en streaming
+# -----------------------------------
+
+class _BufferZip:
+    """
+    Destino de escritura no posicionable para zipfile: acumula lo escrito
+    hasta que se vacía. Al no tener tell() ni seek(), zipfile escribe cada
+    archivo con descriptor de datos en vez de volver atrás a corregir la
+    cabecera.
+    """
+
+    def __init__(self):
+        self.partes = []
+        self.tamano = 0
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.tamano += len(datos)
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        self.tamano = 0
+        return datos
+
+
+_CARACTERES_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _celda(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float)):
+        return f'<c><v>{valor}</v></c>'
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        valor = valor.isoformat(sep=' ', timespec='seconds') \
+            if isinstance(valor, datetime.datetime) else valor.isoformat()
+    texto = escape(_CARACTERES_INVALIDOS_XML.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xml(valores):
+    return ('<row>' + ''.join(_celda(valor) for valor in valores) + '</row>').encode()
+
+
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_NS_HOJA = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_NS_PAQUETE = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+
+def _xlsx(encabezados, filas, nombre_hoja='Datos'):
+    """
+    Escribe un libro XLSX mínimo (cadenas en línea, sin estilos). Si las filas
+    superan el límite de Excel se reparten en varias hojas.
+    """
+    buffer = _BufferZip()
+    hojas = 0
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as libro:
+        filas = iter(filas)
+        pendiente = next(filas, None)
+        while hojas == 0 or pendiente is not None:
+            hojas += 1
+            with libro.open(f'xl/worksheets/sheet{hojas}.xml', 'w', force_zip64=True) as hoja:
+                hoja.write(f'{_XML}<worksheet xmlns="{_NS_HOJA}"><sheetData>'.encode())
+                hoja.write(_fila_xml(encabezados))
+                escritas = 1
+                while pendiente is not None and escritas < MAX_FILAS_HOJA:
+                    hoja.write(_fila_xml(pendiente))
+                    escritas += 1
+                    pendiente = next(filas, None)
+                    if buffer.tamano >= TAMANO_BLOQUE_XLSX:
+                        yield buffer.vaciar()
+                hoja.write(b'</sheetData></worksheet>')
+
+        # Las partes que enumeran las hojas se escriben al final, cuando ya
+        # se sabe cuántas hay
+        libro.writestr('xl/workbook.xml', (
+            f'{_XML}<workbook xmlns="{_NS_HOJA}" xmlns:r="{_NS_REL}"><sheets>'
+            + ''.join(
+                f'<sheet name="{escape(nombre_hoja)}{"" if i == 1 else f" {i}"}" '
+                f'sheetId="{i}" r:id="rId{i}"/>'
+                for i in range(1, hojas + 1))
+            + '</sheets></workbook>'
+        ))
+        libro.writestr('xl/_rels/workbook.xml.rels', (
+            f'{_XML}<Relationships xmlns="{_NS_PAQUETE}">'
+            + ''.join(
+                f'<Relationship Id="rId{i}" Type="{_NS_REL}/worksheet" '
+                f'Target="worksheets/sheet{i}.xml"/>'
+                for i in range(1, hojas + 1))
+            + '</Relationships>'
+        ))
+        libro.writestr('_rels/.rels', (
+            f'{_XML}<Relationships xmlns="{_NS_PAQUETE}">'
+            f'<Relationship Id="rId1" Type="{_NS_REL}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ))
+        libro.writestr('[Content_Types].xml', (
+            f'{_XML}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + ''.join(
+                f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                for i in range(1, hojas + 1))
+            + '</Types>'
+        ))
+    yield buffer.vaciar()
+
+
+# Formato -> (generador, tipo de contenido, extensión)
+FORMATOS = {
+    'csv': (_csv, 'text/csv; charset=utf-8', 'csv'),
+    'jsonl': (_jsonl, 'application/x-ndjson; charset=utf-8', 'jsonl'),
+    'xlsx': (_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def respuesta_exportacion(nombre, encabezados, filas, formato):
+    """
+    Retorna una StreamingHttpResponse con las filas en el formato pedido.
+    Si `filas` es un queryset se recorre con iterator() por lotes.
+    """
+    generador, tipo_contenido, extension = FORMATOS[formato]
+    if hasattr(filas, 'iterator'):
+        filas = filas.iterator(chunk_size=TAMANO_LOTE)
+    response = StreamingHttpResponse(
+        generador(list(encabezados), filas), content_type=tipo_contenido)
+    response['Content-Disposition'] = f'attachment; filename="{nombre}.{extension}"'
+    return response
@@ -0,0 +1,30 @@
+"""
+Lectura de fechas recibidas en parámetros GET (exportaciones y API).
+"""
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def leer_fecha(valor, fin_del_dia=False):
+    """
+    AAAA-MM-DD o fecha y hora ISO 8601. Una fecha sin hora se toma al inicio
+    del día, o al cierre con fin_del_dia. Sin zona horaria se usa la actual.
+    Retorna None si falta o no es válida (también si no existe, como
+    2024-02-30).
+    """
+    if not valor:
+        return None
+    try:
+        dia = parse_date(valor)
+        if dia is not None:
+            fecha = datetime.datetime.combine(
+                dia, datetime.time.max if fin_del_dia else datetime.time.min)
+        else:
+            fecha = parse_datetime(valor)
+    except ValueError:
+        return None
+    if fecha is None:
+        return None
+    return timezone.make_aware(fecha) if timezone.is_naive(fecha) else fecha
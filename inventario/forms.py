@@ -1,6 +1,8 @@
 from django import forms
-from .models import Movimiento, MovimientoDetalle, Producto
-from django.forms import modelformset_factory
+from .models import Bodega, Editorial, Movimiento, MovimientoDetalle, Producto
+from django.forms import BaseModelFormSet, modelformset_factory
+from django.urls import reverse
+from django.utils.functional import cached_property
 
 
 class MovimientoForm(forms.ModelForm):
@@ -12,6 +14,14 @@ class MovimientoForm(forms.ModelForm):
             'bodega_destino': forms.Select(attrs={'class': 'form-control'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Las dos listas muestran las mismas bodegas: se consultan una vez,
+        # al renderizar la primera
+        opciones = _OpcionesCompartidas(self.fields['bodega_origen'].choices)
+        for nombre in ('bodega_origen', 'bodega_destino'):
+            self.fields[nombre].widget.choices = opciones
+
     def clean(self):
         cleaned_data = super().clean()
         bodega_origen = cleaned_data.get('bodega_origen')
@@ -24,50 +34,180 @@ class MovimientoForm(forms.ModelForm):
         return cleaned_data
 
 
+class _OpcionesCompartidas:
+    """
+    Opciones de un ModelChoiceField que se leen de la base de datos la primera
+    vez que se recorren y se reutilizan en las siguientes.
+    """
+
+    def __init__(self, opciones):
+        self.opciones = opciones
+        self.lista = None
+
+    def __iter__(self):
+        if self.lista is None:
+            self.lista = list(self.opciones)
+        return iter(self.lista)
+
+
+class AutocompletarProductoWidget(forms.Widget):
+    """
+    Campo de texto que pide las opciones a productos_autocompletar mientras se
+    escribe, en lugar de incluir todo el catálogo en cada fila del formset.
+    """
+    template_name = 'widgets/autocompletar_producto.html'
+    productos = {}
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        etiqueta = ''
+        if value and str(value).isdigit():
+            producto = self.productos.get(int(value))
+            if producto is None:
+                producto = Producto.objects.filter(pk=value).first()
+            etiqueta = producto.titulo if producto else ''
+        context['widget'].update({
+            'etiqueta': etiqueta,
+            'url': reverse('productos_autocompletar'),
+        })
+        return context
+
+
+class ProductoChoiceField(forms.ModelChoiceField):
+    """
+    Resuelve el producto desde los ya cargados por el formset antes de
+    consultar la base de datos.
+    """
+    productos = {}
+
+    def to_python(self, value):
+        try:
+            return self.productos[int(value)]
+        except (KeyError, TypeError, ValueError):
+            return super().to_python(value)
+
+
 class MovimientoDetalleForm(forms.ModelForm):
     class Meta:
         model = MovimientoDetalle
         fields = ['producto', 'cantidad']
         widgets = {
-            'producto': forms.Select(attrs={'class': 'form-control'}),
+            'producto': AutocompletarProductoWidget(attrs={'class': 'form-control'}),
             'cantidad': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
         }
+        field_classes = {
+            'producto': ProductoChoiceField,
+        }
 
     def __init__(self, *args, **kwargs):
         bodega_origen = kwargs.pop('bodega_origen', None)
+        productos = kwargs.pop('productos', None)
         super().__init__(*args, **kwargs)
         # Si hay bodega de origen, filtra los productos, si no, muestra todos
         if bodega_origen:
             self.fields['producto'].queryset = Producto.objects.filter(
-                bodega=bodega_origen)
+                existencias__bodega=bodega_origen, existencias__cantidad__gt=0)
         else:
             self.fields['producto'].queryset = Producto.objects.all()
+        if productos is not None:
+            self.fields['producto'].productos = productos
+            self.fields['producto'].widget.productos = productos
+
+    def _get_validation_exclusions(self):
+        # El campo del formulario ya validó el producto contra su queryset;
+        # evita un SELECT por fila al validar la clave foránea en el modelo
+        exclusiones = super()._get_validation_exclusions()
+        exclusiones.add('producto')
+        return exclusiones
+
+
+class BaseMovimientoDetalleFormSet(BaseModelFormSet):
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs['productos'] = self.productos_enviados
+        return kwargs
+
+    @cached_property
+    def productos_enviados(self):
+        """
+        Carga en una sola consulta todos los productos enviados en el formset,
+        en lugar de una consulta por fila al validar.
+        """
+        if not self.is_bound:
+            return {}
+        ids = (
+            self.data.get(self.add_prefix(i) + '-producto')
+            for i in range(self.total_form_count())
+        )
+        return Producto.objects.in_bulk([pk for pk in ids if pk and str(pk).isdigit()])
+
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+        # Las filas que quedaron en blanco pasan la validación sin datos
+        if not any(form.cleaned_data for form in self.forms):
+            raise forms.ValidationError("Agrega al menos un producto con su cantidad.")
 
 
 MovimientoDetalleFormSet = modelformset_factory(
     MovimientoDetalle,
     form=MovimientoDetalleForm,
+    formset=BaseMovimientoDetalleFormSet,
     extra=1,
 )
 
 
 class ProductoForm(forms.ModelForm):
+    # El stock inicial no vive en Producto: se registra como un movimiento de
+    # entrada hacia la bodega elegida.
+    bodega = forms.ModelChoiceField(
+        queryset=Bodega.objects.all(),
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    cantidad = forms.IntegerField(
+        min_value=0,
+        initial=0,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'min': 0}),
+    )
+
     class Meta:
         model = Producto
-        fields = ['tipo', 'titulo', 'editorial',
-                  'autores', 'descripcion', 'bodega']
+        fields = ['tipo', 'codigo', 'titulo', 'editorial',
+                  'autores', 'descripcion']
         widgets = {
             'tipo': forms.Select(attrs={'class': 'form-control'}),
+            'codigo': forms.TextInput(attrs={'class': 'form-control'}),
             'titulo': forms.TextInput(attrs={'class': 'form-control'}),
             'editorial': forms.Select(attrs={'class': 'form-control'}),
             'autores': forms.SelectMultiple(attrs={'class': 'form-control'}),
             'descripcion': forms.Textarea(attrs={'class': 'form-control'}),
-            'bodega': forms.Select(attrs={'class': 'form-control'}),
-            'cantidad': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
         }
 
-    def clean_bodega(self):
-        bodega = self.cleaned_data.get('bodega')
-        if not bodega:
-            raise forms.ValidationError("Debes seleccionar una bodega.")
-        return bodega
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('cantidad') and not cleaned_data.get('bodega'):
+            self.add_error('bodega', "Debes seleccionar una bodega.")
+        return cleaned_data
+
+
+class FiltroInformeBodegaForm(forms.Form):
+    """
+    Filtros (GET) del informe de productos de una bodega.
+    """
+    bodega = forms.ModelChoiceField(
+        queryset=Bodega.objects.all(),
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    editorial = forms.ModelChoiceField(
+        queryset=Editorial.objects.order_by('nombre'),
+        required=False,
+        empty_label="Todas las editoriales",
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    tipo = forms.ChoiceField(
+        choices=[('', "Todos los tipos")] + Producto.TIPO_PRODUCTO,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
@@ -0,0 +1,117 @@
+"""
+Consultas de los informes, compartidas por las vistas HTML y las exportaciones.
+
+Las vistas HTML los leen con en_cache(), que guarda el resultado hasta que
+cambie alguno de los modelos de los que depende (ver cache.py).
+"""
+import itertools
+
+from django.db.models import Count, F, Q, Sum
+
+from . import archivo, cache
+from .models import Bodega, Editorial, Existencia, Movimiento, MovimientoDetalle, Producto
+
+# Columna de informes_generales.html para cada tipo de producto
+COLUMNAS_POR_TIPO = {
+    'libro': 'libros',
+    'revista': 'revistas',
+    'enciclopedia': 'enciclopedias',
+}
+
+
+def productos_por_bodega():
+    """
+    Cantidad de productos distintos con stock en cada bodega, agrupada en una
+    sola consulta.
+    """
+    # Meta.ordering no se aplica a consultas agrupadas: el orden va explícito
+    return Bodega.objects.annotate(
+        cantidad=Count('existencias', filter=Q(existencias__cantidad__gt=0))
+    ).order_by('nombre').values('nombre', 'cantidad')
+
+
+def productos_por_editorial():
+    """
+    Productos de cada tipo por editorial: un COUNT condicional por tipo, en
+    una sola consulta agrupada por editorial.
+    """
+    conteos_por_tipo = {
+        columna: Count('producto', filter=Q(producto__tipo=tipo))
+        for tipo, columna in COLUMNAS_POR_TIPO.items()
+    }
+    return Editorial.objects.annotate(**conteos_por_tipo).order_by('nombre').values(
+        *COLUMNAS_POR_TIPO.values(), editorial=F('nombre'))
+
+
+def existencias_por_editorial(bodega, editorial=None, tipo=None):
+    """
+    Productos distintos y unidades en stock de una bodega por editorial y
+    tipo, en una sola consulta agrupada.
+    """
+    existencias = Existencia.objects.filter(bodega=bodega, cantidad__gt=0)
+    if editorial:
+        existencias = existencias.filter(producto__editorial=editorial)
+    if tipo:
+        existencias = existencias.filter(producto__tipo=tipo)
+    return existencias.values(
+        editorial=F('producto__editorial__nombre'), tipo=F('producto__tipo'),
+    ).annotate(
+        productos=Count('id'), unidades=Sum('cantidad'),
+    ).order_by('editorial', 'tipo')
+
+
+def movimientos_recientes(cantidad=10):
+    return Movimiento.objects.select_related(
+        'bodega_origen', 'bodega_destino', 'usuario'
+    ).order_by('-fecha')[:cantidad]
+
+
+# Columnas del historial de movimientos a nivel de detalle
+COLUMNAS_DETALLE_MOVIMIENTOS = {
+    'codigo': 'movimiento__codigo',
+    'fecha': 'movimiento__fecha',
+    'bodega_origen': 'movimiento__bodega_origen__nombre',
+    'bodega_destino': 'movimiento__bodega_destino__nombre',
+    'usuario': 'movimiento__usuario__username',
+    'producto': 'producto__titulo',
+    'cantidad': 'cantidad',
+}
+
+
+def detalle_movimientos(desde=None, hasta=None):
+    """
+    Filas (tuplas, en el orden de COLUMNAS_DETALLE_MOVIMIENTOS) del historial
+    de movimientos, opcionalmente entre dos fechas. Si el rango alcanza
+    períodos archivados se leen también del archivo.
+    """
+    consultas = [
+        detalles.order_by('movimiento_id', 'id').values_list(*COLUMNAS_DETALLE_MOVIMIENTOS.values())
+        for detalles in archivo.detalles_con_archivo(desde, hasta)
+    ]
+    if len(consultas) == 1:
+        return consultas[0]
+    return itertools.chain.from_iterable(
+        consulta.iterator(chunk_size=archivo.LOTE) for consulta in consultas)
+
+
+# Informes que se guardan en caché y los modelos cuyos cambios los invalidan.
+# El stock (Existencia) solo cambia con movimientos, así que depende de
+# Movimiento y MovimientoDetalle.
+INFORMES = {
+    'productos_por_bodega': (
+        productos_por_bodega, [Bodega, Producto, Movimiento, MovimientoDetalle]),
+    'productos_por_editorial': (productos_por_editorial, [Editorial, Producto]),
+    'movimientos_recientes': (movimientos_recientes, [Movimiento, Bodega]),
+    'existencias_por_editorial': (
+        existencias_por_editorial, [Editorial, Producto, Movimiento, MovimientoDetalle]),
+}
+
+
+def en_cache(nombre, **parametros):
+    """
+    Resultado del informe `nombre` (una lista) desde la caché, calculándolo
+    si hace falta.
+    """
+    funcion, modelos = INFORMES[nombre]
+    return cache.en_cache(
+        nombre, modelos, lambda: list(funcion(**parametros)), parametros)
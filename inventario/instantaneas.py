@@ -0,0 +1,138 @@
+"""
+Instantáneas de stock y consultas de stock a una fecha.
+
+Una instantánea guarda el stock de una bodega con todos los movimientos de id
+menor o igual a `ultimo_movimiento_id`. El stock a una fecha T se calcula desde
+la instantánea más cercana S sumando los detalles que S no incluye y que son
+anteriores a T, y restando los que S incluye y son posteriores a T:
+
+    stock(T) = S + Σ(id > S.ultimo, fecha <= T) − Σ(id <= S.ultimo, fecha > T)
+
+Así solo se recorren los movimientos entre S y T, sin importar cuántos años de
+historial haya. Los detalles archivados (archivo.py) se suman solo cuando la
+consulta los alcanza.
+"""
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from . import archivo
+from .models import (
+    Bodega, DetalleArchivado, Existencia, InstantaneaStock, LineaInstantanea, Movimiento,
+    MovimientoDetalle,
+)
+
+# Líneas insertadas por sentencia al tomar una instantánea
+LOTE = 2000
+
+
+def tomar_instantaneas(bodegas=None):
+    """
+    Toma una instantánea del stock actual de cada bodega (o de las indicadas)
+    y las retorna.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Espera a que terminen las transacciones que registraron
+            # movimientos y bloquea nuevos INSERT hasta el commit, para que el
+            # stock leído corresponda exactamente a ultimo_movimiento_id.
+            # En SQLite la transacción ya ve una foto consistente.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"LOCK TABLE {Movimiento._meta.db_table} IN SHARE MODE")
+
+        ultimo = archivo.ultimo_movimiento_id()
+        fecha = timezone.now()
+        if bodegas is None:
+            bodegas = Bodega.objects.all()
+
+        instantaneas = []
+        for bodega in bodegas:
+            instantanea = InstantaneaStock.objects.create(
+                bodega=bodega, fecha=fecha, ultimo_movimiento_id=ultimo)
+            existencias = Existencia.objects.filter(
+                bodega=bodega, cantidad__gt=0
+            ).values_list('producto_id', 'cantidad').iterator(chunk_size=LOTE)
+            lote = []
+            for producto_id, cantidad in existencias:
+                lote.append(LineaInstantanea(
+                    instantanea=instantanea, producto_id=producto_id, cantidad=cantidad))
+                if len(lote) >= LOTE:
+                    LineaInstantanea.objects.bulk_create(lote)
+                    lote = []
+            LineaInstantanea.objects.bulk_create(lote)
+            instantaneas.append(instantanea)
+    return instantaneas
+
+
+def instantanea_cercana(bodega, fecha):
+    """
+    La última instantánea de la bodega anterior a la fecha o, si no hay, la
+    primera posterior. None si la bodega no tiene instantáneas.
+    """
+    instantaneas = InstantaneaStock.objects.filter(bodega=bodega)
+    return (
+        instantaneas.filter(fecha__lte=fecha).order_by('-fecha', '-id').first()
+        or instantaneas.filter(fecha__gt=fecha).order_by('fecha', 'id').first()
+    )
+
+
+def stock_a_fecha(bodega, fecha, productos=None):
+    """
+    Retorna {producto_id: cantidad} con el stock de la bodega a la fecha
+    indicada (solo productos con stock). `productos` limita la consulta a
+    esos productos (objetos o ids).
+    """
+    if productos is not None:
+        productos = [getattr(producto, 'pk', producto) for producto in productos]
+
+    instantanea = instantanea_cercana(bodega, fecha)
+    stock = {}
+    ultimo = 0
+    if instantanea is not None:
+        ultimo = instantanea.ultimo_movimiento_id
+        lineas = instantanea.lineas.all()
+        if productos is not None:
+            lineas = lineas.filter(producto_id__in=productos)
+        stock = dict(lineas.values_list('producto_id', 'cantidad'))
+
+    modelos = [MovimientoDetalle]
+    if archivo.necesita_archivo(fecha, ultimo):
+        modelos.append(DetalleArchivado)
+    for modelo in modelos:
+        for producto_id, delta in _deltas(modelo, bodega, fecha, ultimo, productos):
+            stock[producto_id] = stock.get(producto_id, 0) + delta
+    return {producto_id: cantidad for producto_id, cantidad in stock.items() if cantidad}
+
+
+def stock_producto_a_fecha(producto, bodega, fecha):
+    return stock_a_fecha(bodega, fecha, [producto]).get(getattr(producto, 'pk', producto), 0)
+
+
+def _deltas(modelo, bodega, fecha, ultimo, productos):
+    """
+    Suma por producto de los detalles (MovimientoDetalle o DetalleArchivado)
+    que separan la instantánea (hasta el movimiento `ultimo`) de la fecha
+    pedida, en una sola consulta agrupada.
+    """
+    signo_bodega = Case(
+        When(movimiento__bodega_destino=bodega, then=Value(1)),
+        default=Value(-1),
+        output_field=IntegerField(),
+    )
+    detalles = modelo.objects.filter(
+        Q(movimiento__bodega_origen=bodega) | Q(movimiento__bodega_destino=bodega),
+        Q(movimiento_id__gt=ultimo, movimiento__fecha__lte=fecha)
+        | Q(movimiento_id__lte=ultimo, movimiento__fecha__gt=fecha),
+    )
+    if productos is not None:
+        detalles = detalles.filter(producto_id__in=productos)
+    # Los detalles posteriores a la fecha ya incluidos en la instantánea se restan
+    signo_corte = Case(
+        When(movimiento_id__gt=ultimo, then=Value(1)),
+        default=Value(-1),
+        output_field=IntegerField(),
+    )
+    return detalles.order_by().values('producto_id').annotate(
+        delta=Sum(F('cantidad') * signo_bodega * signo_corte)
+    ).values_list('producto_id', 'delta')
@@ -0,0 +1,57 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from inventario.archivo import archivar, periodos_cerrados
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve al archivo los movimientos de los períodos cerrados, mes a mes, "
+        "y guarda por bodega el stock al cierre de cada período. Las consultas "
+        "de historial y de stock a una fecha leen el archivo solo si lo necesitan."
+    )
+
+    def add_arguments(self, parser):
+        grupo = parser.add_mutually_exclusive_group()
+        grupo.add_argument(
+            '--antes', metavar='AAAA-MM-DD',
+            help="Archiva los movimientos anteriores a esta fecha.",
+        )
+        grupo.add_argument(
+            '--meses', type=int, default=12,
+            help="Meses completos que se mantienen sin archivar además del "
+                 "actual (por defecto 12).",
+        )
+
+    def handle(self, *args, **options):
+        if options['antes']:
+            try:
+                fecha = parse_date(options['antes'])
+            except ValueError:
+                # Bien escrita pero inexistente, como 2024-02-30
+                fecha = None
+            if fecha is None:
+                raise CommandError("--antes debe ser una fecha AAAA-MM-DD.")
+        else:
+            if options['meses'] < 0:
+                raise CommandError("--meses no puede ser negativo.")
+            hoy = timezone.localdate()
+            meses = hoy.year * 12 + hoy.month - 1 - options['meses']
+            fecha = datetime.date(meses // 12, meses % 12 + 1, 1)
+        antes = timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+
+        total = 0
+        # Un período por transacción: cada una bloquea los movimientos solo
+        # mientras archiva su mes
+        for corte in periodos_cerrados(antes):
+            periodo = archivar(corte)
+            if periodo is None:
+                continue
+            total += periodo.movimientos
+            self.stdout.write(
+                f"Hasta {timezone.localtime(corte):%Y-%m-%d}: {periodo.movimientos} "
+                f"movimientos y {periodo.detalles} detalles archivados.")
+        self.stdout.write(self.style.SUCCESS(f"{total} movimientos archivados."))
@@ -0,0 +1,258 @@
+import datetime
+import itertools
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from inventario import busqueda, cache
+from inventario.models import (
+    Autor, Bodega, Editorial, Existencia, Movimiento, MovimientoDetalle, Producto, Usuario,
+    normalizar,
+)
+
+# Tamaños por escala (cantidad de movimientos); las opciones sueltas los reemplazan
+ESCALAS = {
+    '10k': {'bodegas': 5, 'editoriales': 50, 'autores': 300, 'productos': 2_000,
+            'movimientos': 10_000},
+    '100k': {'bodegas': 10, 'editoriales': 200, 'autores': 2_000, 'productos': 20_000,
+             'movimientos': 100_000},
+    '1m': {'bodegas': 25, 'editoriales': 1_000, 'autores': 10_000, 'productos': 100_000,
+           'movimientos': 1_000_000},
+}
+
+# Filas por bulk_create y movimientos por transacción
+LOTE = 5000
+
+# Proporción de cada tipo de movimiento; las salidas y transferencias sin
+# stock suficiente se convierten en entradas
+TIPOS_MOVIMIENTO = [('entrada', 0.3), ('transferencia', 0.5), ('salida', 0.2)]
+
+PALABRAS = (
+    'historia mar noche ciudad jardín viaje sombra río memoria tiempo luz '
+    'silencio camino bosque fuego invierno verano palabra sueño montaña '
+    'ciencia arte música guerra amor casa puerto isla desierto estrella'
+).split()
+NOMBRES = 'Ana Luis María Jorge Carmen Pedro Laura Diego Isabel Pablo Elena Tomás'.split()
+APELLIDOS = 'García Rojas Muñoz Díaz Soto Contreras Silva Torres Reyes Vega Fuentes'.split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera datos sintéticos para pruebas de rendimiento: bodegas, "
+        "editoriales, autores, productos y movimientos. La popularidad de los "
+        "productos sigue una distribución de Zipf (pocos productos concentran "
+        "la mayoría de los movimientos) y las fechas se reparten en el período "
+        "indicado. Los datos se agregan a los existentes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--escala', choices=ESCALAS, default='10k',
+            help="Tamaño base del conjunto de datos (por defecto 10k movimientos).",
+        )
+        for nombre in ('bodegas', 'editoriales', 'autores', 'productos', 'movimientos'):
+            parser.add_argument(f'--{nombre}', type=int, help=f"Cantidad de {nombre}.")
+        parser.add_argument(
+            '--lineas', type=int, default=5,
+            help="Máximo de productos por movimiento (por defecto 5).",
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help="Exponente de la distribución de popularidad (por defecto 1.1).",
+        )
+        parser.add_argument(
+            '--dias', type=int, default=730,
+            help="Días hacia atrás en que se reparten los movimientos (por defecto 730).",
+        )
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        tamanos = {
+            nombre: options[nombre] if options[nombre] is not None else valor
+            for nombre, valor in ESCALAS[options['escala']].items()
+        }
+        if min(tamanos.values()) < 1 or options['lineas'] < 1:
+            raise CommandError("Las cantidades deben ser mayores que cero.")
+        self.aleatorio = random.Random(options['semilla'])
+        inicio = time.monotonic()
+
+        bodegas = self.crear_bodegas(tamanos['bodegas'])
+        editoriales = self.crear_editoriales(tamanos['editoriales'])
+        autores = self.crear_autores(tamanos['autores'])
+        productos = self.crear_productos(tamanos['productos'], editoriales, autores)
+        self.stdout.write(
+            f"{len(bodegas)} bodegas, {len(editoriales)} editoriales, "
+            f"{len(autores)} autores y {len(productos)} productos creados.")
+
+        stock = self.crear_movimientos(
+            tamanos['movimientos'], bodegas, productos, options)
+        self.guardar_stock(stock, bodegas)
+
+        for modelo in (Bodega, Editorial, Autor, Producto, Movimiento, MovimientoDetalle):
+            cache.invalidar(modelo)
+        self.stdout.write(self.style.SUCCESS(
+            f"Datos generados en {time.monotonic() - inicio:.1f} s."))
+
+    def crear_bodegas(self, cantidad):
+        inicio = Bodega.objects.count()
+        return Bodega.objects.bulk_create(
+            Bodega(nombre=f'Bodega {inicio + i + 1}') for i in range(cantidad))
+
+    def crear_editoriales(self, cantidad):
+        inicio = Editorial.objects.count()
+        return Editorial.objects.bulk_create(
+            (Editorial(nombre=f'Editorial {inicio + i + 1}') for i in range(cantidad)),
+            batch_size=LOTE)
+
+    def crear_autores(self, cantidad):
+        return Autor.objects.bulk_create(
+            (Autor(nombre=f'{self.aleatorio.choice(NOMBRES)} {self.aleatorio.choice(APELLIDOS)}')
+             for _ in range(cantidad)),
+            batch_size=LOTE)
+
+    def crear_productos(self, cantidad, editoriales, autores):
+        tipos = [tipo for tipo, _ in Producto.TIPO_PRODUCTO]
+        inicio = Producto.objects.count()
+        ahora = timezone.now()
+        ids = []
+        for desde in range(0, cantidad, LOTE):
+            with transaction.atomic():
+                productos = []
+                for i in range(desde, min(cantidad, desde + LOTE)):
+                    titulo = ' '.join(self.aleatorio.sample(PALABRAS, 3)).capitalize()
+                    titulo = f'{titulo} {inicio + i + 1}'
+                    productos.append(Producto(
+                        codigo=f'GEN{inicio + i + 1:08d}',
+                        tipo=self.aleatorio.choice(tipos),
+                        titulo=titulo,
+                        titulo_normalizado=normalizar(titulo),
+                        editorial=self.aleatorio.choice(editoriales),
+                        descripcion=' '.join(self.aleatorio.choices(PALABRAS, k=12)),
+                        actualizado=ahora,
+                    ))
+                Producto.objects.bulk_create(productos)
+
+                ProductoAutor = Producto.autores.through
+                relaciones = {
+                    producto.pk: self.aleatorio.sample(autores, self.aleatorio.randint(1, 2))
+                    for producto in productos
+                }
+                ProductoAutor.objects.bulk_create(
+                    ProductoAutor(producto_id=pk, autor_id=autor.pk)
+                    for pk, autores_producto in relaciones.items()
+                    for autor in autores_producto
+                )
+                # bulk_create no emite señales: se indexa con los datos en memoria
+                busqueda.indexar_documentos(
+                    (producto.pk, producto.titulo, producto.descripcion,
+                     ' '.join(autor.nombre for autor in relaciones[producto.pk]),
+                     producto.editorial.nombre)
+                    for producto in productos
+                )
+            ids.extend(producto.pk for producto in productos)
+        return ids
+
+    def crear_movimientos(self, cantidad, bodegas, productos, options):
+        """
+        Genera los movimientos en orden de fecha simulando el stock en memoria,
+        para que ninguna salida deje stock negativo. Retorna el stock final
+        {(bodega_id, producto_id): cantidad}.
+        """
+        # El ranking de popularidad es una permutación de los productos
+        ranking = productos[:]
+        self.aleatorio.shuffle(ranking)
+        pesos = list(itertools.accumulate(
+            1 / (posicion + 1) ** options['zipf'] for posicion in range(len(ranking))))
+        tipos, proporciones = zip(*TIPOS_MOVIMIENTO)
+        usuario, _ = Usuario.objects.get_or_create(
+            username='generador', defaults={'is_bodeguero': True})
+        ids_bodegas = [bodega.pk for bodega in bodegas]
+
+        stock = {}
+        desde = timezone.now() - datetime.timedelta(days=options['dias'])
+        paso = datetime.timedelta(days=options['dias']) / cantidad
+        inicio = time.monotonic()
+        creados = 0
+        for lote in range(0, cantidad, LOTE):
+            movimientos = []
+            lineas = []
+            for i in range(lote, min(cantidad, lote + LOTE)):
+                tipo = self.aleatorio.choices(tipos, proporciones)[0]
+                if len(ids_bodegas) > 1:
+                    origen, destino = self.aleatorio.sample(ids_bodegas, 2)
+                else:
+                    origen = destino = ids_bodegas[0]
+                if tipo == 'entrada':
+                    origen = None
+                elif tipo == 'salida' or origen == destino:
+                    destino = None
+                elegidos = set(self.aleatorio.choices(
+                    ranking, cum_weights=pesos, k=self.aleatorio.randint(1, options['lineas'])))
+
+                detalle = []
+                for producto in elegidos:
+                    cantidad_linea = self.aleatorio.randint(1, 10)
+                    if origen is not None:
+                        cantidad_linea = min(cantidad_linea, stock.get((origen, producto), 0))
+                    if cantidad_linea:
+                        detalle.append((producto, cantidad_linea))
+                if not detalle:
+                    # Sin stock en el origen: se registra como entrada
+                    origen = None
+                    destino = destino or self.aleatorio.choice(ids_bodegas)
+                    detalle = [(producto, self.aleatorio.randint(10, 50)) for producto in elegidos]
+                elif tipo == 'entrada':
+                    detalle = [(producto, cantidad_linea * 5) for producto, cantidad_linea in detalle]
+
+                for producto, cantidad_linea in detalle:
+                    if origen is not None:
+                        stock[origen, producto] -= cantidad_linea
+                    if destino is not None:
+                        stock[destino, producto] = stock.get((destino, producto), 0) + cantidad_linea
+                movimientos.append(Movimiento(
+                    bodega_origen_id=origen, bodega_destino_id=destino, usuario=usuario,
+                    fecha=desde + paso * i))
+                lineas.append(detalle)
+
+            with transaction.atomic():
+                Movimiento.asignar_codigos(movimientos)
+                # bulk_create pone la hora actual en fecha (auto_now_add); las
+                # fechas del pasado se escriben después con bulk_update
+                fechas = [movimiento.fecha for movimiento in movimientos]
+                Movimiento.objects.bulk_create(movimientos)
+                for movimiento, fecha in zip(movimientos, fechas):
+                    movimiento.fecha = fecha
+                Movimiento.objects.bulk_update(movimientos, ['fecha'], batch_size=LOTE)
+                MovimientoDetalle.objects.bulk_create(
+                    (
+                        MovimientoDetalle(movimiento=movimiento, producto_id=producto, cantidad=cantidad_linea)
+                        for movimiento, detalle in zip(movimientos, lineas)
+                        for producto, cantidad_linea in detalle
+                    ),
+                    batch_size=LOTE,
+                )
+            creados += len(movimientos)
+            self.stdout.write(
+                f"{creados} movimientos creados "
+                f"({creados / (time.monotonic() - inicio):,.0f} movimientos/s)")
+        return stock
+
+    def guardar_stock(self, stock, bodegas):
+        with transaction.atomic():
+            Existencia.objects.bulk_create(
+                (
+                    Existencia(bodega_id=bodega, producto_id=producto, cantidad=cantidad)
+                    for (bodega, producto), cantidad in stock.items() if cantidad > 0
+                ),
+                batch_size=LOTE,
+            )
+            totales = {}
+            for (bodega, _), cantidad in stock.items():
+                totales[bodega] = totales.get(bodega, 0) + cantidad
+            for bodega in bodegas:
+                bodega.total_unidades = totales.get(bodega.pk, 0)
+            Bodega.objects.bulk_update(bodegas, ['total_unidades'])
+
@@ -0,0 +1,228 @@
+import csv
+import itertools
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from inventario import busqueda, cache
+from inventario.models import Autor, Editorial, Producto, normalizar
+
+TIPOS = {tipo for tipo, _ in Producto.TIPO_PRODUCTO}
+
+# Campos que se sobrescriben cuando el código ya existe
+CAMPOS_ACTUALIZABLES = ['tipo', 'titulo', 'titulo_normalizado', 'editorial',
+                        'descripcion', 'actualizado']
+
+# Errores de filas que se muestran antes de resumir el resto
+MAX_ERRORES_MOSTRADOS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa o actualiza productos desde un archivo CSV o JSON Lines. "
+        "Columnas: codigo, tipo, titulo, editorial, autores, descripcion. "
+        "En CSV los autores van separados por ';'; en JSONL pueden ser una lista. "
+        "Los productos se identifican por su código: si ya existe se actualiza "
+        "y se reemplazan sus autores."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument(
+            '--formato', choices=['csv', 'jsonl'],
+            help="Formato del archivo; por defecto se deduce de la extensión.",
+        )
+        parser.add_argument(
+            '--lote', type=int, default=5000,
+            help="Filas por transacción (por defecto 5000).",
+        )
+        parser.add_argument(
+            '--separador', default=';',
+            help="Separador de autores en CSV (por defecto ';').",
+        )
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or options['archivo'].rsplit('.', 1)[-1].lower()
+        if formato not in ('csv', 'jsonl'):
+            raise CommandError("No se pudo deducir el formato; usa --formato csv|jsonl.")
+        if options['lote'] < 1:
+            raise CommandError("--lote debe ser mayor que cero.")
+
+        self.separador = options['separador']
+        self.editoriales = dict(Editorial.objects.values_list('nombre', 'id'))
+        # Autor.nombre no es único: se usa el primero con ese nombre
+        self.autores = {}
+        for pk, nombre in Autor.objects.order_by('-id').values_list('id', 'nombre'):
+            self.autores[nombre] = pk
+        self.errores = 0
+
+        inicio = time.monotonic()
+        total = 0
+        try:
+            with open(options['archivo'], encoding='utf-8-sig', newline='') as archivo:
+                filas = _leer_csv(archivo) if formato == 'csv' else _leer_jsonl(archivo)
+                while lote := list(itertools.islice(filas, options['lote'])):
+                    total += self.importar_lote(lote)
+                    transcurrido = time.monotonic() - inicio
+                    self.stdout.write(
+                        f"{total} productos importados "
+                        f"({total / transcurrido:,.0f} filas/s)")
+        except OSError as error:
+            raise CommandError(f"No se pudo leer el archivo: {error}")
+        except UnicodeDecodeError as error:
+            raise CommandError(
+                f"El archivo no está en UTF-8 ({error}); se importaron {total} "
+                f"productos antes del error.")
+
+        transcurrido = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"Importación terminada: {total} productos en {transcurrido:.1f} s "
+            f"({total / transcurrido if transcurrido else total:,.0f} filas/s)."))
+        if self.errores:
+            self.stdout.write(self.style.WARNING(
+                f"{self.errores} fila(s) omitida(s) por errores."))
+
+    def importar_lote(self, lote):
+        """
+        Valida las filas del lote y las guarda en una transacción. Retorna la
+        cantidad de productos importados.
+        """
+        productos = {}
+        for numero, fila in lote:
+            try:
+                datos = self.validar(fila)
+            except ValueError as error:
+                self.errores += 1
+                if self.errores <= MAX_ERRORES_MOSTRADOS:
+                    self.stderr.write(f"Fila {numero}: {error}")
+                continue
+            # Un código repetido en el lote se queda con la última fila
+            productos[datos['codigo']] = datos
+        if not productos:
+            return 0
+
+        with transaction.atomic():
+            self.resolver_editoriales({datos['editorial'] for datos in productos.values()})
+            self.resolver_autores({
+                nombre for datos in productos.values() for nombre in datos['autores']})
+
+            ahora = timezone.now()
+            Producto.objects.bulk_create(
+                [
+                    Producto(
+                        codigo=codigo,
+                        tipo=datos['tipo'],
+                        titulo=datos['titulo'],
+                        titulo_normalizado=normalizar(datos['titulo']),
+                        editorial_id=self.editoriales[datos['editorial']],
+                        descripcion=datos['descripcion'],
+                        actualizado=ahora,
+                    )
+                    for codigo, datos in productos.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['codigo'],
+                update_fields=CAMPOS_ACTUALIZABLES,
+            )
+            ids = dict(Producto.objects.filter(
+                codigo__in=productos).values_list('codigo', 'id'))
+
+            # Los autores se reemplazan por los del archivo
+            ProductoAutor = Producto.autores.through
+            ProductoAutor.objects.filter(producto_id__in=ids.values()).delete()
+            ProductoAutor.objects.bulk_create(
+                [
+                    ProductoAutor(producto_id=ids[codigo], autor_id=self.autores[nombre])
+                    for codigo, datos in productos.items()
+                    for nombre in datos['autores']
+                ],
+                ignore_conflicts=True,
+            )
+
+            # bulk_create no emite señales: el índice de búsqueda se actualiza
+            # aquí con los datos del archivo, sin volver a leerlos
+            busqueda.indexar_documentos(
+                (ids[codigo], datos['titulo'], datos['descripcion'],
+                 ' '.join(datos['autores']), datos['editorial'])
+                for codigo, datos in productos.items()
+            )
+            cache.invalidar(Producto)
+            cache.invalidar(Editorial)
+            cache.invalidar(Autor)
+        return len(productos)
+
+    def validar(self, fila):
+        if fila.get('_invalida'):
+            raise ValueError("no es un objeto JSON válido.")
+        codigo = _texto(fila.get('codigo'))
+        titulo = _texto(fila.get('titulo'))
+        editorial = _texto(fila.get('editorial'))
+        tipo = _texto(fila.get('tipo')).lower()
+        if not codigo:
+            raise ValueError("falta el código.")
+        if not titulo:
+            raise ValueError("falta el título.")
+        if not editorial:
+            raise ValueError("falta la editorial.")
+        if tipo not in TIPOS:
+            raise ValueError(f"tipo '{tipo}' inválido.")
+
+        autores = fila.get('autores') or []
+        if isinstance(autores, str):
+            autores = autores.split(self.separador)
+        elif not isinstance(autores, list):
+            raise ValueError("los autores deben ser texto o una lista.")
+        autores = list(dict.fromkeys(filter(None, (_texto(nombre) for nombre in autores))))
+
+        return {
+            'codigo': codigo[:64],
+            'tipo': tipo,
+            'titulo': titulo[:255],
+            'editorial': editorial[:255],
+            'autores': [nombre[:255] for nombre in autores],
+            'descripcion': _texto(fila.get('descripcion')),
+        }
+
+    def resolver_editoriales(self, nombres):
+        nuevas = [nombre for nombre in nombres if nombre not in self.editoriales]
+        if nuevas:
+            Editorial.objects.bulk_create(
+                [Editorial(nombre=nombre) for nombre in nuevas], ignore_conflicts=True)
+            self.editoriales.update(
+                Editorial.objects.filter(nombre__in=nuevas).values_list('nombre', 'id'))
+
+    def resolver_autores(self, nombres):
+        nuevos = [nombre for nombre in nombres if nombre not in self.autores]
+        if nuevos:
+            Autor.objects.bulk_create([Autor(nombre=nombre) for nombre in nuevos])
+            for pk, nombre in Autor.objects.filter(
+                    nombre__in=nuevos).order_by('-id').values_list('id', 'nombre'):
+                self.autores[nombre] = pk
+
+
+def _texto(valor):
+    return str(valor).strip() if valor is not None else ''
+
+
+def _leer_csv(archivo):
+    """
+    Retorna pares (número de línea, fila) sin cargar el archivo completo.
+    """
+    lector = csv.DictReader(archivo)
+    for fila in lector:
+        yield lector.line_num, fila
+
+
+def _leer_jsonl(archivo):
+    for numero, linea in enumerate(archivo, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            fila = None
+        # Una línea que no es un objeto JSON se informa como fila inválida
+        yield numero, fila if isinstance(fila, dict) else {'_invalida': True}
@@ -0,0 +1,240 @@
+import datetime
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from inventario import informes
+from inventario.cache import obtener_cache
+from inventario.consultas import ContadorConsultas
+from inventario.instantaneas import stock_a_fecha, stock_producto_a_fecha
+from inventario.models import (
+    Autor, Bodega, Editorial, Existencia, Movimiento, MovimientoDetalle, Producto, Usuario,
+)
+from inventario.stock import registrar_movimiento
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide latencia y rendimiento de las vistas, los informes, el registro "
+        "de movimientos y las consultas de stock sobre los datos actuales "
+        "(ver generar_datos) y guarda los resultados en JSON para compararlos "
+        "entre versiones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeticiones', type=int, default=20,
+            help="Ejecuciones por medición (por defecto 20).",
+        )
+        parser.add_argument(
+            '--movimientos', type=int, default=200,
+            help="Movimientos registrados para medir su creación (por defecto "
+                 "200); se revierten al terminar.",
+        )
+        parser.add_argument(
+            '--salida', default='rendimiento.json',
+            help="Archivo JSON de resultados (por defecto rendimiento.json).",
+        )
+        parser.add_argument(
+            '--etiqueta', default='',
+            help="Nombre de la versión medida, se guarda en los resultados.",
+        )
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1 or options['movimientos'] < 1:
+            raise CommandError("--repeticiones y --movimientos deben ser mayores que cero.")
+        self.repeticiones = options['repeticiones']
+        self.aleatorio = random.Random(options['semilla'])
+        self.resultados = []
+
+        self.bodegas = list(Bodega.objects.order_by('-total_unidades')[:10])
+        if not self.bodegas or not Existencia.objects.filter(cantidad__gt=0).exists():
+            raise CommandError("No hay datos: ejecuta antes generar_datos.")
+        self.productos = list(
+            MovimientoDetalle.objects.values('producto').annotate(
+                lineas=Count('id')).order_by('-lineas').values_list('producto', flat=True)[:50])
+
+        self.medir_vistas()
+        self.medir_informes()
+        self.medir_stock()
+        self.medir_movimientos(options['movimientos'])
+
+        datos = {
+            'etiqueta': options['etiqueta'],
+            'fecha': timezone.now().isoformat(),
+            'base_de_datos': connection.vendor,
+            'datos': {
+                'bodegas': Bodega.objects.count(),
+                'editoriales': Editorial.objects.count(),
+                'autores': Autor.objects.count(),
+                'productos': Producto.objects.count(),
+                'movimientos': Movimiento.objects.count(),
+                'detalles': MovimientoDetalle.objects.count(),
+            },
+            'repeticiones': self.repeticiones,
+            'resultados': self.resultados,
+        }
+        with open(options['salida'], 'w', encoding='utf-8') as archivo:
+            json.dump(datos, archivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['salida']}."))
+
+    def medir(self, grupo, nombre, funcion, repeticiones=None):
+        """
+        Ejecuta funcion() varias veces y guarda latencias, consultas y
+        operaciones por segundo. La primera ejecución se informa aparte: es la
+        que paga la caché vacía.
+        """
+        repeticiones = repeticiones or self.repeticiones
+        tiempos = []
+        contador = ContadorConsultas()
+        with connection.execute_wrapper(contador):
+            for _ in range(repeticiones + 1):
+                contador.total = 0
+                inicio = time.perf_counter()
+                funcion()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+        primera, tiempos = tiempos[0], sorted(tiempos[1:])
+        resultado = {
+            'grupo': grupo,
+            'nombre': nombre,
+            'consultas': contador.total,
+            'primera_ms': round(primera, 3),
+            'media_ms': round(statistics.fmean(tiempos), 3),
+            'p50_ms': round(_percentil(tiempos, 50), 3),
+            'p95_ms': round(_percentil(tiempos, 95), 3),
+            'max_ms': round(tiempos[-1], 3),
+            'por_segundo': round(1000 * len(tiempos) / sum(tiempos), 1) if sum(tiempos) else None,
+        }
+        self.resultados.append(resultado)
+        self.stdout.write(
+            f"{grupo:<12} {nombre:<32} p50 {resultado['p50_ms']:>9.2f} ms  "
+            f"p95 {resultado['p95_ms']:>9.2f} ms  {resultado['consultas']:>4} consultas")
+
+    def medir_vistas(self):
+        jefe, _ = Usuario.objects.get_or_create(
+            username='rendimiento_jefe', defaults={'is_jefe_bodega': True})
+        bodeguero, _ = Usuario.objects.get_or_create(
+            username='rendimiento_bodeguero', defaults={'is_bodeguero': True})
+        clientes = {}
+        for rol, usuario in (('jefe', jefe), ('bodeguero', bodeguero)):
+            clientes[rol] = Client()
+            clientes[rol].force_login(usuario)
+
+        bodega = self.bodegas[0].pk
+        producto = Producto.objects.get(pk=self.productos[0])
+        editorial = producto.editorial_id
+        prefijo = producto.titulo_normalizado[:3]
+        palabra = producto.titulo.split()[0]
+        hace_un_mes = (timezone.localdate() - datetime.timedelta(days=30)).isoformat()
+        vistas = [
+            ('jefe', 'productos_list', reverse('productos_list')),
+            ('jefe', 'productos_buscar', reverse('productos_buscar') + f'?q={palabra}'),
+            ('bodeguero', 'productos_autocompletar',
+             reverse('productos_autocompletar') + f'?q={prefijo}&bodega={bodega}'),
+            ('bodeguero', 'productos_stock', reverse('productos_stock', args=[producto.pk])),
+            ('bodeguero', 'bodegas_list', reverse('bodegas_list')),
+            ('bodeguero', 'movimientos_list', reverse('movimientos_list')),
+            ('bodeguero', 'movimientos_create', reverse('movimientos_create')),
+            ('jefe', 'autores_list', reverse('autores_list')),
+            ('jefe', 'editoriales_list', reverse('editoriales_list')),
+            ('jefe', 'informe_bodega',
+             reverse('informe_bodega') + f'?bodega={bodega}&editorial={editorial}'),
+            ('jefe', 'informe_movimientos', reverse('informe_movimientos')),
+            ('jefe', 'informes_generales', reverse('informes_generales')),
+            ('jefe', 'exportar_movimientos',
+             reverse('exportar_movimientos', args=['csv']) + f'?desde={hace_un_mes}'),
+            ('jefe', 'api_productos', '/api/v1/productos/'),
+            ('jefe', 'api_movimientos', f'/api/v1/movimientos/?bodega_destino={bodega}'),
+            ('jefe', 'api_stock_bodega',
+             f'/api/v1/bodegas/{bodega}/stock/?fecha={hace_un_mes}'),
+        ]
+
+        obtener_cache().clear()
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for rol, nombre, url in vistas:
+                cliente = clientes[rol]
+
+                def pedir():
+                    response = cliente.get(url)
+                    if response.status_code != 200:
+                        raise CommandError(f"{url} respondió {response.status_code}.")
+                    if response.streaming:
+                        # El tiempo de una exportación incluye generar el archivo
+                        for _ in response.streaming_content:
+                            pass
+
+                self.medir('vistas', nombre, pedir)
+
+    def medir_informes(self):
+        # Sin caché: mide la consulta de cada informe
+        bodega = self.bodegas[0].pk
+        parametros = {'existencias_por_editorial': {'bodega': bodega}}
+        for nombre, (funcion, _) in informes.INFORMES.items():
+            self.medir('informes', nombre,
+                       lambda: list(funcion(**parametros.get(nombre, {}))))
+        ultima = Movimiento.objects.aggregate(ultima=Max('fecha'))['ultima']
+        self.medir('informes', 'detalle_movimientos_30_dias', lambda: list(
+            informes.detalle_movimientos(desde=ultima - datetime.timedelta(days=30))))
+
+    def medir_stock(self):
+        primera = Movimiento.objects.order_by('fecha', 'id').values_list('fecha', flat=True).first()
+        ahora = timezone.now()
+
+        def fecha_al_azar():
+            return primera + (ahora - primera) * self.aleatorio.random()
+
+        self.medir('stock', 'stock_a_fecha_bodega', lambda: stock_a_fecha(
+            self.aleatorio.choice(self.bodegas), fecha_al_azar()))
+        self.medir('stock', 'stock_producto_a_fecha', lambda: stock_producto_a_fecha(
+            self.aleatorio.choice(self.productos), self.aleatorio.choice(self.bodegas),
+            fecha_al_azar()))
+        self.medir('stock', 'existencias_producto', lambda: list(
+            Existencia.objects.filter(producto=self.aleatorio.choice(self.productos))
+            .values_list('bodega_id', 'cantidad')))
+
+    def medir_movimientos(self, cantidad):
+        """
+        Registra movimientos de 1 a 5 líneas entre las bodegas con más stock,
+        dentro de una transacción que se revierte al terminar.
+        """
+        usuario = Usuario.objects.get(username='rendimiento_bodeguero')
+        disponibles = {
+            bodega.pk: list(Existencia.objects.filter(
+                bodega=bodega, cantidad__gt=0).order_by('-cantidad').select_related('producto')[:200])
+            for bodega in self.bodegas
+        }
+
+        def registrar():
+            origen, destino = self.aleatorio.sample(self.bodegas, 2) \
+                if len(self.bodegas) > 1 else (None, self.bodegas[0])
+            if origen is None:
+                existencias = self.aleatorio.sample(disponibles[destino.pk], 1)
+            else:
+                existencias = self.aleatorio.sample(
+                    disponibles[origen.pk], min(len(disponibles[origen.pk]), self.aleatorio.randint(1, 5)))
+            registrar_movimiento(
+                Movimiento(bodega_origen=origen, bodega_destino=destino, usuario=usuario),
+                [(existencia.producto, 1) for existencia in existencias])
+
+        with transaction.atomic():
+            self.medir('movimientos', 'registrar_movimiento', registrar, repeticiones=cantidad)
+            transaction.set_rollback(True)
+        unidades = Bodega.objects.aggregate(total=Sum('total_unidades'))['total']
+        self.stdout.write(f"Movimientos revertidos; unidades en bodegas: {unidades}.")
+
+
+def _percentil(valores, percentil):
+    """
+    Percentil por rango más cercano de una lista ordenada.
+    """
+    indice = max(0, -(-len(valores) * percentil // 100) - 1)
+    return valores[int(indice)]
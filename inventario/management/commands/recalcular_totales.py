@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from inventario.models import Bodega
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el total de unidades de cada bodega a partir de Existencia."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--solo-verificar', action='store_true',
+            help="Informa las diferencias sin corregirlas.",
+        )
+
+    def handle(self, *args, **options):
+        corregir = not options['solo_verificar']
+        diferencias = Bodega.recalcular_totales(corregir=corregir)
+
+        for bodega, mantenido, calculado in diferencias:
+            self.stdout.write(
+                f"{bodega.nombre}: mantenido {mantenido}, calculado {calculado}")
+
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS(
+                "Los totales de todas las bodegas coinciden con Existencia."))
+        elif corregir:
+            self.stdout.write(self.style.SUCCESS(
+                f"Se corrigieron {len(diferencias)} bodega(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"{len(diferencias)} bodega(s) con diferencias."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.instantaneas import tomar_instantaneas
+from inventario.models import Bodega
+
+
+class Command(BaseCommand):
+    help = (
+        "Guarda una instantánea del stock actual de cada bodega. Pensado para "
+        "ejecutarse periódicamente (por ejemplo cada noche) y acotar las "
+        "consultas de stock a una fecha."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bodega', action='append', dest='bodegas', metavar='NOMBRE',
+            help="Solo esta bodega (se puede repetir).",
+        )
+
+    def handle(self, *args, **options):
+        bodegas = None
+        if options['bodegas']:
+            bodegas = list(Bodega.objects.filter(nombre__in=options['bodegas']))
+            faltantes = set(options['bodegas']) - {bodega.nombre for bodega in bodegas}
+            if faltantes:
+                raise CommandError(f"No existen las bodegas: {', '.join(sorted(faltantes))}.")
+
+        for instantanea in tomar_instantaneas(bodegas):
+            self.stdout.write(
+                f"{instantanea.bodega.nombre}: {instantanea.lineas.count()} productos "
+                f"(hasta el movimiento {instantanea.ultimo_movimiento_id})")
+        self.stdout.write(self.style.SUCCESS("Instantáneas guardadas."))
@@ -0,0 +1,251 @@
+"""
+Métricas de rendimiento por vista en formato de texto de Prometheus.
+
+MetricasMiddleware mide cada petición: duración total, consultas a la base de
+datos (cantidad y tiempo) y tiempo de render de la plantilla, y las acumula
+por vista (nombre de la URL). La vista `metricas` (/metrics) las expone.
+
+Las consultas se miden con un execute_wrapper que signals.py instala en cada
+conexión al abrirse; la petición en curso se lee de una ContextVar, así que
+también se cuentan las consultas de vistas asíncronas, que corren en otros
+hilos (ver asincrono.py).
+
+Los valores viven en la memoria del proceso: con varios workers cada uno
+expone los suyos.
+"""
+import contextvars
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Límites (le) de los histogramas
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_medicion_actual = contextvars.ContextVar('medicion_actual', default=None)
+
+
+class Histograma:
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.cubetas = [0] * len(limites)
+        self.suma = 0
+        self.cantidad = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                self.cubetas[i] += 1
+                break
+        self.suma += valor
+        self.cantidad += 1
+
+    def lineas(self, nombre, etiquetas):
+        acumulado = 0
+        for limite, cantidad in zip(self.limites, self.cubetas):
+            acumulado += cantidad
+            yield f'{nombre}_bucket{_etiquetas(etiquetas, le=limite)} {acumulado}'
+        yield f'{nombre}_bucket{_etiquetas(etiquetas, le="+Inf")} {self.cantidad}'
+        yield f'{nombre}_sum{_etiquetas(etiquetas)} {_numero(self.suma)}'
+        yield f'{nombre}_count{_etiquetas(etiquetas)} {self.cantidad}'
+
+
+class Metrica:
+    """
+    Contador o histograma con valores por combinación de etiquetas.
+    """
+
+    def __init__(self, nombre, tipo, ayuda, etiquetas, limites=None):
+        self.nombre = nombre
+        self.tipo = tipo
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.limites = limites
+        self.valores = {}
+
+    def observar(self, valores_etiquetas, valor=1):
+        if self.tipo == 'counter':
+            self.valores[valores_etiquetas] = self.valores.get(valores_etiquetas, 0) + valor
+            return
+        histograma = self.valores.get(valores_etiquetas)
+        if histograma is None:
+            histograma = self.valores[valores_etiquetas] = Histograma(self.limites)
+        histograma.observar(valor)
+
+    def lineas(self):
+        yield f'# HELP {self.nombre} {self.ayuda}'
+        yield f'# TYPE {self.nombre} {self.tipo}'
+        for valores_etiquetas, valor in sorted(self.valores.items()):
+            etiquetas = dict(zip(self.etiquetas, valores_etiquetas))
+            if self.tipo == 'counter':
+                yield f'{self.nombre}{_etiquetas(etiquetas)} {_numero(valor)}'
+            else:
+                yield from valor.lineas(self.nombre, etiquetas)
+
+
+class Registro:
+
+    def __init__(self):
+        self._candado = threading.Lock()
+        self.duracion = Metrica(
+            'inventario_http_request_duration_seconds', 'histogram',
+            'Duración de las peticiones por vista.', ('vista', 'metodo'), LIMITES_SEGUNDOS)
+        self.peticiones = Metrica(
+            'inventario_http_requests_total', 'counter',
+            'Peticiones por vista y código de estado.', ('vista', 'metodo', 'estado'))
+        self.consultas = Metrica(
+            'inventario_db_queries_per_request', 'histogram',
+            'Consultas a la base de datos por petición.', ('vista',), LIMITES_CONSULTAS)
+        self.tiempo_db = Metrica(
+            'inventario_db_duration_seconds', 'histogram',
+            'Tiempo en la base de datos por petición.', ('vista',), LIMITES_SEGUNDOS)
+        self.tiempo_plantilla = Metrica(
+            'inventario_template_render_duration_seconds', 'histogram',
+            'Tiempo de render de la plantilla por petición.', ('vista',), LIMITES_SEGUNDOS)
+        self.metricas = [self.duracion, self.peticiones, self.consultas,
+                         self.tiempo_db, self.tiempo_plantilla]
+
+    def registrar(self, vista, metodo, estado, medicion, duracion):
+        with self._candado:
+            self.duracion.observar((vista, metodo), duracion)
+            self.peticiones.observar((vista, metodo, str(estado)))
+            self.consultas.observar((vista,), medicion.consultas)
+            self.tiempo_db.observar((vista,), medicion.tiempo_db)
+            if medicion.tiempo_plantilla is not None:
+                self.tiempo_plantilla.observar((vista,), medicion.tiempo_plantilla)
+
+    def exportar(self):
+        with self._candado:
+            return '\n'.join(
+                linea for metrica in self.metricas for linea in metrica.lineas()) + '\n'
+
+    def limpiar(self):
+        with self._candado:
+            for metrica in self.metricas:
+                metrica.valores.clear()
+
+
+registro = Registro()
+
+
+def _etiquetas(etiquetas, **extra):
+    etiquetas = {**etiquetas, **extra}
+    if not etiquetas:
+        return ''
+    return '{' + ','.join(
+        f'{clave}="{_escapar(valor)}"' for clave, valor in etiquetas.items()) + '}'
+
+
+def _numero(valor):
+    """
+    Valor completo de una muestra: con el formato g un contador sobre 1e6
+    perdería dígitos y rate() daría saltos.
+    """
+    if isinstance(valor, int):
+        return str(valor)
+    return repr(float(valor))
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Medicion:
+    """
+    Consultas y tiempos de una petición. Las consultas pueden llegar desde
+    varios hilos a la vez (en_paralelo), por eso el candado.
+    """
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.inicio_plantilla = None
+        self.tiempo_plantilla = None
+        self._candado = threading.Lock()
+
+    def registrar_consulta(self, duracion):
+        with self._candado:
+            self.consultas += 1
+            self.tiempo_db += duracion
+
+
+def medir_consulta(execute, sql, params, many, context):
+    """
+    execute_wrapper que suma la consulta a la medición de la petición en curso.
+    """
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.registrar_consulta(time.perf_counter() - inicio)
+
+
+class MetricasMiddleware:
+    """
+    Registra las métricas de cada petición y, con
+    settings.INVENTARIO_SERVER_TIMING activo, las agrega a la respuesta en la
+    cabecera Server-Timing (visible en las herramientas del navegador).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        return self.terminar(request, response, medicion)
+
+    async def __acall__(self, request):
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        return self.terminar(request, response, medicion)
+
+    def process_template_response(self, request, response):
+        # Se llama justo antes del render; el callback marca el final
+        medicion = _medicion_actual.get()
+        if medicion is not None:
+            medicion.inicio_plantilla = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: _fin_plantilla(medicion))
+        return response
+
+    def terminar(self, request, response, medicion):
+        # En las respuestas en streaming (exportaciones, SSE) se mide hasta
+        # que empieza el envío
+        duracion = time.perf_counter() - medicion.inicio
+        coincidencia = getattr(request, 'resolver_match', None)
+        vista = coincidencia.view_name if coincidencia else 'sin_ruta'
+        registro.registrar(vista, request.method, response.status_code, medicion, duracion)
+
+        if getattr(settings, 'INVENTARIO_SERVER_TIMING', False):
+            partes = [f'db;dur={medicion.tiempo_db * 1000:.1f};desc="{medicion.consultas} consultas"']
+            if medicion.tiempo_plantilla is not None:
+                partes.append(f'plantilla;dur={medicion.tiempo_plantilla * 1000:.1f}')
+            partes.append(f'total;dur={duracion * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(partes)
+        return response
+
+
+def _fin_plantilla(medicion):
+    medicion.tiempo_plantilla = time.perf_counter() - medicion.inicio_plantilla
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copiar_stock_a_existencias(apps, schema_editor):
+    """
+    Traslada el par Producto.bodega/Producto.cantidad a la tabla Existencia.
+    """
+    Producto = apps.get_model('inventario', 'Producto')
+    Existencia = apps.get_model('inventario', 'Existencia')
+    Existencia.objects.bulk_create(
+        Existencia(producto_id=producto_id, bodega_id=bodega_id, cantidad=cantidad)
+        for producto_id, bodega_id, cantidad in Producto.objects.filter(
+            bodega__isnull=False
+        ).values_list('id', 'bodega_id', 'cantidad')
+    )
+
+
+def copiar_existencias_a_stock(apps, schema_editor):
+    Producto = apps.get_model('inventario', 'Producto')
+    Existencia = apps.get_model('inventario', 'Existencia')
+    for existencia in Existencia.objects.order_by('producto', '-cantidad'):
+        Producto.objects.filter(pk=existencia.producto_id, bodega__isnull=True).update(
+            bodega_id=existencia.bodega_id, cantidad=existencia.cantidad)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0005_alter_movimientodetalle_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Existencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('bodega', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='existencias', to='inventario.bodega')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='existencias', to='inventario.producto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('producto', 'bodega'), name='existencia_producto_bodega_unica')],
+            },
+        ),
+        migrations.RunPython(copiar_stock_a_existencias, copiar_existencias_a_stock),
+        migrations.RemoveField(
+            model_name='producto',
+            name='bodega',
+        ),
+        migrations.RemoveField(
+            model_name='producto',
+            name='cantidad',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:06
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def calcular_totales(apps, schema_editor):
+    Bodega = apps.get_model('inventario', 'Bodega')
+    Existencia = apps.get_model('inventario', 'Existencia')
+    totales = Existencia.objects.values('bodega').annotate(total=Sum('cantidad'))
+    for fila in totales:
+        Bodega.objects.filter(pk=fila['bodega']).update(total_unidades=fila['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0006_existencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bodega',
+            name='total_unidades',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(calcular_totales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:10
+
+from django.db import migrations, models
+
+
+def iniciar_secuencia(apps, schema_editor):
+    """
+    Continúa la secuencia 'MOV-' después de los códigos generados desde el pk.
+    """
+    Movimiento = apps.get_model('inventario', 'Movimiento')
+    SecuenciaCodigo = apps.get_model('inventario', 'SecuenciaCodigo')
+    numeros = [
+        int(codigo[4:])
+        for codigo in Movimiento.objects.filter(
+            codigo__startswith='MOV-').values_list('codigo', flat=True)
+        if codigo[4:].isdigit()
+    ]
+    if numeros:
+        SecuenciaCodigo.objects.create(prefijo='MOV-', ultimo=max(numeros))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0007_bodega_total_unidades'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaCodigo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefijo', models.CharField(max_length=30, unique=True)),
+                ('ultimo', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='movimiento',
+            name='codigo',
+            field=models.CharField(blank=True, max_length=40, unique=True),
+        ),
+        migrations.RunPython(iniciar_secuencia, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0008_secuenciacodigo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='autor',
+            index=models.Index(fields=['nombre', 'id'], name='autor_nombre_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimiento',
+            index=models.Index(fields=['fecha', 'id'], name='movimiento_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['titulo', 'id'], name='producto_titulo_id_idx'),
+        ),
+    ]
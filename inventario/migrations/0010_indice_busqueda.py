@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# Estructura y carga inicial del índice de búsqueda (ver inventario/busqueda.py).
+# El SQL va aquí y no se importa de busqueda.py para que la migración no cambie
+# si ese módulo cambia.
+
+SQLITE_CREAR = [
+    "CREATE VIRTUAL TABLE inventario_producto_fts USING fts5("
+    "titulo, descripcion, autores, editorial, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+
+    "INSERT INTO inventario_producto_fts (rowid, titulo, descripcion, autores, editorial) "
+    "SELECT p.id, p.titulo, p.descripcion, "
+    "COALESCE((SELECT group_concat(a.nombre, ' ') FROM inventario_producto_autores pa "
+    "INNER JOIN inventario_autor a ON a.id = pa.autor_id WHERE pa.producto_id = p.id), ''), "
+    "e.nombre "
+    "FROM inventario_producto p INNER JOIN inventario_editorial e ON e.id = p.editorial_id",
+]
+
+SQLITE_ELIMINAR = ["DROP TABLE IF EXISTS inventario_producto_fts"]
+
+POSTGRESQL_CREAR = [
+    "CREATE TABLE inventario_producto_busqueda ("
+    "producto_id bigint PRIMARY KEY REFERENCES inventario_producto (id) "
+    "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "documento tsvector NOT NULL)",
+
+    "CREATE INDEX inventario_producto_busqueda_documento_gin "
+    "ON inventario_producto_busqueda USING gin (documento)",
+
+    "INSERT INTO inventario_producto_busqueda (producto_id, documento) "
+    "SELECT p.id, "
+    "setweight(to_tsvector('spanish', p.titulo), 'A') || "
+    "setweight(to_tsvector('spanish', p.descripcion), 'D') || "
+    "setweight(to_tsvector('spanish', COALESCE((SELECT string_agg(a.nombre, ' ') "
+    "FROM inventario_producto_autores pa INNER JOIN inventario_autor a ON a.id = pa.autor_id "
+    "WHERE pa.producto_id = p.id), '')), 'B') || "
+    "setweight(to_tsvector('spanish', e.nombre), 'C') "
+    "FROM inventario_producto p INNER JOIN inventario_editorial e ON e.id = p.editorial_id",
+]
+
+POSTGRESQL_ELIMINAR = ["DROP TABLE IF EXISTS inventario_producto_busqueda"]
+
+
+def _ejecutar(schema_editor, sentencias):
+    for sentencia in sentencias.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sentencia)
+
+
+def crear_indice(apps, schema_editor):
+    # Con otros motores la búsqueda usa icontains y no hay índice
+    _ejecutar(schema_editor, {'sqlite': SQLITE_CREAR, 'postgresql': POSTGRESQL_CREAR})
+
+
+def eliminar_indice(apps, schema_editor):
+    _ejecutar(schema_editor, {'sqlite': SQLITE_ELIMINAR, 'postgresql': POSTGRESQL_ELIMINAR})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0009_indices_paginacion'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:15
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalizar(texto):
+    # Copia de inventario.models.normalizar al crear el campo: la migración no
+    # debe cambiar si esa función cambia
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def normalizar_titulos(apps, schema_editor):
+    Producto = apps.get_model('inventario', 'Producto')
+    productos = list(Producto.objects.only('id', 'titulo'))
+    for producto in productos:
+        producto.titulo_normalizado = normalizar(producto.titulo)
+    Producto.objects.bulk_update(productos, ['titulo_normalizado'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0010_indice_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='titulo_normalizado',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(normalizar_titulos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+from django.utils import timezone
+
+
+def instantanea_inicial(apps, schema_editor):
+    """
+    Parte de Existencia, que es el stock real, por si el historial de
+    movimientos anterior no lo explica por completo.
+    """
+    Bodega = apps.get_model('inventario', 'Bodega')
+    Existencia = apps.get_model('inventario', 'Existencia')
+    Movimiento = apps.get_model('inventario', 'Movimiento')
+    InstantaneaStock = apps.get_model('inventario', 'InstantaneaStock')
+    LineaInstantanea = apps.get_model('inventario', 'LineaInstantanea')
+
+    ultimo = Movimiento.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+    fecha = timezone.now()
+    for bodega in Bodega.objects.all():
+        instantanea = InstantaneaStock.objects.create(
+            bodega=bodega, fecha=fecha, ultimo_movimiento_id=ultimo)
+        LineaInstantanea.objects.bulk_create(
+            LineaInstantanea(instantanea=instantanea, producto_id=producto_id, cantidad=cantidad)
+            for producto_id, cantidad in Existencia.objects.filter(
+                bodega=bodega, cantidad__gt=0).values_list('producto_id', 'cantidad')
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0013_producto_codigo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstantaneaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField()),
+                ('ultimo_movimiento_id', models.BigIntegerField(default=0)),
+                ('bodega', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='instantaneas', to='inventario.bodega')),
+            ],
+            options={
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LineaInstantanea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('instantanea', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='inventario.instantaneastock')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventario.producto')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='instantaneastock',
+            index=models.Index(fields=['bodega', 'fecha'], name='instantanea_bodega_fecha_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='lineainstantanea',
+            constraint=models.UniqueConstraint(fields=('instantanea', 'producto'), name='linea_instantanea_producto_unica'),
+        ),
+        migrations.RunPython(instantanea_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0014_instantaneastock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='existencia',
+            index=models.Index(fields=['bodega', 'producto', 'cantidad'], name='existencia_bodega_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['editorial', 'tipo'], name='producto_editorial_tipo_idx'),
+        ),
+    ]
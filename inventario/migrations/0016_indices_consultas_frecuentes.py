@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0015_indices_informe_bodega'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimiento',
+            index=models.Index(fields=['bodega_destino', 'fecha', 'id'], name='movimiento_destino_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimiento',
+            index=models.Index(fields=['bodega_origen', 'fecha', 'id'], name='movimiento_origen_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientodetalle',
+            index=models.Index(fields=['movimiento', 'producto', 'cantidad'], name='detalle_movimiento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientodetalle',
+            index=models.Index(fields=['producto', 'movimiento'], name='detalle_producto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['tipo', 'id'], name='producto_tipo_id_idx'),
+        ),
+    ]
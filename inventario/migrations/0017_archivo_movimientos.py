@@ -0,0 +1,71 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0016_indices_consultas_frecuentes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodoArchivado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('corte', models.DateTimeField()),
+                ('ultimo_movimiento_id', models.BigIntegerField(unique=True)),
+                ('ultima_fecha', models.DateTimeField()),
+                ('movimientos', models.PositiveIntegerField(default=0)),
+                ('detalles', models.PositiveIntegerField(default=0)),
+                ('archivado', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='movimiento',
+            options={},
+        ),
+        migrations.CreateModel(
+            name='MovimientoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fecha', models.DateTimeField()),
+                ('codigo', models.CharField(blank=True, max_length=40, unique=True)),
+                ('bodega_destino', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventario.bodega')),
+                ('bodega_origen', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventario.bodega')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DetalleArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('cantidad', models.PositiveIntegerField()),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventario.producto')),
+                ('movimiento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detalles', to='inventario.movimientoarchivado')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='movimientoarchivado',
+            index=models.Index(fields=['fecha', 'id'], name='archivado_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoarchivado',
+            index=models.Index(fields=['bodega_destino', 'fecha', 'id'], name='archivado_destino_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoarchivado',
+            index=models.Index(fields=['bodega_origen', 'fecha', 'id'], name='archivado_origen_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detallearchivado',
+            index=models.Index(fields=['movimiento', 'producto', 'cantidad'], name='detalle_archivado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detallearchivado',
+            index=models.Index(fields=['producto', 'movimiento'], name='detalle_archivado_producto_idx'),
+        ),
+    ]
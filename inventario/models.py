@@ -1,7 +1,23 @@
-from django.db import models
+import unicodedata
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Now
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .eventos import publicar_stock
+
+
+def normalizar(texto):
+    """
+    Minúsculas y sin tildes, para comparar por prefijo sin distinguir
+    mayúsculas ni acentos.
+    """
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
 
 
 # -----------------------------------
@@ -23,6 +39,12 @@ class Autor(models.Model):
     def __str__(self):
         return self.nombre
 
+    class Meta:
+        indexes = [
+            # Orden estable para la paginación por cursor del listado
+            models.Index(fields=['nombre', 'id'], name='autor_nombre_id_idx'),
+        ]
+
 
 # -----------------------------------
 # Modelo Producto
@@ -34,21 +56,88 @@ class Producto(models.Model):
         ('enciclopedia', 'Enciclopedia'),
     ]
     tipo = models.CharField(max_length=20, choices=TIPO_PRODUCTO)
+    # Código externo (ISBN, ISSN o SKU); identifica el producto al importar el catálogo
+    codigo = models.CharField(max_length=64, unique=True, null=True, blank=True)
     titulo = models.CharField(max_length=255)
+    # Título normalizado e indexado para el autocompletado por prefijo
+    titulo_normalizado = models.CharField(
+        max_length=255, db_index=True, editable=False, default='')
     editorial = models.ForeignKey('Editorial', on_delete=models.PROTECT)
     autores = models.ManyToManyField('Autor')
     descripcion = models.TextField(blank=True)
-    bodega = models.ForeignKey(
-        'Bodega', on_delete=models.SET_NULL, null=True, blank=True,
-        related_name='productos'
-    )
-    cantidad = models.PositiveIntegerField(default=0)  # Nueva cantidad
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        self.titulo_normalizado = normalizar(self.titulo)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'titulo' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'titulo_normalizado'}
+        super().save(*args, **kwargs)
+
+    def cantidad_disponible_en_bodega(self, bodega):
+        """
+        Retorna el stock del producto en la bodega indicada (una sola búsqueda indexada).
+        """
+        cantidad = Existencia.objects.filter(
+            producto=self, bodega=bodega
+        ).values_list('cantidad', flat=True).first()
+        return cantidad or 0
+
+    def actualizar_stock(self, bodega, delta):
+        """
+        Suma (o resta, si delta es negativo) unidades al stock de la bodega
+        con un incremento atómico en la base de datos, junto con el total de
+        la bodega.
+        """
+        with transaction.atomic():
+            # La fila de la bodega se bloquea antes que la existencia, en el
+            # mismo orden que usa stock.py
+            Bodega.bloquear(bodega)
+            self._actualizar_existencia(bodega, delta)
+            Bodega.objects.filter(pk=bodega.pk).update(
+                total_unidades=F('total_unidades') + delta, actualizado=Now())
+            publicar_stock(bodega, {self.pk: delta})
+
+    def _actualizar_existencia(self, bodega, delta):
+        existencia = Existencia.objects.filter(producto=self, bodega=bodega)
+        if delta < 0:
+            # UPDATE condicional: nunca deja el stock negativo aunque otra
+            # transacción haya descontado después de la validación
+            existencia = existencia.filter(cantidad__gte=-delta)
+        actualizadas = existencia.update(cantidad=F('cantidad') + delta, actualizado=Now())
+        if actualizadas:
+            return
+        if delta < 0:
+            disponible = self.cantidad_disponible_en_bodega(bodega)
+            if not disponible:
+                raise ValidationError(
+                    f"El producto '{self.titulo}' no tiene stock en la bodega '{bodega}'."
+                )
+            raise ValidationError(
+                f"No hay suficiente stock de '{self.titulo}'. Disponible: {disponible}."
+            )
+        try:
+            with transaction.atomic():
+                Existencia.objects.create(
+                    producto=self, bodega=bodega, cantidad=delta)
+        except IntegrityError:
+            # Otra transacción creó la fila entre el UPDATE y el INSERT
+            Existencia.objects.filter(
+                producto=self, bodega=bodega
+            ).update(cantidad=F('cantidad') + delta, actualizado=Now())
 
     def __str__(self):
-        return f"{self.titulo} ({self.cantidad})"
+        return self.titulo
 
     class Meta:
         ordering = ['titulo']
+        indexes = [
+            models.Index(fields=['titulo', 'id'], name='producto_titulo_id_idx'),
+            # Informe por bodega filtrado por editorial y tipo
+            models.Index(fields=['editorial', 'tipo'], name='producto_editorial_tipo_idx'),
+            # Filtro por tipo con el orden por id de la API
+            models.Index(fields=['tipo', 'id'], name='producto_tipo_id_idx'),
+        ]
 
 
 # -----------------------------------
@@ -56,24 +145,62 @@ class Producto(models.Model):
 # -----------------------------------
 class Bodega(models.Model):
     nombre = models.CharField(max_length=255, unique=True)
+    # Total de unidades mantenido por Producto.actualizar_stock en la misma
+    # transacción que modifica Existencia.
+    total_unidades = models.PositiveBigIntegerField(default=0, editable=False)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+
+    @classmethod
+    def bloquear(cls, *bodegas):
+        """
+        Bloquea las filas de las bodegas hasta el fin de la transacción, en
+        orden de id. Toda operación que modifica stock bloquea primero sus
+        bodegas así; como cada bodega se bloquea antes que sus existencias y
+        siempre en el mismo orden, dos movimientos cruzados (A->B y B->A)
+        esperan uno al otro en lugar de bloquearse mutuamente.
+        """
+        ids = sorted({bodega.pk for bodega in bodegas if bodega is not None})
+        list(cls.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', flat=True))
 
     def productos_en_bodega(self):
         """
-        Retorna los productos con sus cantidades asociadas a esta bodega.
+        Retorna las existencias con stock (producto y cantidad) de esta bodega.
         """
-        return MovimientoDetalle.objects.filter(
-            movimiento__bodega_destino=self
-        ).select_related('producto')
+        return self.existencias.filter(cantidad__gt=0).select_related('producto')
 
     def total_productos(self):
         """
         Retorna la cantidad total de productos almacenados en esta bodega.
         """
-        return sum(
-            detalle.cantidad for detalle in MovimientoDetalle.objects.filter(
-                movimiento__bodega_destino=self
-            )
+        return self.total_unidades
+
+    def calcular_total_productos(self):
+        """
+        Calcula el total de unidades con un SUM sobre Existencia, sin usar el
+        total mantenido.
+        """
+        return self.existencias.aggregate(total=Sum('cantidad'))['total'] or 0
+
+    @classmethod
+    def recalcular_totales(cls, corregir=True):
+        """
+        Compara el total mantenido de cada bodega con el calculado desde
+        Existencia. Retorna las diferencias como (bodega, mantenido, calculado)
+        y, si corregir es True, las corrige.
+        """
+        calculados = dict(
+            Existencia.objects.values('bodega').annotate(
+                total=Sum('cantidad')).values_list('bodega', 'total')
         )
+        diferencias = []
+        for bodega in cls.objects.all():
+            calculado = calculados.get(bodega.pk) or 0
+            if bodega.total_unidades != calculado:
+                diferencias.append((bodega, bodega.total_unidades, calculado))
+                if corregir:
+                    cls.objects.filter(pk=bodega.pk).update(
+                        total_unidades=calculado, actualizado=Now())
+        return diferencias
 
     def __str__(self):
         return self.nombre
@@ -82,6 +209,112 @@ class Bodega(models.Model):
         ordering = ['nombre']
 
 
+# -----------------------------------
+# Modelo Existencia
+# -----------------------------------
+class Existencia(models.Model):
+    """
+    Stock de un producto en una bodega. Es la única fuente para leer stock.
+    """
+    producto = models.ForeignKey(
+        'Producto', on_delete=models.CASCADE, related_name='existencias')
+    bodega = models.ForeignKey(
+        'Bodega', on_delete=models.CASCADE, related_name='existencias')
+    cantidad = models.PositiveIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.producto.titulo} en {self.bodega}: {self.cantidad}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['producto', 'bodega'], name='existencia_producto_bodega_unica'),
+        ]
+        indexes = [
+            # Productos de una bodega: incluye la cantidad para resolver el
+            # filtro de stock y el resumen sin leer la tabla
+            models.Index(fields=['bodega', 'producto', 'cantidad'], name='existencia_bodega_idx'),
+        ]
+
+
+# -----------------------------------
+# Modelo InstantaneaStock
+# -----------------------------------
+class InstantaneaStock(models.Model):
+    """
+    Foto del stock de una bodega que incluye exactamente los movimientos con
+    id <= ultimo_movimiento_id. Ver instantaneas.py.
+    """
+    bodega = models.ForeignKey(
+        'Bodega', on_delete=models.CASCADE, related_name='instantaneas')
+    fecha = models.DateTimeField()
+    # No es clave foránea: la instantánea sigue siendo válida aunque los
+    # movimientos antiguos se archiven o eliminen
+    ultimo_movimiento_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Stock de {self.bodega} al {self.fecha:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['bodega', 'fecha'], name='instantanea_bodega_fecha_idx'),
+        ]
+
+
+class LineaInstantanea(models.Model):
+    instantanea = models.ForeignKey(
+        'InstantaneaStock', on_delete=models.CASCADE, related_name='lineas')
+    producto = models.ForeignKey(
+        'Producto', on_delete=models.CASCADE, related_name='+')
+    cantidad = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['instantanea', 'producto'], name='linea_instantanea_producto_unica'),
+        ]
+
+
+# -----------------------------------
+# Modelo SecuenciaCodigo
+# -----------------------------------
+class SecuenciaCodigo(models.Model):
+    """
+    Último número asignado para cada prefijo de código de movimiento.
+    """
+    prefijo = models.CharField(max_length=30, unique=True)
+    ultimo = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def reservar(cls, prefijo, cantidad=1):
+        """
+        Reserva un bloque de `cantidad` números consecutivos para el prefijo y
+        lo retorna como range.
+
+        El UPDATE bloquea la fila del prefijo hasta el fin de la transacción que
+        lo envuelve: si esa transacción falla, los números vuelven a quedar
+        libres y la secuencia no tiene huecos.
+        """
+        with transaction.atomic(savepoint=False):
+            actualizadas = cls.objects.filter(prefijo=prefijo).update(
+                ultimo=F('ultimo') + cantidad)
+            if not actualizadas:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(prefijo=prefijo, ultimo=cantidad)
+                except IntegrityError:
+                    cls.objects.filter(prefijo=prefijo).update(
+                        ultimo=F('ultimo') + cantidad)
+            ultimo = cls.objects.filter(prefijo=prefijo).values_list(
+                'ultimo', flat=True).get()
+        return range(ultimo - cantidad + 1, ultimo + 1)
+
+    def __str__(self):
+        return f"{self.prefijo}{self.ultimo}"
+
+
 # -----------------------------------
 # Modelo Movimiento
 # -----------------------------------
@@ -94,7 +327,7 @@ class Movimiento(models.Model):
     usuario = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     fecha = models.DateTimeField(auto_now_add=True)
-    codigo = models.CharField(max_length=10, unique=True, blank=True)
+    codigo = models.CharField(max_length=40, unique=True, blank=True)
 
     def clean(self):
         """
@@ -105,21 +338,54 @@ class Movimiento(models.Model):
                 "La bodega de origen y destino no pueden ser la misma."
             )
 
+    def prefijo_codigo(self):
+        """
+        Prefijo del código según settings.INVENTARIO_PREFIJO_MOVIMIENTO, que
+        acepta {anio} y {bodega} (bodega de origen o, si no hay, de destino).
+        """
+        formato = getattr(settings, 'INVENTARIO_PREFIJO_MOVIMIENTO', 'MOV-')
+        bodega = self.bodega_origen_id or self.bodega_destino_id or 0
+        anio = (self.fecha or timezone.now()).year
+        return formato.format(anio=anio, bodega=bodega)
+
+    @classmethod
+    def asignar_codigos(cls, movimientos):
+        """
+        Asigna códigos a varios movimientos aún no guardados reservando un
+        bloque por prefijo, para cargas masivas con bulk_create.
+        """
+        por_prefijo = {}
+        for movimiento in movimientos:
+            if not movimiento.codigo:
+                por_prefijo.setdefault(movimiento.prefijo_codigo(), []).append(movimiento)
+        for prefijo, grupo in por_prefijo.items():
+            numeros = SecuenciaCodigo.reservar(prefijo, len(grupo))
+            for movimiento, numero in zip(grupo, numeros):
+                movimiento.codigo = f"{prefijo}{numero:05d}"
+
     def save(self, *args, **kwargs):
         """
-        Genera un código único para cada movimiento al guardarlo.
+        Genera un código único para cada movimiento y lo guarda en el mismo INSERT.
         """
-        if not self.pk:  # Si el objeto no tiene un pk, lo guarda primero
+        if self.codigo:
+            return super().save(*args, **kwargs)
+        # La reserva del número y el INSERT comparten transacción
+        with transaction.atomic():
+            self.asignar_codigos([self])
             super().save(*args, **kwargs)
-        if not self.codigo:  # Si no tiene un código, lo genera usando el pk
-            self.codigo = f"MOV-{self.pk:05d}"  # Código único basado en el ID
-            super().save(*args, **kwargs)  # Guarda nuevamente para actualizar el código
 
     def __str__(self):
         return f"Movimiento {self.codigo} de {self.bodega_origen} a {self.bodega_destino}"
 
     class Meta:
-        ordering = ['-fecha']  # Últimos movimientos primero
+        # Sin ordering por defecto: ordenar por fecha toda la tabla en cada
+        # consulta sin order_by sale caro; los listados ordenan explícitamente
+        indexes = [
+            models.Index(fields=['fecha', 'id'], name='movimiento_fecha_id_idx'),
+            # Movimientos de una bodega por fecha (listados, stock a una fecha)
+            models.Index(fields=['bodega_destino', 'fecha', 'id'], name='movimiento_destino_fecha_idx'),
+            models.Index(fields=['bodega_origen', 'fecha', 'id'], name='movimiento_origen_fecha_idx'),
+        ]
 
 
 # -----------------------------------
@@ -140,15 +406,16 @@ class MovimientoDetalle(models.Model):
             return  # No realizar validaciones si no está asignado todavía
 
         if self.movimiento.bodega_origen:
+            stock_disponible = self.producto.cantidad_disponible_en_bodega(
+                self.movimiento.bodega_origen)
+
             # Verificar si el producto está en la bodega de origen
-            if self.producto.bodega != self.movimiento.bodega_origen:
+            if not stock_disponible:
                 raise ValidationError(
                     f"El producto '{self.producto.titulo}' no está en la bodega de origen '{self.movimiento.bodega_origen}'."
                 )
 
             # Verificar disponibilidad de stock
-            stock_disponible = self.producto.cantidad_disponible_en_bodega(
-                self.movimiento.bodega_origen)
             if self.cantidad > stock_disponible:
                 raise ValidationError(
                     f"No hay suficiente stock de '{self.producto.titulo}'. Disponible: {stock_disponible}."
@@ -158,32 +425,106 @@ class MovimientoDetalle(models.Model):
         """
         Actualiza el stock al guardar un detalle de movimiento.
         """
-        if not self.pk:  # Si es una creación
-            if self.movimiento.bodega_origen:
-                self.producto.actualizar_stock(
-                    self.movimiento.bodega_origen, -self.cantidad)
-            if self.movimiento.bodega_destino:
-                self.producto.actualizar_stock(
-                    self.movimiento.bodega_destino, self.cantidad)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.pk:  # Si es una creación
+                Bodega.bloquear(self.movimiento.bodega_origen, self.movimiento.bodega_destino)
+                if self.movimiento.bodega_origen:
+                    self.producto.actualizar_stock(
+                        self.movimiento.bodega_origen, -self.cantidad)
+                if self.movimiento.bodega_destino:
+                    self.producto.actualizar_stock(
+                        self.movimiento.bodega_destino, self.cantidad)
+            super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
         """
         Revertir el stock si se elimina el movimiento.
         """
-        if self.movimiento.bodega_origen:
-            self.producto.actualizar_stock(
-                self.movimiento.bodega_origen, self.cantidad)
-        if self.movimiento.bodega_destino:
-            self.producto.actualizar_stock(
-                self.movimiento.bodega_destino, -self.cantidad)
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            Bodega.bloquear(self.movimiento.bodega_origen, self.movimiento.bodega_destino)
+            if self.movimiento.bodega_origen:
+                self.producto.actualizar_stock(
+                    self.movimiento.bodega_origen, self.cantidad)
+            if self.movimiento.bodega_destino:
+                self.producto.actualizar_stock(
+                    self.movimiento.bodega_destino, -self.cantidad)
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.cantidad} de {self.producto.titulo} en movimiento {self.movimiento.codigo}"
 
     class Meta:
         ordering = ['movimiento', 'producto']
+        indexes = [
+            # Cubre las sumas por producto de los detalles de un movimiento
+            # (stock a una fecha, exportaciones) sin leer la tabla
+            models.Index(fields=['movimiento', 'producto', 'cantidad'], name='detalle_movimiento_idx'),
+            # Historial de un producto
+            models.Index(fields=['producto', 'movimiento'], name='detalle_producto_idx'),
+        ]
+
+
+# -----------------------------------
+# Archivo de movimientos
+# -----------------------------------
+class PeriodoArchivado(models.Model):
+    """
+    Corte del archivo: los movimientos con id <= ultimo_movimiento_id y sus
+    detalles se movieron a MovimientoArchivado y DetalleArchivado. Ver
+    archivo.py.
+    """
+    corte = models.DateTimeField()
+    ultimo_movimiento_id = models.BigIntegerField(unique=True)
+    # Fecha del movimiento archivado más reciente: las consultas desde esta
+    # fecha en adelante no necesitan el archivo
+    ultima_fecha = models.DateTimeField()
+    movimientos = models.PositiveIntegerField(default=0)
+    detalles = models.PositiveIntegerField(default=0)
+    archivado = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Movimientos anteriores al {self.corte:%Y-%m-%d}"
+
+
+class MovimientoArchivado(models.Model):
+    """
+    Movimiento de un período cerrado, con el mismo id y campos que tenía en
+    Movimiento.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    bodega_origen = models.ForeignKey(
+        Bodega, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    bodega_destino = models.ForeignKey(
+        Bodega, on_delete=models.SET_NULL, null=True, related_name='+')
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    fecha = models.DateTimeField()
+    codigo = models.CharField(max_length=40, unique=True, blank=True)
+
+    def __str__(self):
+        return f"Movimiento archivado {self.codigo}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha', 'id'], name='archivado_fecha_id_idx'),
+            models.Index(fields=['bodega_destino', 'fecha', 'id'], name='archivado_destino_fecha_idx'),
+            models.Index(fields=['bodega_origen', 'fecha', 'id'], name='archivado_origen_fecha_idx'),
+        ]
+
+
+class DetalleArchivado(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    movimiento = models.ForeignKey(
+        MovimientoArchivado, on_delete=models.CASCADE, related_name='detalles')
+    producto = models.ForeignKey(
+        Producto, on_delete=models.CASCADE, related_name='+')
+    cantidad = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['movimiento', 'producto', 'cantidad'], name='detalle_archivado_idx'),
+            models.Index(fields=['producto', 'movimiento'], name='detalle_archivado_producto_idx'),
+        ]
 
 
 # -----------------------------------
@@ -0,0 +1,174 @@
+"""
+Paginación por cursor (keyset) para las vistas de listado.
+
+En lugar de OFFSET, cada página filtra por los valores de orden de la última
+(o primera) fila de la página anterior, así que la página 500 cuesta lo mismo
+que la primera siempre que el orden esté respaldado por un índice.
+"""
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import SimpleLazyObject
+
+PARAMETROS_PAGINACION = ('orden', 'por_pagina', 'despues', 'antes')
+
+
+class PaginaCursor:
+    """
+    Una página de resultados con los cursores para moverse desde ella.
+    """
+
+    def __init__(self, objetos, siguiente, anterior, orden, por_pagina, vista):
+        self.objetos = objetos
+        self.siguiente = siguiente
+        self.anterior = anterior
+        self.orden = orden
+        self.por_pagina = por_pagina
+        self.ordenamientos = vista.ordenamientos
+        self.opciones_por_pagina = vista.opciones_por_pagina
+        # Otros parámetros GET (filtros) que el formulario de orden conserva
+        self.parametros_filtro = [
+            (clave, valor)
+            for clave, valores in vista.request.GET.lists()
+            if clave not in PARAMETROS_PAGINACION
+            for valor in valores
+        ]
+
+    @property
+    def tiene_otras_paginas(self):
+        return bool(self.siguiente or self.anterior)
+
+
+class PaginacionCursorMixin:
+    """
+    Mixin para ListView. Parámetros GET:
+
+    - orden: clave de `ordenamientos`.
+    - por_pagina: tamaño de página, limitado a `max_por_pagina`.
+    - despues / antes: cursor de la página siguiente / anterior.
+
+    `ordenamientos` asocia cada clave con (etiqueta, campos). Los campos deben
+    ser columnas no nulas del modelo y terminar en una única (normalmente id),
+    para que el orden sea estable.
+    """
+    ordenamientos = {}
+    orden_por_defecto = None
+    por_pagina = 25
+    opciones_por_pagina = (10, 25, 50, 100)
+    max_por_pagina = 100
+
+    def get_orden(self):
+        orden = self.request.GET.get('orden')
+        return orden if orden in self.ordenamientos else self.orden_por_defecto
+
+    def get_por_pagina(self):
+        try:
+            por_pagina = int(self.request.GET.get('por_pagina', self.por_pagina))
+        except ValueError:
+            return self.por_pagina
+        return max(1, min(por_pagina, self.max_por_pagina))
+
+    def get_context_data(self, **kwargs):
+        # La página se consulta al usarla en la plantilla: si esta toma la
+        # tabla de la caché de fragmentos, no se consulta
+        pagina = SimpleLazyObject(lambda: self.paginar(self.object_list))
+        kwargs['object_list'] = SimpleLazyObject(lambda: pagina.objetos)
+        context = super().get_context_data(**kwargs)
+        context['pagina'] = pagina
+        return context
+
+    def paginar(self, queryset):
+        orden = self.get_orden()
+        campos = self.ordenamientos[orden][1]
+        por_pagina = self.get_por_pagina()
+
+        hacia_atras = 'antes' in self.request.GET
+        cursor = _leer_cursor(
+            self.request.GET.get('antes' if hacia_atras else 'despues'), len(campos))
+
+        # Hacia atrás se recorre con el orden invertido y luego se da vuelta
+        campos_consulta = [_invertir(campo) for campo in campos] if hacia_atras else campos
+        filtro = None
+        if cursor is not None:
+            try:
+                filtro = _filtro_keyset(queryset.model, campos_consulta, cursor)
+            except (ValidationError, ValueError, TypeError):
+                cursor = None
+        if cursor is None:
+            # Un cursor ausente o inválido lleva a la primera página
+            hacia_atras = False
+            campos_consulta = campos
+
+        queryset = queryset.order_by(*campos_consulta)
+        if filtro is not None:
+            queryset = queryset.filter(filtro)
+
+        objetos = list(queryset[:por_pagina + 1])
+        hay_mas = len(objetos) > por_pagina
+        objetos = objetos[:por_pagina]
+        if hacia_atras:
+            objetos.reverse()
+
+        siguiente = anterior = None
+        if objetos:
+            if hay_mas or hacia_atras:
+                siguiente = _crear_cursor(objetos[-1], campos)
+            if cursor is not None and (hay_mas or not hacia_atras):
+                anterior = _crear_cursor(objetos[0], campos)
+        return PaginaCursor(
+            objetos, siguiente, anterior, orden, por_pagina, self)
+
+
+class _CodificadorCursor(DjangoJSONEncoder):
+    # DjangoJSONEncoder recorta las fechas a milisegundos; el cursor necesita
+    # el valor exacto para que la comparación con la fila siguiente sea correcta
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _invertir(campo):
+    return campo[1:] if campo.startswith('-') else f'-{campo}'
+
+
+def _filtro_keyset(modelo, campos, valores):
+    """
+    Construye (a > x) OR (a = x AND b > y) OR ... para los campos dados,
+    usando < en los campos descendentes.
+    """
+    filtro = Q()
+    iguales = {}
+    for campo, valor in zip(campos, valores):
+        nombre = campo.lstrip('-')
+        valor = modelo._meta.get_field(nombre).to_python(valor)
+        operador = 'lt' if campo.startswith('-') else 'gt'
+        filtro |= Q(**iguales, **{f'{nombre}__{operador}': valor})
+        iguales[nombre] = valor
+    return filtro
+
+
+def _crear_cursor(objeto, campos):
+    valores = [getattr(objeto, campo.lstrip('-')) for campo in campos]
+    datos = json.dumps(valores, cls=_CodificadorCursor)
+    return base64.urlsafe_b64encode(datos.encode()).decode()
+
+
+def _leer_cursor(cursor, cantidad_campos):
+    if not cursor:
+        return None
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(valores, list) or len(valores) != cantidad_campos:
+        return None
+    # Los campos de orden no son nulos: un null o una lista solo puede venir
+    # de un cursor adulterado
+    if not all(isinstance(valor, (str, int, float)) for valor in valores):
+        return None
+    return valores
@@ -0,0 +1,50 @@
+from rest_framework import serializers
+
+from .models import Bodega, Existencia, Movimiento, MovimientoDetalle, Producto
+
+
+class CamposDinamicosMixin:
+    """
+    Permite pedir solo algunos campos con ?fields=id,titulo,...
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        campos = request.query_params.get('fields') if request else None
+        if campos:
+            pedidos = {campo.strip() for campo in campos.split(',')}
+            for nombre in set(self.fields) - pedidos:
+                self.fields.pop(nombre)
+
+
+class ProductoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Producto
+        fields = ['id', 'tipo', 'codigo', 'titulo', 'descripcion', 'editorial', 'autores', 'actualizado']
+
+
+class BodegaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Bodega
+        fields = ['id', 'nombre', 'total_unidades', 'actualizado']
+
+
+class ExistenciaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Existencia
+        fields = ['id', 'producto', 'bodega', 'cantidad', 'actualizado']
+
+
+class MovimientoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    usuario = serializers.SlugRelatedField(slug_field='username', read_only=True)
+
+    class Meta:
+        model = Movimiento
+        fields = ['id', 'codigo', 'fecha', 'bodega_origen', 'bodega_destino', 'usuario']
+
+
+class MovimientoDetalleSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    class Meta:
+        model = MovimientoDetalle
+        fields = ['id', 'movimiento', 'producto', 'cantidad']
@@ -0,0 +1,88 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import busqueda, cache, consultas, metricas
+from .models import Autor, Bodega, Editorial, Movimiento, MovimientoDetalle, Producto
+
+
+# -----------------------------------
+# Índice de búsqueda de productos
+# -----------------------------------
+
+@receiver(post_save, sender=Producto)
+def indexar_producto(sender, instance, raw=False, **kwargs):
+    if not raw:
+        busqueda.indexar_al_confirmar([instance.pk])
+
+
+@receiver(post_delete, sender=Producto)
+def desindexar_producto(sender, instance, **kwargs):
+    busqueda.eliminar_productos([instance.pk])
+
+
+@receiver(m2m_changed, sender=Producto.autores.through)
+def indexar_autores_de_producto(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        busqueda.indexar_al_confirmar([instance.pk])
+    elif pk_set:
+        busqueda.indexar_al_confirmar(pk_set)
+
+
+@receiver(post_save, sender=Autor)
+def indexar_productos_de_autor(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        busqueda.indexar_al_confirmar(
+            instance.producto_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Autor)
+def recordar_productos_de_autor(sender, instance, **kwargs):
+    instance._productos_a_indexar = list(
+        instance.producto_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Autor)
+def indexar_productos_sin_autor(sender, instance, **kwargs):
+    busqueda.indexar_al_confirmar(getattr(instance, '_productos_a_indexar', []))
+
+
+@receiver(post_save, sender=Editorial)
+def indexar_productos_de_editorial(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        busqueda.indexar_al_confirmar(
+            instance.producto_set.values_list('pk', flat=True))
+
+
+# -----------------------------------
+# Caché de informes
+# -----------------------------------
+
+def invalidar_cache(sender, **kwargs):
+    cache.invalidar(sender)
+
+
+for modelo in (Producto, Movimiento, MovimientoDetalle, Bodega, Editorial, Autor):
+    post_save.connect(invalidar_cache, sender=modelo, dispatch_uid=f'invalidar_cache_{modelo.__name__}')
+    post_delete.connect(invalidar_cache, sender=modelo, dispatch_uid=f'invalidar_cache_borrado_{modelo.__name__}')
+
+
+@receiver(m2m_changed, sender=Producto.autores.through)
+def invalidar_cache_autores_de_producto(sender, action, **kwargs):
+    # Los autores se asignan después de guardar el producto
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        cache.invalidar(Producto)
+
+
+# -----------------------------------
+# Métricas de consultas
+# -----------------------------------
+
+@receiver(connection_created)
+def medir_consultas(sender, connection, **kwargs):
+    # Cada hilo abre su propia conexión; los wrappers quedan instalados en todas
+    for wrapper in (consultas.anotar_consulta, metricas.medir_consulta):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, wrapper)
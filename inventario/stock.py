@@ -0,0 +1,110 @@
+"""
+Operaciones de stock en lote sobre Existencia y Bodega.total_unidades.
+
+Orden de bloqueo, igual en todas las operaciones que modifican stock: primero
+las filas de Bodega por id (Bodega.bloquear) y después las de Existencia por
+producto. Mantenerlo evita interbloqueos entre movimientos concurrentes.
+"""
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Now
+
+from .eventos import publicar_stock
+from .models import Bodega, Existencia, MovimientoDetalle
+
+
+def registrar_movimiento(movimiento, lineas):
+    """
+    Guarda un movimiento con todas sus líneas en una sola transacción.
+
+    `lineas` es una secuencia de pares (producto, cantidad). Se valida el stock
+    de todas las líneas antes de escribir; si alguna falla se lanza
+    ValidationError con todos los errores y no se guarda nada.
+    """
+    cantidades = {}
+    productos = {}
+    for producto, cantidad in lineas:
+        cantidades[producto.pk] = cantidades.get(producto.pk, 0) + cantidad
+        productos[producto.pk] = producto
+
+    with transaction.atomic():
+        Bodega.bloquear(movimiento.bodega_origen, movimiento.bodega_destino)
+        if movimiento.bodega_origen:
+            _validar_stock(movimiento.bodega_origen, cantidades, productos)
+
+        movimiento.save()
+        MovimientoDetalle.objects.bulk_create(
+            MovimientoDetalle(movimiento=movimiento, producto=productos[pk], cantidad=cantidad)
+            for pk, cantidad in cantidades.items()
+        )
+
+        if movimiento.bodega_origen:
+            aplicar_deltas(movimiento.bodega_origen, {
+                pk: -cantidad for pk, cantidad in cantidades.items()
+            })
+        if movimiento.bodega_destino:
+            aplicar_deltas(movimiento.bodega_destino, cantidades)
+    return movimiento
+
+
+def _validar_stock(bodega, cantidades, productos):
+    """
+    Bloquea las existencias de origen una sola vez y verifica todas las líneas.
+    """
+    disponibles = dict(
+        Existencia.objects.select_for_update().filter(
+            bodega=bodega, producto_id__in=cantidades
+        ).order_by('producto_id').values_list('producto_id', 'cantidad')
+    )
+    errores = []
+    for pk, cantidad in cantidades.items():
+        disponible = disponibles.get(pk, 0)
+        if not disponible:
+            errores.append(ValidationError(
+                f"El producto '{productos[pk].titulo}' no está en la bodega de origen '{bodega}'."
+            ))
+        elif cantidad > disponible:
+            errores.append(ValidationError(
+                f"No hay suficiente stock de '{productos[pk].titulo}'. Disponible: {disponible}."
+            ))
+    if errores:
+        raise ValidationError(errores)
+
+
+def aplicar_deltas(bodega, deltas):
+    """
+    Aplica {producto_id: delta} a las existencias de una bodega con un único
+    UPDATE (CASE por producto) y actualiza el total de la bodega.
+
+    Debe llamarse dentro de una transacción con la bodega ya bloqueada y, si
+    hay deltas negativos, con el stock validado (ver registrar_movimiento).
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    nuevos = [pk for pk, delta in deltas.items() if delta > 0]
+    if nuevos:
+        # Asegura que existan las filas que van a recibir stock
+        Existencia.objects.bulk_create(
+            [Existencia(producto_id=pk, bodega=bodega, cantidad=0) for pk in nuevos],
+            ignore_conflicts=True,
+        )
+
+    # Cada WHEN usa dos parámetros y el IN uno más por producto
+    lote = (connection.features.max_query_params or len(deltas) * 3) // 3
+    items = list(deltas.items())
+    for inicio in range(0, len(items), lote):
+        parte = dict(items[inicio:inicio + lote])
+        Existencia.objects.filter(bodega=bodega, producto_id__in=parte).update(
+            cantidad=F('cantidad') + Case(
+                *(When(producto_id=pk, then=Value(delta)) for pk, delta in parte.items()),
+                output_field=IntegerField(),
+            ),
+            actualizado=Now(),
+        )
+
+    Bodega.objects.filter(pk=bodega.pk).update(
+        total_unidades=F('total_unidades') + sum(deltas.values()), actualizado=Now())
+    publicar_stock(bodega, deltas)
@@ -1,3 +1,1271 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import datetime
+import importlib
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import zipfile
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.utils import ConnectionHandler
+from django.db.models import F, Max, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import busqueda, informes, metricas
+from .archivo import archivar
+from .cache import obtener_cache
+from .eventos import hub
+from .consultas import LimiteConsultasExcedido, plan, tablas_recorridas
+from .models import (
+    Autor, Bodega, DetalleArchivado, Editorial, Existencia, InstantaneaStock, LineaInstantanea,
+    Movimiento, MovimientoArchivado, MovimientoDetalle, Producto, SecuenciaCodigo, Usuario,
+)
+from .instantaneas import stock_a_fecha, stock_producto_a_fecha, tomar_instantaneas
+from .stock import registrar_movimiento
+from .views import ProductoListView
+
+
+class InventarioTestCase(TestCase):
+    """
+    Datos base: un jefe de bodega, un bodeguero y dos bodegas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jefe = Usuario.objects.create_user(
+            'jefe', password='jefe123', is_jefe_bodega=True)
+        cls.bodeguero = Usuario.objects.create_user(
+            'bodeguero', password='bodeguero123', is_bodeguero=True)
+        cls.bodega_a = Bodega.objects.create(nombre='Bodega A')
+        cls.bodega_b = Bodega.objects.create(nombre='Bodega B')
+        cls.autor = Autor.objects.create(nombre='Autor')
+
+    def setUp(self):
+        # Los informes en caché de una prueba no deben verse en la siguiente
+        obtener_cache().clear()
+
+    def crear_catalogo(self, editoriales, productos_por_editorial):
+        """
+        Crea editoriales con productos de los tres tipos, con stock en la
+        bodega A, y un movimiento hacia la bodega B por editorial.
+        """
+        tipos = [tipo for tipo, _ in Producto.TIPO_PRODUCTO]
+        for i in range(editoriales):
+            editorial = Editorial.objects.create(nombre=f'Editorial {Editorial.objects.count()}')
+            movimiento = Movimiento(
+                bodega_origen=self.bodega_a, bodega_destino=self.bodega_b, usuario=self.bodeguero)
+            movimiento.save()
+            for j in range(productos_por_editorial):
+                producto = Producto.objects.create(
+                    tipo=tipos[j % len(tipos)], titulo=f'Titulo {i}-{j}', editorial=editorial)
+                producto.autores.add(self.autor)
+                producto.actualizar_stock(self.bodega_a, 10)
+                MovimientoDetalle(movimiento=movimiento, producto=producto, cantidad=1).save()
+
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(consultas)
+
+
+class InformesGeneralesTests(InventarioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.jefe)
+
+    def test_conteos_por_bodega_y_editorial(self):
+        self.crear_catalogo(editoriales=2, productos_por_editorial=4)
+        response = self.client.get(reverse('informes_generales'))
+
+        self.assertEqual(response.context['productos_por_bodega'], [
+            {'nombre': 'Bodega A', 'cantidad': 8},
+            {'nombre': 'Bodega B', 'cantidad': 8},
+        ])
+        self.assertEqual(response.context['productos_por_editorial'][0], {
+            'editorial': 'Editorial 0', 'libros': 2, 'revistas': 1, 'enciclopedias': 1,
+        })
+        self.assertEqual(response.context['total_productos'], 8)
+        self.assertEqual(response.context['total_unidades'], 80)
+
+    def test_cantidad_de_consultas_constante(self):
+        url = reverse('informes_generales')
+        self.crear_catalogo(editoriales=1, productos_por_editorial=1)
+        consultas_con_pocos_datos = self.contar_consultas(url)
+
+        # Las señales invalidan la caché al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_catalogo(editoriales=20, productos_por_editorial=6)
+            for i in range(10):
+                Bodega.objects.create(nombre=f'Bodega extra {i}')
+
+        self.assertEqual(self.contar_consultas(url), consultas_con_pocos_datos)
+
+    def test_cache_invalidada_por_movimientos(self):
+        url = reverse('informes_generales')
+        self.crear_catalogo(editoriales=1, productos_por_editorial=3)
+        consultas_sin_cache = self.contar_consultas(url)
+        self.assertLess(self.contar_consultas(url), consultas_sin_cache)
+
+        producto = Producto.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_movimiento(
+                Movimiento(bodega_origen=self.bodega_b, bodega_destino=self.bodega_a,
+                           usuario=self.bodeguero),
+                [(producto, 1)])
+
+        response = self.client.get(url)
+        self.assertEqual(response.context['productos_por_bodega'], [
+            {'nombre': 'Bodega A', 'cantidad': 3},
+            {'nombre': 'Bodega B', 'cantidad': 2},
+        ])
+
+
+class RecalcularTotalesTests(InventarioTestCase):
+
+    def recalcular(self, **opciones):
+        salida = io.StringIO()
+        call_command('recalcular_totales', stdout=salida, **opciones)
+        return salida.getvalue()
+
+    def test_verifica_y_corrige(self):
+        self.crear_catalogo(editoriales=1, productos_por_editorial=3)
+        self.assertIn("coinciden", self.recalcular(solo_verificar=True))
+        Bodega.objects.filter(pk=self.bodega_a.pk).update(total_unidades=5)
+
+        salida = self.recalcular(solo_verificar=True)
+        self.assertIn("Bodega A: mantenido 5, calculado 27", salida)
+        self.assertIn("1 bodega(s) con diferencias.", salida)
+        self.assertNotIn("Bodega B", salida)
+        self.bodega_a.refresh_from_db()
+        self.assertEqual(self.bodega_a.total_unidades, 5)
+
+        salida = self.recalcular()
+        self.assertIn("Bodega A: mantenido 5, calculado 27", salida)
+        self.assertIn("Se corrigieron 1 bodega(s).", salida)
+        self.bodega_a.refresh_from_db()
+        self.assertEqual(self.bodega_a.total_unidades, 27)
+        self.assertIn("coinciden", self.recalcular())
+
+
+class FragmentosEnCacheTests(InventarioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.crear_catalogo(editoriales=1, productos_por_editorial=3)
+
+    def test_tabla_en_cache_hasta_que_cambian_los_datos(self):
+        self.client.force_login(self.jefe)
+        url = reverse('productos_list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        # Solo la sesión y el usuario: la página no se consulta
+        self.assertEqual(len(consultas), 2)
+        self.assertContains(response, 'Titulo 0-1')
+
+        producto = Producto.objects.get(titulo='Titulo 0-1')
+        producto.titulo = 'Titulo cambiado'
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.save()
+        self.assertContains(self.client.get(url), 'Titulo cambiado')
+
+        self.client.get(reverse('autores_list'))
+        self.autor.nombre = 'Autor cambiado'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.autor.save()
+        self.assertContains(self.client.get(reverse('autores_list')), 'Autor cambiado')
+        self.assertContains(self.client.get(url), 'Autor cambiado')
+
+    def test_variantes_por_rol(self):
+        url = reverse('productos_list')
+        self.client.force_login(self.jefe)
+        self.assertContains(self.client.get(url), 'Editar')
+        self.client.force_login(self.bodeguero)
+        response = self.client.get(url)
+        self.assertContains(response, 'Titulo 0-1')
+        self.assertNotContains(response, 'Editar')
+        self.assertNotContains(response, 'Informes Generales')
+
+
+class MetricasTests(InventarioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metricas.registro.limpiar()
+        self.crear_catalogo(editoriales=1, productos_por_editorial=3)
+        self.staff = Usuario.objects.create_user('staff', is_staff=True)
+
+    def leer_metricas(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('metricas'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode().splitlines()
+
+    @override_settings(INVENTARIO_SERVER_TIMING=True)
+    def test_metricas_por_vista(self):
+        self.client.force_login(self.jefe)
+        response = self.client.get(reverse('productos_list'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ consultas", plantilla;dur=[\d.]+, total;dur=[\d.]+$')
+        # Las consultas de las vistas asíncronas corren en otros hilos
+        self.client.get(reverse('informes_generales'))
+
+        lineas = self.leer_metricas()
+        self.assertIn('inventario_http_requests_total'
+                      '{vista="productos_list",metodo="GET",estado="200"} 1', lineas)
+        self.assertIn('inventario_template_render_duration_seconds_count'
+                      '{vista="productos_list"} 1', lineas)
+        for vista in ('productos_list', 'informes_generales'):
+            consultas = metricas.registro.consultas.valores[(vista,)]
+            self.assertEqual(consultas.cantidad, 1)
+            self.assertGreater(consultas.suma, 0)
+
+    def test_valores_grandes_sin_redondeo(self):
+        metricas.registro.peticiones.observar(('productos_list', 'GET', '200'), 1234567)
+        metricas.registro.tiempo_db.observar(('productos_list',), 1234567.125)
+        lineas = self.leer_metricas()
+        self.assertIn('inventario_http_requests_total'
+                      '{vista="productos_list",metodo="GET",estado="200"} 1234567', lineas)
+        self.assertIn('inventario_db_duration_seconds_sum{vista="productos_list"} 1234567.125',
+                      lineas)
+
+    @override_settings(INVENTARIO_SERVER_TIMING=False)
+    def test_server_timing_opcional(self):
+        self.client.force_login(self.jefe)
+        self.assertNotIn('Server-Timing', self.client.get(reverse('productos_list')))
+
+    @override_settings(INVENTARIO_METRICAS_TOKEN='secreto')
+    def test_acceso(self):
+        self.client.force_login(self.jefe)
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        self.client.logout()
+        response = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(response.status_code, 200)
+
+
+def fecha(anio, mes, dia):
+    return timezone.make_aware(datetime.datetime(anio, mes, dia))
+
+
+class ArchivoMovimientosTests(InventarioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        editorial = Editorial.objects.create(nombre='Editorial')
+        self.producto = Producto.objects.create(tipo='libro', titulo='Libro', editorial=editorial)
+        for dia, origen, destino, cantidad in [
+            (fecha(2023, 12, 1), None, self.bodega_a, 10),
+            (fecha(2024, 1, 10), self.bodega_a, self.bodega_b, 3),
+            (fecha(2024, 2, 10), self.bodega_b, self.bodega_a, 1),
+            (fecha(2024, 3, 10), self.bodega_a, self.bodega_b, 2),
+        ]:
+            movimiento = registrar_movimiento(
+                Movimiento(bodega_origen=origen, bodega_destino=destino, usuario=self.bodeguero),
+                [(self.producto, cantidad)])
+            Movimiento.objects.filter(pk=movimiento.pk).update(fecha=dia)
+        self.fechas = [fecha(2024, 1, 1), fecha(2024, 1, 15), fecha(2024, 2, 15),
+                       fecha(2024, 3, 15), timezone.now()]
+
+    def stock(self):
+        return [[stock_a_fecha(bodega, dia) for dia in self.fechas]
+                for bodega in (self.bodega_a, self.bodega_b)]
+
+    def test_archivar_conserva_historial_y_stock(self):
+        stock = self.stock()
+        detalles = list(informes.detalle_movimientos())
+
+        periodo = archivar(fecha(2024, 3, 1))
+
+        self.assertEqual((periodo.movimientos, periodo.detalles), (3, 3))
+        self.assertEqual(Movimiento.objects.count(), 1)
+        self.assertEqual(MovimientoArchivado.objects.count(), 3)
+        self.assertEqual(self.stock(), stock)
+        self.assertEqual(list(informes.detalle_movimientos()), detalles)
+        # Archivar no revierte el stock de los movimientos
+        self.assertEqual(self.producto.cantidad_disponible_en_bodega(self.bodega_b), 4)
+        self.assertIsNone(archivar(fecha(2024, 3, 1)))
+
+    def test_consultas_recientes_no_leen_el_archivo(self):
+        archivar(fecha(2024, 3, 1))
+        tabla = DetalleArchivado._meta.db_table
+        for consultar in (lambda: stock_a_fecha(self.bodega_b, fecha(2024, 3, 15)),
+                          lambda: list(informes.detalle_movimientos(desde=fecha(2024, 3, 1)))):
+            with CaptureQueriesContext(connection) as consultas:
+                consultar()
+            self.assertFalse([c['sql'] for c in consultas if tabla in c['sql']])
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(stock_a_fecha(self.bodega_b, fecha(2024, 1, 15)),
+                             {self.producto.pk: 3})
+        self.assertTrue([c['sql'] for c in consultas if tabla in c['sql']])
+
+    def test_fecha_invalida(self):
+        for valor in ('2024-02-30', 'marzo'):
+            with self.subTest(valor), \
+                    self.assertRaisesMessage(CommandError, 'AAAA-MM-DD'):
+                call_command('archivar_movimientos', antes=valor, stdout=io.StringIO())
+        self.assertEqual(Movimiento.objects.count(), 4)
+
+
+class DatosSinteticosTests(TestCase):
+
+    def test_generar_datos_y_medir_rendimiento(self):
+        call_command('generar_datos', bodegas=3, editoriales=4, autores=5, productos=30,
+                     movimientos=200, stdout=io.StringIO())
+
+        self.assertEqual(Movimiento.objects.count(), 200)
+        # Las fechas se reparten en los dos años anteriores
+        primera = Movimiento.objects.order_by('fecha').values_list('fecha', flat=True).first()
+        self.assertLess(primera, timezone.now() - datetime.timedelta(days=700))
+        self.assertFalse(Existencia.objects.filter(cantidad__lt=0).exists())
+        for bodega in Bodega.objects.all():
+            # El stock guardado coincide con el que resulta de los movimientos
+            stock = {e.producto_id: e.cantidad for e in bodega.existencias.filter(cantidad__gt=0)}
+            self.assertEqual(stock_a_fecha(bodega, timezone.now()), stock)
+            self.assertEqual(bodega.total_unidades, sum(stock.values()))
+
+        with tempfile.TemporaryDirectory() as directorio:
+            salida = os.path.join(directorio, 'rendimiento.json')
+            call_command('medir_rendimiento', repeticiones=1, movimientos=3, salida=salida,
+                         stdout=io.StringIO())
+            with open(salida, encoding='utf-8') as archivo:
+                resultados = json.load(archivo)
+
+        self.assertEqual(resultados['datos']['movimientos'], 200)
+        grupos = {resultado['grupo'] for resultado in resultados['resultados']}
+        self.assertEqual(grupos, {'vistas', 'informes', 'stock', 'movimientos'})
+        # Los movimientos medidos se revierten
+        self.assertEqual(Movimiento.objects.count(), 200)
+
+
+class ImportarCatalogoTests(InventarioTestCase):
+
+    def importar(self, contenido, extension='csv', codificacion='utf-8'):
+        with tempfile.TemporaryDirectory() as carpeta:
+            archivo = os.path.join(carpeta, f'catalogo.{extension}')
+            with open(archivo, 'w', encoding=codificacion, newline='') as salida:
+                salida.write(contenido)
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command('importar_catalogo', archivo, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_crea_y_actualiza_por_codigo(self):
+        self.importar(
+            'codigo,tipo,titulo,editorial,autores,descripcion\n'
+            'L1,libro,Rayuela,Sudamericana,Julio Cortázar,Novela\n'
+            'R1,revista,Revista Uno,Nueva,Ana;Luis,\n')
+        self.assertEqual(Producto.objects.count(), 2)
+        revista = Producto.objects.get(codigo='R1')
+        self.assertEqual(revista.editorial.nombre, 'Nueva')
+        self.assertCountEqual(revista.autores.values_list('nombre', flat=True), ['Ana', 'Luis'])
+
+        # El mismo código actualiza el producto y reemplaza sus autores
+        self.importar(
+            '{"codigo": "R1", "tipo": "revista", "titulo": "Revista 1", '
+            '"editorial": "Nueva", "autores": ["Pedro"]}\n', extension='jsonl')
+        revista.refresh_from_db()
+        self.assertEqual(Producto.objects.count(), 2)
+        self.assertEqual(revista.titulo, 'Revista 1')
+        self.assertEqual(list(revista.autores.values_list('nombre', flat=True)), ['Pedro'])
+        self.assertEqual(Autor.objects.filter(nombre='Ana').count(), 1)
+
+    def test_filas_invalidas(self):
+        stdout, stderr = self.importar(
+            '{"codigo": "L1", "tipo": "libro", "titulo": "Bien", "editorial": "E"}\n'
+            '{"codigo": "L2", "tipo": "comic", "titulo": "Tipo", "editorial": "E"}\n'
+            '{"codigo": "L3", "tipo": "libro", "editorial": "E"}\n'
+            'no es json\n', extension='jsonl')
+        self.assertEqual(list(Producto.objects.values_list('codigo', flat=True)), ['L1'])
+        self.assertIn('3 fila(s) omitida(s)', stdout)
+        self.assertEqual(stderr.splitlines(), [
+            "Fila 2: tipo 'comic' inválido.",
+            "Fila 3: falta el título.",
+            "Fila 4: no es un objeto JSON válido.",
+        ])
+
+    def test_archivo_no_utf8(self):
+        with self.assertRaisesMessage(CommandError, 'no está en UTF-8'):
+            self.importar('codigo,tipo,titulo,editorial\nL1,libro,Años,Ñandú\n',
+                          codificacion='latin-1')
+
+    def test_codigo_editable(self):
+        self.importar('codigo,tipo,titulo,editorial,autores\nL1,libro,Libro,E,Autor\n')
+        producto = Producto.objects.get()
+        self.client.force_login(self.jefe)
+        response = self.client.post(reverse('productos_update', args=[producto.pk]), {
+            'tipo': 'libro', 'codigo': 'L-001', 'titulo': 'Libro',
+            'editorial': producto.editorial_id, 'autores': [self.autor.pk],
+        })
+        self.assertRedirects(response, reverse('productos_list'))
+        producto.refresh_from_db()
+        self.assertEqual(producto.codigo, 'L-001')
+
+
+class ApiTests(InventarioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.crear_catalogo(editoriales=1, productos_por_editorial=3)
+        self.client.force_login(self.jefe)
+        self.productos = list(Producto.objects.order_by('pk'))
+
+    def test_get_condicional(self):
+        url = '/api/v1/productos/'
+        response = self.client.get(url)
+        etag, ultima = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Un cambio en el mismo segundo mantiene Last-Modified pero no el ETag
+        Producto.objects.filter(pk=self.productos[0].pk).update(
+            titulo='Cambiado', actualizado=Producto.objects.aggregate(
+                ultima=Max('actualizado'))['ultima'] + datetime.timedelta(microseconds=1))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Last-Modified'], ultima)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=ultima).status_code, 200)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_campos_e_ids(self):
+        primero, _, tercero = self.productos
+        response = self.client.get(
+            '/api/v1/productos/', {'fields': 'id,titulo', 'ids': f'{tercero.pk},{primero.pk}'})
+        self.assertEqual(response.json()['results'], [
+            {'id': primero.pk, 'titulo': primero.titulo},
+            {'id': tercero.pk, 'titulo': tercero.titulo},
+        ])
+        response = self.client.get('/api/v1/productos/', {'ids': '1,x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_lote(self):
+        ids = [producto.pk for producto in self.productos[:2]]
+        response = self.client.post(
+            '/api/v1/productos/lote/?fields=id', {'ids': ids + [0]}, content_type='application/json')
+        self.assertEqual(response.json(), [{'id': pk} for pk in ids])
+        response = self.client.post(
+            '/api/v1/productos/lote/', {'ids': 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_stock_a_fecha_invalida(self):
+        url = f'/api/v1/bodegas/{self.bodega_a.pk}/stock/'
+        self.assertEqual(self.client.get(url, {'fecha': '2024-02-30'}).status_code, 400)
+        response = self.client.get(url, {'fecha': '2030-01-01'})
+        self.assertEqual(len(response.json()['stock']), 3)
+
+
+class BusquedaTests(TestCase):
+
+    def setUp(self):
+        # El índice se actualiza al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            self.editorial = Editorial.objects.create(nombre='Planeta')
+            self.autor = Autor.objects.create(nombre='Gabriel García')
+            self.titulo = Producto.objects.create(
+                tipo='libro', titulo='Historia del mar', editorial=self.editorial)
+            self.descripcion = Producto.objects.create(
+                tipo='libro', titulo='Viaje', descripcion='Una historia larga',
+                editorial=self.editorial)
+            self.titulo.autores.add(self.autor)
+
+    def buscar(self, texto):
+        return [producto.titulo for producto in busqueda.buscar(texto)]
+
+    def test_ranking_y_prefijo(self):
+        # El título pesa más que la descripción
+        resultado = busqueda.buscar('historia')
+        self.assertEqual(resultado, [self.titulo, self.descripcion])
+        self.assertGreater(resultado[0].rango, resultado[1].rango)
+        # El último término también cuenta como prefijo y se ignoran los acentos
+        self.assertCountEqual(self.buscar('histo'), ['Historia del mar', 'Viaje'])
+        self.assertEqual(self.buscar('historia vi'), ['Viaje'])
+        self.assertEqual(self.buscar('garcia'), ['Historia del mar'])
+        self.assertEqual(self.buscar('  '), [])
+
+    def test_reindexa_al_cambiar_autor_o_editorial(self):
+        self.autor.nombre = 'Gabriela Mistral'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.autor.save()
+        self.assertEqual(self.buscar('mistral'), ['Historia del mar'])
+        self.assertEqual(self.buscar('garcia'), [])
+
+        self.editorial.nombre = 'Zig-Zag'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.editorial.save()
+        self.assertCountEqual(self.buscar('zig'), ['Historia del mar', 'Viaje'])
+        self.assertEqual(self.buscar('planeta'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.descripcion.autores.add(self.autor)
+        self.assertCountEqual(self.buscar('mistral'), ['Historia del mar', 'Viaje'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.autor.delete()
+        self.assertEqual(self.buscar('mistral'), [])
+
+    def test_indexa_una_vez_por_transaccion(self):
+        # El formulario guarda el producto y después sus autores
+        with mock.patch.object(
+                busqueda, 'indexar_productos', wraps=busqueda.indexar_productos) as indexar:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    self.titulo.titulo = 'Historia del río'
+                    self.titulo.save()
+                    self.titulo.autores.set([])
+                    self.descripcion.save()
+        indexar.assert_called_once_with({self.titulo.pk, self.descripcion.pk})
+        self.assertEqual(self.buscar('rio'), ['Historia del río'])
+        self.assertEqual(self.buscar('garcia'), [])
+
+    def test_rollback_no_indexa(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.titulo.titulo = 'Historia del río'
+                self.titulo.save()
+                transaction.set_rollback(True)
+        self.assertEqual(self.buscar('rio'), [])
+        self.assertEqual(self.buscar('mar'), ['Historia del mar'])
+
+
+class BusquedaVistaTests(InventarioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        editorial = Editorial.objects.create(nombre='Planeta')
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(tipo='libro', titulo='Historia del mar', editorial=editorial)
+        self.client.force_login(self.bodeguero)
+
+    def buscar(self, pagina):
+        return self.client.get(reverse('productos_buscar'), {'q': 'historia', 'pagina': pagina})
+
+    def test_pagina(self):
+        # Un número no válido muestra la primera página
+        for pagina in ('x', '0', '-3', '1'):
+            response = self.buscar(pagina)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['pagina'], 1)
+            self.assertEqual(len(response.context['productos']), 1)
+        self.assertEqual(self.buscar('2').context['productos'], [])
+        # Un desplazamiento que no cabe en la consulta no llega a la base
+        for pagina in ('1001', '99999999999999999999'):
+            self.assertEqual(self.buscar(pagina).status_code, 404)
+
+
+class RegistrarMovimientoTests(InventarioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        editorial = Editorial.objects.create(nombre='Editorial')
+        self.productos = [
+            Producto.objects.create(tipo='libro', titulo=f'Libro {i}', editorial=editorial)
+            for i in range(7)
+        ]
+        for producto in self.productos:
+            producto.actualizar_stock(self.bodega_a, 10)
+
+    def transferir(self, lineas):
+        return registrar_movimiento(
+            Movimiento(bodega_origen=self.bodega_a, bodega_destino=self.bodega_b,
+                       usuario=self.bodeguero),
+            lineas)
+
+    def stock(self, bodega):
+        return dict(bodega.existencias.filter(cantidad__gt=0).values_list('producto_id', 'cantidad'))
+
+    def test_transferencia_de_varias_lineas(self):
+        uno, dos = self.productos[:2]
+        movimiento = self.transferir([(uno, 3), (dos, 2), (uno, 1)])
+
+        # Las líneas repetidas de un producto se suman en un solo detalle
+        self.assertEqual(
+            dict(movimiento.movimientodetalle_set.values_list('producto_id', 'cantidad')),
+            {uno.pk: 4, dos.pk: 2})
+        self.assertEqual(self.stock(self.bodega_b), {uno.pk: 4, dos.pk: 2})
+        self.assertEqual(self.stock(self.bodega_a)[uno.pk], 6)
+        self.assertEqual(self.stock(self.bodega_a)[dos.pk], 8)
+        self.bodega_a.refresh_from_db()
+        self.bodega_b.refresh_from_db()
+        self.assertEqual((self.bodega_a.total_unidades, self.bodega_b.total_unidades), (64, 6))
+        self.assertEqual(Bodega.recalcular_totales(corregir=False), [])
+
+    def test_lote_mayor_que_un_case(self):
+        # Con 9 parámetros por sentencia cada UPDATE lleva tres productos
+        with mock.patch.object(connection.features, 'max_query_params', 9), \
+                CaptureQueriesContext(connection) as consultas:
+            self.transferir([(producto, 1) for producto in self.productos])
+
+        actualizaciones = [c['sql'] for c in consultas
+                           if c['sql'].startswith('UPDATE "inventario_existencia"')]
+        self.assertEqual(len(actualizaciones), 6)
+        self.assertEqual(self.stock(self.bodega_b), {p.pk: 1 for p in self.productos})
+        self.assertEqual(self.stock(self.bodega_a), {p.pk: 9 for p in self.productos})
+        self.assertEqual(Bodega.recalcular_totales(corregir=False), [])
+
+    def test_formulario_sin_lineas(self):
+        self.client.force_login(self.bodeguero)
+        response = self.client.post(reverse('movimientos_create'), {
+            'bodega_origen': self.bodega_a.pk,
+            'bodega_destino': self.bodega_b.pk,
+            'form-TOTAL_FORMS': 2,
+            'form-INITIAL_FORMS': 0,
+            'form-0-producto': '',
+            'form-0-cantidad': '',
+            'form-1-producto': '',
+            'form-1-cantidad': '',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['productos_formset'].non_form_errors(),
+                         ["Agrega al menos un producto con su cantidad."])
+        self.assertContains(response, "Agrega al menos un producto con su cantidad.")
+        self.assertFalse(Movimiento.objects.exists())
+
+    def test_rechaza_salida_sin_stock(self):
+        sin_stock = Producto.objects.create(
+            tipo='revista', titulo='Sin stock', editorial=self.productos[0].editorial)
+        with self.assertRaises(ValidationError) as error:
+            self.transferir([(self.productos[0], 11), (self.productos[1], 1), (sin_stock, 1)])
+
+        self.assertEqual(error.exception.messages, [
+            "No hay suficiente stock de 'Libro 0'. Disponible: 10.",
+            "El producto 'Sin stock' no está en la bodega de origen 'Bodega A'.",
+        ])
+        # No se guarda ninguna línea
+        self.assertFalse(Movimiento.objects.exists())
+        self.assertEqual(self.stock(self.bodega_a), {p.pk: 10 for p in self.productos})
+        self.assertEqual(self.stock(self.bodega_b), {})
+
+
+class CodigosMovimientoTests(InventarioTestCase):
+
+    def nuevo(self, origen=None, destino=None, fecha=None):
+        return Movimiento(bodega_origen=origen, bodega_destino=destino or self.bodega_b,
+                          usuario=self.bodeguero, fecha=fecha)
+
+    def test_reserva_en_bloque(self):
+        self.assertEqual(SecuenciaCodigo.reservar('X-', 3), range(1, 4))
+        self.assertEqual(SecuenciaCodigo.reservar('X-', 2), range(4, 6))
+
+        movimientos = [self.nuevo() for _ in range(50)]
+        with CaptureQueriesContext(connection) as consultas:
+            Movimiento.asignar_codigos(movimientos)
+        # Un solo bloque para todos, no una reserva por movimiento: UPDATE que
+        # no encuentra el prefijo, INSERT y SELECT del último número
+        self.assertEqual(
+            len([c for c in consultas if 'inventario_secuenciacodigo' in c['sql']]), 3)
+        self.assertEqual([m.codigo for m in movimientos[:2]], ['MOV-00001', 'MOV-00002'])
+        self.assertEqual(movimientos[-1].codigo, 'MOV-00050')
+        movimiento = self.nuevo()
+        movimiento.save()
+        self.assertEqual(movimiento.codigo, 'MOV-00051')
+
+    @override_settings(INVENTARIO_PREFIJO_MOVIMIENTO='{anio}-B{bodega}-')
+    def test_prefijo_por_anio_y_bodega(self):
+        movimientos = [
+            self.nuevo(self.bodega_a, fecha=fecha(2023, 5, 1)),
+            self.nuevo(self.bodega_a, fecha=fecha(2023, 6, 1)),
+            self.nuevo(self.bodega_a, fecha=fecha(2024, 1, 1)),
+            # Sin origen se usa la bodega de destino
+            self.nuevo(fecha=fecha(2023, 5, 1)),
+        ]
+        Movimiento.asignar_codigos(movimientos)
+        a, b = self.bodega_a.pk, self.bodega_b.pk
+        self.assertEqual([m.codigo for m in movimientos], [
+            f'2023-B{a}-00001', f'2023-B{a}-00002', f'2024-B{a}-00001', f'2023-B{b}-00001',
+        ])
+
+    def test_continua_despues_de_la_migracion(self):
+        for codigo in ('MOV-00007', 'MOV-00012', 'OTRO-00099'):
+            movimiento = self.nuevo()
+            movimiento.codigo = codigo
+            movimiento.save()
+        migracion = importlib.import_module('inventario.migrations.0008_secuenciacodigo')
+        migracion.iniciar_secuencia(apps, None)
+
+        movimiento = self.nuevo()
+        movimiento.save()
+        self.assertEqual(movimiento.codigo, 'MOV-00013')
+
+
+class PaginacionCursorTests(InventarioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        editorial = Editorial.objects.create(nombre='Editorial')
+        # Títulos repetidos: el id desempata el orden
+        for titulo in 'BACBACB':
+            Producto.objects.create(tipo='libro', titulo=titulo, editorial=editorial)
+        self.ordenados = list(Producto.objects.order_by('titulo', 'id').values_list('pk', flat=True))
+        self.client.force_login(self.jefe)
+
+    def pagina(self, **parametros):
+        response = self.client.get(reverse('productos_list'), {'por_pagina': 3, **parametros})
+        pagina = response.context['pagina']
+        return [producto.pk for producto in pagina.objetos], pagina
+
+    def test_adelante_y_atras(self):
+        ids, primera = self.pagina()
+        self.assertEqual(ids, self.ordenados[:3])
+        self.assertIsNone(primera.anterior)
+
+        ids, segunda = self.pagina(despues=primera.siguiente)
+        self.assertEqual(ids, self.ordenados[3:6])
+        ids, ultima = self.pagina(despues=segunda.siguiente)
+        self.assertEqual(ids, self.ordenados[6:])
+        self.assertIsNone(ultima.siguiente)
+
+        ids, pagina = self.pagina(antes=ultima.anterior)
+        self.assertEqual(ids, self.ordenados[3:6])
+        ids, pagina = self.pagina(antes=pagina.anterior)
+        self.assertEqual(ids, self.ordenados[:3])
+        self.assertIsNone(pagina.anterior)
+        self.assertIsNotNone(pagina.siguiente)
+
+    def test_orden_descendente(self):
+        ids, pagina = self.pagina(orden='-titulo')
+        recorridos = ids
+        while pagina.siguiente:
+            ids, pagina = self.pagina(orden='-titulo', despues=pagina.siguiente)
+            recorridos += ids
+        self.assertEqual(recorridos, self.ordenados[::-1])
+
+    def test_cursor_invalido(self):
+        def codificar(valores):
+            return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+        for cursor in ('no es un cursor', codificar([]), codificar(['B', 'x']),
+                       codificar([None, 1]), codificar([['B'], 1]), codificar(['B', {'id': 1}])):
+            for parametro in ('despues', 'antes'):
+                with self.subTest(cursor=cursor, parametro=parametro):
+                    ids, pagina = self.pagina(**{parametro: cursor})
+                    # Lleva a la primera página
+                    self.assertEqual(ids, self.ordenados[:3])
+                    self.assertIsNone(pagina.anterior)
+
+
+class ExportacionTests(InventarioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.crear_catalogo(editoriales=1, productos_por_editorial=2)
+        self.client.force_login(self.jefe)
+        self.columnas = list(informes.COLUMNAS_DETALLE_MOVIMIENTOS)
+
+    def exportar(self, formato, url='exportar_movimientos', args=()):
+        response = self.client.get(reverse(url, args=[*args, formato]))
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response, contenido = self.exportar('csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="movimientos.csv"')
+        filas = list(csv.reader(io.StringIO(contenido.decode('utf-8-sig'))))
+        self.assertEqual(filas[0], self.columnas)
+        self.assertEqual([fila[2:] for fila in filas[1:]], [
+            ['Bodega A', 'Bodega B', 'bodeguero', 'Titulo 0-0', '1'],
+            ['Bodega A', 'Bodega B', 'bodeguero', 'Titulo 0-1', '1'],
+        ])
+
+        _, contenido = self.exportar('csv', 'exportar_informe_general', ['bodegas'])
+        filas = list(csv.reader(io.StringIO(contenido.decode('utf-8-sig'))))
+        self.assertEqual(filas, [['nombre', 'cantidad'], ['Bodega A', '2'], ['Bodega B', '2']])
+
+    def test_jsonl(self):
+        _, contenido = self.exportar('jsonl')
+        filas = [json.loads(linea) for linea in contenido.decode().splitlines()]
+        self.assertEqual(len(filas), 2)
+        self.assertEqual(list(filas[0]), self.columnas)
+        self.assertEqual(filas[1]['producto'], 'Titulo 0-1')
+        self.assertEqual(filas[1]['cantidad'], 1)
+
+    def test_xlsx(self):
+        with mock.patch('inventario.exportacion.MAX_FILAS_HOJA', 2):
+            _, contenido = self.exportar('xlsx')
+        libro = zipfile.ZipFile(io.BytesIO(contenido))
+        self.assertIsNone(libro.testzip())
+        # Con el límite de filas rebajado cada hoja lleva el encabezado y una fila
+        self.assertCountEqual(libro.namelist(), [
+            'xl/worksheets/sheet1.xml', 'xl/worksheets/sheet2.xml', 'xl/workbook.xml',
+            'xl/_rels/workbook.xml.rels', '_rels/.rels', '[Content_Types].xml',
+        ])
+        ns = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        hojas = ElementTree.fromstring(libro.read('xl/workbook.xml')).findall('.//x:sheet', ns)
+        self.assertEqual([hoja.get('name') for hoja in hojas], ['Datos', 'Datos 2'])
+        for numero, producto in ((1, 'Titulo 0-0'), (2, 'Titulo 0-1')):
+            hoja = ElementTree.fromstring(libro.read(f'xl/worksheets/sheet{numero}.xml'))
+            filas = [[''.join(celda.itertext()) for celda in fila]
+                     for fila in hoja.iterfind('.//x:row', ns)]
+            self.assertEqual(filas[0], self.columnas)
+            self.assertEqual(filas[1][5:], [producto, '1'])
+
+    def test_formato_desconocido(self):
+        response = self.client.get(reverse('exportar_movimientos', args=['pdf']))
+        self.assertEqual(response.status_code, 404)
+
+
+class InstantaneasTests(InventarioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        editorial = Editorial.objects.create(nombre='Editorial')
+        self.producto = Producto.objects.create(tipo='libro', titulo='Libro', editorial=editorial)
+        self.mover(fecha(2024, 1, 10), None, self.bodega_a, 10)
+        self.mover(fecha(2024, 2, 10), self.bodega_a, self.bodega_b, 3)
+        tomar_instantaneas()
+        InstantaneaStock.objects.update(fecha=fecha(2024, 3, 1))
+        self.mover(fecha(2024, 4, 10), self.bodega_a, self.bodega_b, 2)
+
+    def mover(self, dia, origen, destino, cantidad):
+        movimiento = registrar_movimiento(
+            Movimiento(bodega_origen=origen, bodega_destino=destino, usuario=self.bodeguero),
+            [(self.producto, cantidad)])
+        Movimiento.objects.filter(pk=movimiento.pk).update(fecha=dia)
+
+    def test_stock_a_fecha_desde_la_instantanea(self):
+        pk = self.producto.pk
+        for dia, bodega, esperado in [
+            (fecha(2023, 12, 1), self.bodega_a, {}),
+            (fecha(2024, 1, 15), self.bodega_a, {pk: 10}),
+            (fecha(2024, 3, 15), self.bodega_a, {pk: 7}),
+            (fecha(2024, 5, 1), self.bodega_a, {pk: 5}),
+            (fecha(2024, 2, 15), self.bodega_b, {pk: 3}),
+            (fecha(2024, 5, 1), self.bodega_b, {pk: 5}),
+        ]:
+            with self.subTest(dia=dia, bodega=bodega.nombre):
+                self.assertEqual(stock_a_fecha(bodega, dia), esperado)
+        self.assertEqual(stock_producto_a_fecha(self.producto, self.bodega_b, fecha(2024, 5, 1)), 5)
+
+        # El resultado parte de la instantánea: un cambio en ella se nota antes
+        # y después de su fecha
+        LineaInstantanea.objects.filter(instantanea__bodega=self.bodega_a).update(
+            cantidad=F('cantidad') + 100)
+        self.assertEqual(stock_a_fecha(self.bodega_a, fecha(2024, 5, 1)), {pk: 105})
+        self.assertEqual(stock_a_fecha(self.bodega_a, fecha(2024, 1, 15)), {pk: 110})
+
+
+class ProductoAutocompletarTests(InventarioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        editorial = Editorial.objects.create(nombre='Planeta')
+        for titulo in ('Árbol de la vida', 'arboleda', 'Barco'):
+            Producto.objects.create(tipo='libro', titulo=titulo, editorial=editorial)
+        self.client.force_login(self.bodeguero)
+
+    def autocompletar(self, **parametros):
+        response = self.client.get(reverse('productos_autocompletar'), parametros)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['resultados']
+
+    def test_prefijo_sin_acentos_ni_mayusculas(self):
+        resultados = self.autocompletar(q='ARBOL')
+        self.assertEqual([r['texto'] for r in resultados], ['Árbol de la vida', 'arboleda'])
+        self.assertEqual(resultados[1], {
+            'id': Producto.objects.get(titulo='arboleda').pk, 'texto': 'arboleda', 'stock': None})
+        self.assertEqual([r['texto'] for r in self.autocompletar(q='árbol d')], ['Árbol de la vida'])
+        self.assertEqual(self.autocompletar(q='vida'), [])
+
+    def test_filtro_por_bodega(self):
+        arbol = Producto.objects.get(titulo='Árbol de la vida')
+        arbol.actualizar_stock(self.bodega_a, 7)
+        Producto.objects.get(titulo='arboleda').actualizar_stock(self.bodega_b, 3)
+        Producto.objects.get(titulo='Barco').actualizar_stock(self.bodega_a, 5)
+
+        self.assertEqual(self.autocompletar(q='arbol', bodega=self.bodega_a.pk), [
+            {'id': arbol.pk, 'texto': 'Árbol de la vida', 'stock': 7},
+        ])
+        # Sin stock en la bodega no se ofrece
+        arbol.actualizar_stock(self.bodega_a, -7)
+        self.assertEqual(self.autocompletar(q='arbol', bodega=self.bodega_a.pk), [])
+        # Una bodega no numérica se ignora
+        self.assertEqual(len(self.autocompletar(q='arbol', bodega='x')), 2)
+
+    def test_texto_vacio(self):
+        self.assertEqual(self.autocompletar(), [])
+        self.assertEqual(self.autocompletar(q=''), [])
+        self.assertEqual(self.autocompletar(q='   '), [])
+        # Un acento suelto se reduce a nada al normalizar
+        self.assertEqual(self.autocompletar(q='\u0301'), [])
+
+    def test_ultimo_caracter_maximo(self):
+        Producto.objects.create(
+            tipo='libro', titulo='Barco\U0010ffff', editorial=Editorial.objects.get())
+        self.assertEqual(self.autocompletar(q='\U0010ffff'), [])
+        self.assertEqual(
+            [r['texto'] for r in self.autocompletar(q='barco\U0010ffff')], ['Barco\U0010ffff'])
+
+
+class StockProductoTests(InventarioTestCase):
+
+    def test_stock_por_bodega(self):
+        self.crear_catalogo(editoriales=1, productos_por_editorial=1)
+        producto = Producto.objects.get()
+        self.client.force_login(self.bodeguero)
+        response = self.client.get(reverse('productos_stock', args=[producto.pk]))
+
+        self.assertEqual(response.json(), {
+            'producto': producto.pk,
+            'titulo': producto.titulo,
+            'stock': [
+                {'bodega': self.bodega_a.pk, 'nombre': 'Bodega A', 'cantidad': 9},
+                {'bodega': self.bodega_b.pk, 'nombre': 'Bodega B', 'cantidad': 1},
+            ],
+        })
+
+    def test_producto_inexistente(self):
+        self.client.force_login(self.bodeguero)
+        response = self.client.get(reverse('productos_stock', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class EventosStockTests(InventarioTestCase):
+
+    async def leer_evento(self, eventos):
+        mensaje = (await asyncio.wait_for(anext(eventos), timeout=5)).decode()
+        tipo, datos = mensaje.strip().split('\n')
+        return tipo.removeprefix('event: '), json.loads(datos.removeprefix('data: '))
+
+    def mover(self, producto, cantidad):
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_movimiento(
+                Movimiento(bodega_origen=self.bodega_a, bodega_destino=self.bodega_b,
+                           usuario=self.bodeguero),
+                [(producto, cantidad)])
+
+    async def test_stream_de_bodega(self):
+        producto = await sync_to_async(Producto.objects.create)(
+            tipo='libro', titulo='Libro', editorial=await Editorial.objects.acreate(nombre='E'))
+        await sync_to_async(producto.actualizar_stock)(self.bodega_a, 5)
+        await self.async_client.aforce_login(self.bodeguero)
+        response = await self.async_client.get(
+            reverse('bodega_eventos', args=[self.bodega_b.pk]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        eventos = aiter(response.streaming_content)
+        self.assertTrue((await anext(eventos)).startswith(b'retry:'))
+        self.assertEqual(await self.leer_evento(eventos),
+                         ('estado', {'bodegas': {str(self.bodega_b.pk): 0}}))
+
+        await sync_to_async(self.mover)(producto, 2)
+        self.assertEqual(await self.leer_evento(eventos), ('stock', {
+            'bodega': self.bodega_b.pk, 'productos': {str(producto.pk): 2}, 'unidades': 2,
+        }))
+
+        # Un movimiento revertido no se publica
+        with self.assertRaises(ValidationError):
+            await sync_to_async(self.mover)(producto, 10)
+
+        # Al desconectarse el cliente se cancela la lectura en curso y la
+        # suscripción se elimina
+        lectura = asyncio.ensure_future(anext(eventos))
+        await asyncio.sleep(0.1)
+        lectura.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await lectura
+        self.assertFalse(hub._suscripciones)
+
+    async def test_bodegas_invalidas(self):
+        await self.async_client.aforce_login(self.bodeguero)
+        response = await self.async_client.get(reverse('bodegas_eventos'), {'bodega': 'x'})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(reverse('bodega_eventos', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_sin_asgi(self):
+        # Bajo WSGI el stream nunca terminaría de enviarse
+        self.client.force_login(self.bodeguero)
+        response = self.client.get(reverse('bodega_eventos', args=[self.bodega_a.pk]))
+        self.assertEqual(response.status_code, 501)
+
+
+@override_settings(INVENTARIO_VERIFICAR_CONSULTAS=True)
+class LimiteConsultasListadosTests(InventarioTestCase):
+    """
+    Las vistas de listado fallan si superan su max_consultas, así que cada
+    página con muchas filas prueba que no hay consultas N+1.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.crear_catalogo(editoriales=3, productos_por_editorial=5)
+
+    def test_listados_del_jefe(self):
+        self.client.force_login(self.jefe)
+        for nombre in ['productos_list', 'bodegas_list', 'autores_list',
+                       'editoriales_list', 'informe_movimientos']:
+            with self.subTest(nombre):
+                self.assertEqual(self.client.get(reverse(nombre)).status_code, 200)
+
+    def test_informe_por_bodega(self):
+        self.client.force_login(self.jefe)
+        editorial = Editorial.objects.first()
+        response = self.client.get(reverse('informe_bodega'), {
+            'bodega': self.bodega_b.pk, 'editorial': editorial.pk, 'tipo': 'libro'})
+
+        self.assertEqual(
+            [producto.cantidad for producto in response.context['productos']], [1, 1])
+        self.assertEqual(response.context['resumen'], [
+            {'editorial': editorial.nombre, 'tipo': 'libro', 'productos': 2, 'unidades': 2},
+        ])
+
+    def test_listado_de_movimientos(self):
+        self.client.force_login(self.bodeguero)
+        self.assertEqual(self.client.get(reverse('movimientos_list')).status_code, 200)
+
+    def test_limite_superado(self):
+        self.client.force_login(self.jefe)
+        with mock.patch.object(ProductoListView, 'relaciones', []):
+            with self.assertLogs('inventario.consultas', 'WARNING') as logs, \
+                    self.assertRaises(LimiteConsultasExcedido):
+                self.client.get(reverse('productos_list'))
+
+        # El informe agrupa las consultas por forma y apunta a la plantilla
+        informe = logs.output[0]
+        self.assertIn('ProductoListView ejecutó', informe)
+        self.assertRegex(informe, r'15x [\d.]+ ms  SELECT .*"inventario_autor"')
+        self.assertRegex(informe, r'desde productos_list.html:\d+')
+
+    @override_settings(INVENTARIO_VERIFICAR_CONSULTAS='registrar', INVENTARIO_REGISTRO_CONSULTAS=True)
+    def test_registro_de_consultas_repetidas(self):
+        self.client.force_login(self.jefe)
+        with mock.patch.object(ProductoListView, 'relaciones', []):
+            with self.assertLogs('inventario.consultas', 'WARNING') as logs:
+                response = self.client.get(reverse('productos_list'))
+
+        # En modo 'registrar' la vista responde igual
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('Consultas repetidas en productos_list', logs.output[1])
+        self.assertRegex(logs.output[1], r'15x \(3 distintas\) .*"inventario_editorial"')
+
+        with self.assertNoLogs('inventario.consultas', 'WARNING'):
+            self.client.get(reverse('productos_list'))
+
+    @override_settings(INVENTARIO_VERIFICAR_CONSULTAS=False)
+    def test_registro_inactivo_en_pruebas(self):
+        self.client.force_login(self.jefe)
+        with mock.patch.object(ProductoListView, 'relaciones', []):
+            with self.assertNoLogs('inventario.consultas', 'WARNING'):
+                self.client.get(reverse('productos_list'))
+
+    async def test_limite_en_vista_asincrona(self):
+        await self.async_client.aforce_login(self.bodeguero)
+        producto = await Producto.objects.afirst()
+        with mock.patch('inventario.views.ProductoStockView.max_consultas', 1), \
+                self.assertLogs('inventario.consultas', 'WARNING'), \
+                self.assertRaises(LimiteConsultasExcedido):
+            await self.async_client.get(reverse('productos_stock', args=[producto.pk]))
+
+
+class PlanesConsultaTests(InventarioTestCase):
+    """
+    Explica cada SELECT de las vistas más usadas y falla si alguna recorre
+    una tabla completa en lugar de usar un índice.
+    """
+    # Tablas que una vista recorre completas a propósito: el informe lista
+    # todas sus filas o los filtros las ofrecen como opciones
+    RECORRIDOS_PERMITIDOS = {
+        'informes_generales': {'inventario_bodega', 'inventario_editorial', 'inventario_producto'},
+        'informe_bodega': {'inventario_bodega', 'inventario_editorial'},
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.crear_catalogo(editoriales=2, productos_por_editorial=3)
+        self.editorial = Editorial.objects.first()
+        self.producto = Producto.objects.first()
+
+    def rutas(self):
+        """
+        (usuario, nombre, url) de cada vista a revisar.
+        """
+        bodega = self.bodega_b.pk
+        return [
+            (self.jefe, 'productos_list', reverse('productos_list')),
+            (self.jefe, 'productos_list', reverse('productos_list') + '?orden=-titulo'),
+            (self.jefe, 'productos_buscar', reverse('productos_buscar') + '?q=titulo'),
+            (self.jefe, 'bodegas_list', reverse('bodegas_list')),
+            (self.jefe, 'autores_list', reverse('autores_list')),
+            (self.jefe, 'editoriales_list', reverse('editoriales_list')),
+            (self.jefe, 'informe_movimientos', reverse('informe_movimientos')),
+            (self.jefe, 'informe_bodega', reverse('informe_bodega') + (
+                f'?bodega={bodega}&editorial={self.editorial.pk}&tipo=libro')),
+            (self.jefe, 'informes_generales', reverse('informes_generales')),
+            (self.bodeguero, 'movimientos_list', reverse('movimientos_list')),
+            (self.bodeguero, 'productos_autocompletar',
+             reverse('productos_autocompletar') + '?q=tit'),
+            (self.bodeguero, 'productos_stock',
+             reverse('productos_stock', args=[self.producto.pk])),
+            (self.jefe, 'api', '/api/v1/productos/?tipo=libro'),
+            (self.jefe, 'api', f'/api/v1/movimientos/?bodega_destino={bodega}'),
+            (self.jefe, 'api', f'/api/v1/existencias/?bodega={bodega}'),
+            (self.jefe, 'api', f'/api/v1/movimiento-detalles/?producto={self.producto.pk}'),
+            (self.jefe, 'api', f'/api/v1/bodegas/{bodega}/stock/?fecha=2030-01-01'),
+        ]
+
+    def test_sin_recorridos_completos(self):
+        for usuario, nombre, url in self.rutas():
+            with self.subTest(url):
+                self.client.force_login(usuario)
+                with CaptureQueriesContext(connection) as consultas:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+                permitidas = self.RECORRIDOS_PERMITIDOS.get(nombre, set())
+                for consulta in consultas.captured_queries:
+                    if not consulta['sql'].startswith('SELECT'):
+                        continue
+                    tablas = tablas_recorridas(consulta['sql']) - permitidas
+                    self.assertFalse(tablas, (
+                        f"{url} recorre {', '.join(sorted(tablas))} completa:\n"
+                        f"{consulta['sql']}\n" + '\n'.join(plan(consulta['sql']))))
+
+    def test_detecta_recorrido_completo(self):
+        # La descripción no tiene índice: la consulta debe marcarse
+        consulta = Producto.objects.filter(descripcion='x').values('id').query
+        self.assertEqual(tablas_recorridas(*consulta.sql_with_params()), {'inventario_producto'})
+
+
+class ConcurrenciaStockTests(TransactionTestCase):
+    """
+    Movimientos simultáneos desde varios hilos, cada uno con su conexión.
+    """
+    hilos = 6
+    movimientos_por_hilo = 15
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user('bodeguero', is_bodeguero=True)
+        self.bodegas = [Bodega.objects.create(nombre=f'Bodega {i}') for i in range(3)]
+        editorial = Editorial.objects.create(nombre='Editorial')
+        self.productos = [
+            Producto.objects.create(tipo='libro', titulo=f'Titulo {i}', editorial=editorial)
+            for i in range(4)
+        ]
+        for producto in self.productos:
+            for bodega in self.bodegas:
+                producto.actualizar_stock(bodega, 10)
+
+    def ejecutar_en_hilos(self, tarea):
+        """
+        Ejecuta tarea(numero_hilo) en paralelo y retorna los errores inesperados.
+        """
+        inicio = threading.Barrier(self.hilos)
+        errores = []
+
+        def ejecutar(numero):
+            try:
+                inicio.wait()
+                tarea(numero)
+            except Exception as error:
+                errores.append(error)
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=ejecutar, args=(i,)) for i in range(self.hilos)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return errores
+
+    def mover(self, origen, destino, lineas):
+        try:
+            registrar_movimiento(
+                Movimiento(bodega_origen=origen, bodega_destino=destino, usuario=self.usuario),
+                lineas)
+        except ValidationError:
+            pass  # Sin stock suficiente: el movimiento se rechaza completo
+
+    def test_transferencias_cruzadas_conservan_el_stock(self):
+        def transferir(numero):
+            azar = random.Random(numero)
+            for _ in range(self.movimientos_por_hilo):
+                origen, destino = azar.sample(self.bodegas, 2)
+                productos = azar.sample(self.productos, 2)
+                if azar.random() < 0.5:
+                    self.mover(origen, destino, [(p, azar.randint(1, 6)) for p in productos])
+                else:
+                    # Camino de un producto por vez (alta de producto, admin)
+                    movimiento = Movimiento(
+                        bodega_origen=origen, bodega_destino=destino, usuario=self.usuario)
+                    try:
+                        movimiento.save()
+                        MovimientoDetalle(
+                            movimiento=movimiento, producto=productos[0],
+                            cantidad=azar.randint(1, 6)).save()
+                    except ValidationError:
+                        pass
+
+        self.assertEqual(self.ejecutar_en_hilos(transferir), [])
+
+        for producto in self.productos:
+            total = Existencia.objects.filter(producto=producto).aggregate(
+                total=Sum('cantidad'))['total']
+            self.assertEqual(total, 10 * len(self.bodegas), producto)
+        self.assertEqual(Bodega.recalcular_totales(corregir=False), [])
+        # El stock de cada bodega es el inicial más lo que explican los movimientos
+        for bodega in self.bodegas:
+            for producto in self.productos:
+                entradas = MovimientoDetalle.objects.filter(
+                    producto=producto, movimiento__bodega_destino=bodega,
+                    movimiento__bodega_origen__isnull=False,
+                ).aggregate(total=Sum('cantidad'))['total'] or 0
+                salidas = MovimientoDetalle.objects.filter(
+                    producto=producto, movimiento__bodega_origen=bodega,
+                ).aggregate(total=Sum('cantidad'))['total'] or 0
+                self.assertEqual(
+                    producto.cantidad_disponible_en_bodega(bodega), 10 + entradas - salidas)
+
+    def test_sin_sobreventa(self):
+        producto = self.productos[0]
+        origen, destino = self.bodegas[:2]
+
+        def retirar(numero):
+            for _ in range(3):
+                self.mover(origen, destino, [(producto, 1)])
+
+        self.assertEqual(self.ejecutar_en_hilos(retirar), [])
+
+        self.assertEqual(producto.cantidad_disponible_en_bodega(origen), 0)
+        self.assertEqual(producto.cantidad_disponible_en_bodega(destino), 20)
+        self.assertEqual(MovimientoDetalle.objects.filter(producto=producto).count(), 10)
+
+
+class ConfiguracionProduccionTests(TestCase):
+
+    def test_pragmas_sqlite(self):
+        # Solo el perfil de producción cambia el modo del archivo de la base
+        with tempfile.TemporaryDirectory() as carpeta, mock.patch.dict(os.environ, {
+            'SECRET_KEY': 'prueba',
+            'DATABASE_URL': f'sqlite:///{carpeta}/inventario.sqlite3',
+        }):
+            produccion = importlib.import_module('libreria.settings_produccion')
+            produccion = importlib.reload(produccion)
+            conexion = ConnectionHandler(produccion.DATABASES)['default']
+            try:
+                with conexion.cursor() as cursor:
+                    pragmas = {
+                        nombre: cursor.execute(f'PRAGMA {nombre}').fetchone()[0]
+                        for nombre in ('journal_mode', 'synchronous', 'busy_timeout')
+                    }
+            finally:
+                conexion.close()
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 20000})
+        self.assertEqual(produccion.DATABASES['default']['CONN_MAX_AGE'], 60)
+        with connection.cursor() as cursor:
+            self.assertNotEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
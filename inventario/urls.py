@@ -1,9 +1,15 @@
-from django.urls import path
-from . import views
+from django.urls import include, path
+from . import api, views
 
 urlpatterns = [
     # Rutas para la gestión de productos
     path('productos/', views.ProductoListView.as_view(), name='productos_list'),
+    path('productos/buscar/', views.ProductoBusquedaView.as_view(),
+         name='productos_buscar'),
+    path('productos/autocompletar/', views.ProductoAutocompletarView.as_view(),
+         name='productos_autocompletar'),
+    path('productos/<int:pk>/stock/', views.ProductoStockView.as_view(),
+         name='productos_stock'),
     path('productos/nuevo/', views.ProductoCreateView.as_view(),
          name='productos_create'),
     path('productos/<int:pk>/editar/',
@@ -16,6 +22,9 @@ urlpatterns = [
     path('bodegas/nueva/', views.BodegaCreateView.as_view(), name='bodegas_create'),
     path('bodegas/<int:pk>/eliminar/',
          views.BodegaDeleteView.as_view(), name='bodegas_delete'),
+    path('bodegas/eventos/', views.BodegaEventosView.as_view(), name='bodegas_eventos'),
+    path('bodegas/<int:pk>/eventos/', views.BodegaEventosView.as_view(),
+         name='bodega_eventos'),
 
     # Rutas para la gestión de movimientos
     path('movimientos/', views.MovimientoListView.as_view(),
@@ -47,4 +56,14 @@ urlpatterns = [
          name='informe_movimientos'),
     path('informes/generales/', views.InformesGeneralesView.as_view(),
          name='informes_generales'),
+    path('informes/movimientos/exportar/<str:formato>/',
+         views.ExportarMovimientosView.as_view(), name='exportar_movimientos'),
+    path('informes/generales/exportar/<str:tabla>/<str:formato>/',
+         views.ExportarInformeGeneralView.as_view(), name='exportar_informe_general'),
+
+    # Métricas para Prometheus
+    path('metrics', views.MetricasView.as_view(), name='metricas'),
+
+    # API REST de solo lectura
+    path('api/v1/', include(api.router.urls)),
 ]
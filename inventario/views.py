@@ -1,47 +1,128 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
+from django.template.response import TemplateResponse
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView
 from django.views import View
 from django.urls import reverse_lazy
 from django.contrib import messages
+from django.utils.crypto import constant_time_compare
 from django.utils.decorators import method_decorator
 from django.contrib.auth.views import LoginView
+from django.core.handlers.asgi import ASGIRequest
+from django.core.exceptions import PermissionDenied, ValidationError
 # Importar models para usar funciones de agregación como Count
-from django.db import models
-
-from .models import Producto, Bodega, Movimiento, MovimientoDetalle, Autor, Editorial
-from .forms import MovimientoForm, MovimientoDetalleFormSet
+from django.db import models, transaction
+from django.db.models import F, Sum
+
+from .models import (
+    Producto, Bodega, DetalleArchivado, Existencia, Movimiento, MovimientoDetalle, Autor,
+    Editorial, normalizar,
+)
+from .forms import FiltroInformeBodegaForm, MovimientoForm, MovimientoDetalleFormSet, ProductoForm
+from . import busqueda, informes, metricas
+from .asincrono import VistaAsincrona, en_paralelo
+from .cache import FragmentoEnCacheMixin
+from .exportacion import FORMATOS, respuesta_exportacion
+from .fechas import leer_fecha
+from .eventos import formatear, hub
+from .consultas import ConsultaOptimizadaMixin, filtro_prefijo, optimizar
+from .paginacion import PaginacionCursorMixin
+from .stock import registrar_movimiento
 
 # -----------------------------------
 # Vistas de Productos
 # -----------------------------------
 
 
-class ProductoListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class ProductoListView(LoginRequiredMixin, UserPassesTestMixin, ConsultaOptimizadaMixin, FragmentoEnCacheMixin, PaginacionCursorMixin, ListView):
     model = Producto
     template_name = 'productos_list.html'
     context_object_name = 'productos'
+    relaciones = ['editorial', 'autores', 'existencias__bodega']
+    max_consultas = 3
+    # El stock por bodega cambia con los movimientos
+    modelos_fragmento = [Producto, Editorial, Autor, Bodega, Movimiento, MovimientoDetalle]
+    ordenamientos = {
+        'titulo': ('Título (A-Z)', ['titulo', 'id']),
+        '-titulo': ('Título (Z-A)', ['-titulo', '-id']),
+        '-id': ('Más recientes', ['-id']),
+    }
+    orden_por_defecto = 'titulo'
+
+    def test_func(self):
+        return self.request.user.is_jefe_bodega or self.request.user.is_bodeguero
+
+
+class ProductoBusquedaView(VistaAsincrona):
+    template_name = 'productos_busqueda.html'
+    por_pagina = 25
+    # Más allá no hay resultados útiles y el desplazamiento debe caber en un
+    # entero de la base de datos
+    max_paginas = 1000
+    max_consultas = 3
 
     def test_func(self):
         return self.request.user.is_jefe_bodega or self.request.user.is_bodeguero
 
+    async def get(self, request, *args, **kwargs):
+        texto = request.GET.get('q', '').strip()
+        try:
+            pagina = max(1, int(request.GET.get('pagina', 1)))
+        except ValueError:
+            pagina = 1
+        if pagina > self.max_paginas:
+            raise Http404("Página no encontrada.")
+
+        # Se pide un resultado extra para saber si hay página siguiente
+        productos = await sync_to_async(busqueda.buscar)(
+            texto, limite=self.por_pagina + 1,
+            desplazamiento=(pagina - 1) * self.por_pagina)
+        return TemplateResponse(request, self.template_name, {
+            'q': texto,
+            'productos': productos[:self.por_pagina],
+            'pagina': pagina,
+            'pagina_anterior': pagina - 1 if pagina > 1 else None,
+            'pagina_siguiente': pagina + 1 if len(productos) > self.por_pagina else None,
+        })
+
 
 class ProductoCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
     model = Producto
-    fields = ['tipo', 'titulo', 'editorial', 'autores',
-              'descripcion', 'bodega', 'cantidad']
+    form_class = ProductoForm
     template_name = 'producto_form.html'
     success_url = reverse_lazy('productos_list')
 
     def test_func(self):
         return self.request.user.is_jefe_bodega
 
+    def form_valid(self, form):
+        with transaction.atomic():
+            response = super().form_valid(form)
+            # El stock inicial entra como un movimiento sin bodega de origen
+            if form.cleaned_data['cantidad']:
+                movimiento = Movimiento(
+                    bodega_destino=form.cleaned_data['bodega'],
+                    usuario=self.request.user,
+                )
+                movimiento.save()
+                MovimientoDetalle(
+                    movimiento=movimiento,
+                    producto=self.object,
+                    cantidad=form.cleaned_data['cantidad'],
+                ).save()
+        return response
+
 
 class ProductoUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     model = Producto
-    fields = ['tipo', 'titulo', 'editorial',
-              'autores', 'descripcion', 'bodega', 'cantidad']
+    fields = ['tipo', 'codigo', 'titulo', 'editorial',
+              'autores', 'descripcion']
     template_name = 'producto_form.html'
     success_url = reverse_lazy('productos_list')
 
@@ -58,7 +139,8 @@ class ProductoDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return self.request.user.is_jefe_bodega
 
     def form_valid(self, form):
-        if MovimientoDetalle.objects.filter(producto=self.object).exists():
+        if (MovimientoDetalle.objects.filter(producto=self.object).exists()
+                or DetalleArchivado.objects.filter(producto=self.object).exists()):
             messages.error(
                 self.request, "No puedes eliminar productos que ya están en una bodega."
             )
@@ -70,10 +152,17 @@ class ProductoDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 # Vistas de Bodegas
 # -----------------------------------
 
-class BodegaListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class BodegaListView(LoginRequiredMixin, UserPassesTestMixin, ConsultaOptimizadaMixin, FragmentoEnCacheMixin, PaginacionCursorMixin, ListView):
     model = Bodega
     template_name = 'bodegas_list.html'
     context_object_name = 'bodegas'
+    max_consultas = 1
+    modelos_fragmento = [Bodega, Movimiento, MovimientoDetalle]
+    ordenamientos = {
+        'nombre': ('Nombre (A-Z)', ['nombre']),
+        '-nombre': ('Nombre (Z-A)', ['-nombre']),
+    }
+    orden_por_defecto = 'nombre'
 
     def test_func(self):
         return self.request.user.is_bodeguero or self.request.user.is_jefe_bodega
@@ -106,6 +195,76 @@ class BodegaDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return super().form_valid(form)
 
 
+class BodegaEventosView(VistaAsincrona):
+    """
+    Stream SSE con los cambios de stock de una bodega (bodegas/<pk>/eventos/)
+    o de varias (bodegas/eventos/?bodega=1&bodega=2). Al conectar envía un
+    evento 'estado' con el total de unidades de cada bodega y después un
+    evento 'stock' por cada cambio confirmado.
+
+    Solo con ASGI: bajo WSGI Django consume el generador completo antes de
+    enviar la respuesta, y como no termina ocuparía el worker para siempre.
+    """
+    max_bodegas = 100
+    # Segundos entre comentarios que mantienen viva la conexión en proxies
+    latido = 15
+    # Milisegundos que espera el navegador antes de reconectar
+    reintento = 3000
+
+    def test_func(self):
+        return self.request.user.is_bodeguero or self.request.user.is_jefe_bodega
+
+    async def get(self, request, pk=None, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return HttpResponse(
+                "El stock en vivo necesita un servidor ASGI.", status=501,
+                content_type='text/plain; charset=utf-8')
+        try:
+            bodegas = sorted({int(valor) for valor in (
+                [pk] if pk is not None else request.GET.getlist('bodega'))})
+        except ValueError:
+            return HttpResponseBadRequest("Los ids de bodega deben ser enteros.")
+        if not bodegas or len(bodegas) > self.max_bodegas:
+            return HttpResponseBadRequest(
+                f"Indica entre 1 y {self.max_bodegas} bodegas.")
+        if pk is not None and not await Bodega.objects.filter(pk=pk).aexists():
+            raise Http404("Bodega no encontrada.")
+
+        response = StreamingHttpResponse(self.eventos(bodegas), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Evita que nginx acumule el stream en su buffer
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def eventos(self, bodegas):
+        # La suscripción va antes de leer el estado para no perder cambios
+        # confirmados entre ambos
+        suscripcion = hub.suscribir(bodegas)
+        try:
+            yield f"retry: {self.reintento}\n\n"
+            yield formatear('estado', await self.estado(bodegas))
+            while True:
+                try:
+                    evento = await asyncio.wait_for(suscripcion.siguiente(), self.latido)
+                except asyncio.TimeoutError:
+                    yield ": latido\n\n"
+                    continue
+                if evento is None:
+                    # El cliente no leyó a tiempo y se descartaron eventos
+                    yield formatear('estado', await self.estado(bodegas))
+                else:
+                    yield formatear('stock', evento)
+        finally:
+            # También al desconectarse el cliente, que cancela el generador
+            hub.cancelar(suscripcion)
+
+    async def estado(self, bodegas):
+        return {'bodegas': {
+            pk: total async for pk, total in Bodega.objects.filter(
+                pk__in=bodegas).values_list('pk', 'total_unidades')
+        }}
+
+
 # -----------------------------------
 # Vistas de Movimientos
 # -----------------------------------
@@ -127,24 +286,102 @@ class MovimientoCreateView(LoginRequiredMixin, UserPassesTestMixin, View):
         if form.is_valid() and productos_formset.is_valid():
             movimiento = form.save(commit=False)
             movimiento.usuario = request.user
-            movimiento.save()  # Guardar el movimiento primero
+            lineas = [
+                (detalle_form.cleaned_data['producto'],
+                 detalle_form.cleaned_data['cantidad'])
+                for detalle_form in productos_formset
+                if detalle_form.cleaned_data  # Ignorar formularios vacíos
+            ]
+
+            try:
+                # Valida todas las líneas y guarda el movimiento en una transacción
+                registrar_movimiento(movimiento, lineas)
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                messages.success(
+                    request, "Movimiento registrado correctamente.")
+                return redirect('movimientos_list')
 
-            for detalle_form in productos_formset:
-                if detalle_form.cleaned_data:  # Ignorar formularios vacíos
-                    detalle = detalle_form.save(commit=False)
-                    detalle.movimiento = movimiento  # Asignar el movimiento
-                    detalle.save()
+        return render(request, 'movimiento_form.html', {'form': form, 'productos_formset': productos_formset})
 
-            messages.success(request, "Movimiento registrado correctamente.")
-            return redirect('movimientos_list')
 
-        return render(request, 'movimiento_form.html', {'form': form, 'productos_formset': productos_formset})
+class ProductoAutocompletarView(VistaAsincrona):
+    """
+    Opciones para el selector de productos del formulario de movimientos:
+    productos cuyo título empieza con ?q=, con stock en ?bodega= si se indica.
+    """
+    limite = 20
+    max_consultas = 1
+
+    def test_func(self):
+        return self.request.user.is_bodeguero or self.request.user.is_jefe_bodega
+
+    async def get(self, request, *args, **kwargs):
+        prefijo = normalizar(request.GET.get('q', '').strip())
+        if not prefijo:
+            return JsonResponse({'resultados': []})
+
+        productos = Producto.objects.filter(
+            filtro_prefijo('titulo_normalizado', prefijo)
+        ).order_by('titulo_normalizado', 'id')
+        bodega = request.GET.get('bodega')
+        if bodega and bodega.isdigit():
+            productos = productos.filter(
+                existencias__bodega=bodega, existencias__cantidad__gt=0
+            ).annotate(stock=models.F('existencias__cantidad'))
+        else:
+            productos = productos.annotate(stock=models.Value(None, models.IntegerField()))
+
+        return JsonResponse({'resultados': [
+            {'id': pk, 'texto': titulo, 'stock': stock}
+            async for pk, titulo, stock in productos.values_list(
+                'id', 'titulo', 'stock')[:self.limite]
+        ]})
 
 
-class MovimientoListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class ProductoStockView(VistaAsincrona):
+    """
+    Stock actual de un producto en cada bodega donde tiene existencias.
+    """
+    max_consultas = 2
+
+    def test_func(self):
+        return self.request.user.is_bodeguero or self.request.user.is_jefe_bodega
+
+    async def get(self, request, pk, *args, **kwargs):
+        try:
+            producto = await Producto.objects.only('id', 'titulo').aget(pk=pk)
+        except Producto.DoesNotExist:
+            raise Http404("Producto no encontrado.")
+        existencias = Existencia.objects.filter(
+            producto=producto, cantidad__gt=0
+        ).order_by('bodega__nombre').values_list('bodega_id', 'bodega__nombre', 'cantidad')
+        return JsonResponse({
+            'producto': producto.pk,
+            'titulo': producto.titulo,
+            'stock': [
+                {'bodega': bodega_id, 'nombre': nombre, 'cantidad': cantidad}
+                async for bodega_id, nombre, cantidad in existencias
+            ],
+        })
+
+
+# Ordenamientos comunes a los listados de movimientos
+ORDENAMIENTOS_MOVIMIENTOS = {
+    '-fecha': ('Más recientes', ['-fecha', '-id']),
+    'fecha': ('Más antiguos', ['fecha', 'id']),
+}
+
+
+class MovimientoListView(LoginRequiredMixin, UserPassesTestMixin, ConsultaOptimizadaMixin, PaginacionCursorMixin, ListView):
     model = Movimiento
     template_name = 'movimientos_list.html'
     context_object_name = 'movimientos'
+    relaciones = ['bodega_origen', 'bodega_destino', 'usuario']
+    max_consultas = 1
+    ordenamientos = ORDENAMIENTOS_MOVIMIENTOS
+    orden_por_defecto = '-fecha'
 
     def test_func(self):
         return self.request.user.is_bodeguero
@@ -154,10 +391,17 @@ class MovimientoListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
 # Vistas de Autores
 # -----------------------------------
 
-class AutorListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class AutorListView(LoginRequiredMixin, UserPassesTestMixin, ConsultaOptimizadaMixin, FragmentoEnCacheMixin, PaginacionCursorMixin, ListView):
     model = Autor
     template_name = 'autores_list.html'
     context_object_name = 'autores'
+    max_consultas = 1
+    modelos_fragmento = [Autor]
+    ordenamientos = {
+        'nombre': ('Nombre (A-Z)', ['nombre', 'id']),
+        '-nombre': ('Nombre (Z-A)', ['-nombre', '-id']),
+    }
+    orden_por_defecto = 'nombre'
 
     def test_func(self):
         return self.request.user.is_jefe_bodega
@@ -196,10 +440,17 @@ class AutorUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
 # Vistas de Editoriales
 # -----------------------------------
 
-class EditorialListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class EditorialListView(LoginRequiredMixin, UserPassesTestMixin, ConsultaOptimizadaMixin, FragmentoEnCacheMixin, PaginacionCursorMixin, ListView):
     model = Editorial
     template_name = 'editoriales_list.html'
     context_object_name = 'editoriales'
+    max_consultas = 1
+    modelos_fragmento = [Editorial]
+    ordenamientos = {
+        'nombre': ('Nombre (A-Z)', ['nombre']),
+        '-nombre': ('Nombre (Z-A)', ['-nombre']),
+    }
+    orden_por_defecto = 'nombre'
 
     def test_func(self):
         return self.request.user.is_jefe_bodega
@@ -238,60 +489,159 @@ class EditorialUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
 # Informes
 # -----------------------------------
 
-class InformeMovimientosView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+class InformeMovimientosView(LoginRequiredMixin, UserPassesTestMixin, ConsultaOptimizadaMixin, PaginacionCursorMixin, ListView):
+    model = Movimiento
     template_name = 'informe_movimientos.html'
+    context_object_name = 'movimientos'
+    relaciones = ['bodega_origen', 'bodega_destino', 'usuario']
+    max_consultas = 1
+    ordenamientos = ORDENAMIENTOS_MOVIMIENTOS
+    orden_por_defecto = '-fecha'
+    por_pagina = 50
 
     def test_func(self):
         return self.request.user.is_jefe_bodega
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['movimientos'] = Movimiento.objects.all()
-        return context
-
 
-class InformesGeneralesView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+class InformesGeneralesView(VistaAsincrona):
     template_name = 'informes_generales.html'
+    # Con la caché de informes vacía
+    max_consultas = 5
 
     def test_func(self):
         return self.request.user.is_jefe_bodega
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        # Cantidad de productos por bodega basado en los productos asignados actualmente
-        context['productos_por_bodega'] = [
-            {
-                'nombre': bodega.nombre,
-                'cantidad': Producto.objects.filter(bodega=bodega).count()
-            }
-            for bodega in Bodega.objects.all()
-        ]
-
-        # Tipos de productos por editorial
-        context['productos_por_editorial'] = [
-            {
-                'editorial': editorial.nombre,
-                'libros': Producto.objects.filter(editorial=editorial, tipo='libro').count(),
-                'revistas': Producto.objects.filter(editorial=editorial, tipo='revista').count(),
-                'enciclopedias': Producto.objects.filter(editorial=editorial, tipo='enciclopedia').count(),
-            }
-            for editorial in Editorial.objects.all()
-        ]
-
-        # Movimientos recientes
-        context['movimientos_recientes'] = Movimiento.objects.order_by(
-            '-fecha')[:10]
-
-        return context
-
-
-class InformeBodegaView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+    async def get(self, request, *args, **kwargs):
+        # Los cinco agregados son independientes y se calculan a la vez
+        informes_en_cache, total_productos, unidades = await asyncio.gather(
+            en_paralelo(
+                lambda: informes.en_cache('productos_por_bodega'),
+                lambda: informes.en_cache('productos_por_editorial'),
+                lambda: informes.en_cache('movimientos_recientes'),
+            ),
+            Producto.objects.acount(),
+            Bodega.objects.aaggregate(total=Sum('total_unidades')),
+        )
+        productos_por_bodega, productos_por_editorial, movimientos_recientes = informes_en_cache
+        return TemplateResponse(request, self.template_name, {
+            'productos_por_bodega': productos_por_bodega,
+            'productos_por_editorial': productos_por_editorial,
+            'movimientos_recientes': movimientos_recientes,
+            'total_productos': total_productos,
+            'total_unidades': unidades['total'] or 0,
+        })
+
+
+class ExportarMovimientosView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """
+    Historial de movimientos a nivel de detalle en CSV, JSONL o XLSX.
+    Acepta ?desde=AAAA-MM-DD y ?hasta=AAAA-MM-DD (exclusivo).
+    """
+
+    def test_func(self):
+        return self.request.user.is_jefe_bodega
+
+    def get(self, request, formato):
+        if formato not in FORMATOS:
+            raise Http404("Formato no soportado.")
+        return respuesta_exportacion(
+            'movimientos',
+            informes.COLUMNAS_DETALLE_MOVIMIENTOS,
+            informes.detalle_movimientos(
+                leer_fecha(request.GET.get('desde')), leer_fecha(request.GET.get('hasta'))),
+            formato,
+        )
+
+
+class ExportarInformeGeneralView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """
+    Tablas de informes_generales.html en CSV, JSONL o XLSX.
+    """
+    tablas = {
+        'bodegas': (informes.productos_por_bodega, ['nombre', 'cantidad']),
+        'editoriales': (
+            informes.productos_por_editorial,
+            ['editorial', *informes.COLUMNAS_POR_TIPO.values()],
+        ),
+    }
+
+    def test_func(self):
+        return self.request.user.is_jefe_bodega
+
+    def get(self, request, tabla, formato):
+        if tabla not in self.tablas or formato not in FORMATOS:
+            raise Http404("Informe o formato no soportado.")
+        consulta, columnas = self.tablas[tabla]
+        filas = consulta().values_list(*columnas)
+        return respuesta_exportacion(f'informe_{tabla}', columnas, filas, formato)
+
+
+class InformeBodegaView(PaginacionCursorMixin, VistaAsincrona):
+    """
+    Productos con stock en una bodega, opcionalmente de una editorial y un
+    tipo: resumen agrupado por editorial y tipo, y listado paginado. Las dos
+    consultas se ejecutan a la vez.
+    """
     template_name = 'informe_bodega.html'
+    ordenamientos = {
+        'titulo': ('Título (A-Z)', ['titulo', 'id']),
+        '-titulo': ('Título (Z-A)', ['-titulo', '-id']),
+    }
+    orden_por_defecto = 'titulo'
+    por_pagina = 50
+    max_consultas = 6
 
     def test_func(self):
         return self.request.user.is_jefe_bodega
 
+    async def get(self, request, *args, **kwargs):
+        filtros = FiltroInformeBodegaForm(request.GET or None)
+        context = {'filtros': filtros}
+        if await sync_to_async(filtros.is_valid)():
+            datos = filtros.cleaned_data
+            pagina, resumen = await en_paralelo(
+                lambda: self.paginar(self.productos(datos)),
+                lambda: informes.en_cache(
+                    'existencias_por_editorial',
+                    bodega=datos['bodega'].pk,
+                    editorial=datos['editorial'].pk if datos['editorial'] else None,
+                    tipo=datos['tipo'] or None,
+                ),
+            )
+            context.update({'pagina': pagina, 'productos': pagina.objetos, 'resumen': resumen})
+        return TemplateResponse(request, self.template_name, context)
+
+    def productos(self, datos):
+        # El filtro y la anotación en la misma relación usan un solo JOIN
+        productos = optimizar(Producto.objects.all(), ['editorial']).filter(
+            existencias__bodega=datos['bodega'], existencias__cantidad__gt=0)
+        if datos['editorial']:
+            productos = productos.filter(editorial=datos['editorial'])
+        if datos['tipo']:
+            productos = productos.filter(tipo=datos['tipo'])
+        return productos.annotate(cantidad=F('existencias__cantidad'))
+
+
+# -----------------------------------
+# Métricas
+# -----------------------------------
+
+class MetricasView(View):
+    """
+    Métricas de rendimiento en formato de texto de Prometheus (ver
+    metricas.py). Las lee Prometheus con settings.INVENTARIO_METRICAS_TOKEN o
+    un usuario staff con sesión.
+    """
+
+    def get(self, request):
+        token = getattr(settings, 'INVENTARIO_METRICAS_TOKEN', '')
+        autorizacion = request.headers.get('Authorization', '')
+        con_token = bool(token) and constant_time_compare(autorizacion, f'Bearer {token}')
+        if not (con_token or request.user.is_staff):
+            raise PermissionDenied
+        return HttpResponse(
+            metricas.registro.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 
 # -----------------------------------
 # Autenticación
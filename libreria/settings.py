@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -24,6 +26,9 @@ SECRET_KEY = 'django-insecure-3&r@8%2n%2bd^7#!-posp@ki3(#%l=0anfx7a2pov==k#4*%e7
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
+# manage.py test: los diagnósticos que dependen de DEBUG se evalúan aquí,
+# antes de que el runner lo desactive
+TESTING = sys.argv[1:2] == ['test']
 
 ALLOWED_HOSTS = ['*']
 AUTH_USER_MODEL = 'inventario.Usuario'
@@ -31,6 +36,28 @@ LOGIN_URL = '/login/'  # URL del login
 LOGIN_REDIRECT_URL = '/'  # Dónde redirigir después de iniciar sesión
 LOGOUT_REDIRECT_URL = '/login/'  # Dónde redirigir después de cerrar sesión
 CSRF_FAILURE_VIEW = 'django.views.csrf.csrf_failure'
+# Un movimiento de 500 líneas envía dos campos por línea más la cabecera
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 5000
+# Prefijo de los códigos de movimiento; acepta {anio} y {bodega}, por ejemplo
+# 'MOV-{anio}-' para numerar cada año por separado
+INVENTARIO_PREFIJO_MOVIMIENTO = 'MOV-'
+# Vistas que superan su max_consultas: 'registrar' deja en el log el informe
+# de sus consultas; True además las hace fallar (así lo usan las pruebas);
+# False no las mide
+INVENTARIO_VERIFICAR_CONSULTAS = 'registrar' if DEBUG else False
+# Registra en el log las consultas repetidas (N+1) y las lentas de cada
+# petición, con la línea de código o de plantilla que las origina. Las
+# pruebas lo activan con override_settings donde lo verifican
+INVENTARIO_REGISTRO_CONSULTAS = DEBUG and not TESTING
+INVENTARIO_CONSULTA_LENTA_MS = 100
+# Alias de CACHES para los informes (ver inventario/cache.py)
+INVENTARIO_CACHE = 'default'
+# Agrega la cabecera Server-Timing con el tiempo en base de datos y de render
+# de cada petición (ver inventario/metricas.py)
+INVENTARIO_SERVER_TIMING = DEBUG
+# Token que Prometheus envía como "Authorization: Bearer <token>" para leer
+# /metrics; sin token solo pueden leerlo los usuarios staff
+INVENTARIO_METRICAS_TOKEN = os.environ.get('INVENTARIO_METRICAS_TOKEN', '')
 
 
 # Application definition
@@ -42,11 +69,15 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'inventario',
     'libreria',
 ]
 
 MIDDLEWARE = [
+    # Primero, para que la duración incluya al resto de middlewares
+    'inventario.metricas.MetricasMiddleware',
+    'inventario.consultas.RegistroConsultasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +89,11 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'libreria.urls'
 
+# Sin 'loaders' en OPTIONS, Django usa el loader en caché
+# (django.template.loaders.cached.Loader): cada plantilla se compila una sola
+# vez por proceso; con DEBUG se vacía al editar una plantilla. Las partes de
+# los listados que no cambian se guardan además ya renderizadas con
+# {% cache %} (ver FragmentoEnCacheMixin en inventario/cache.py).
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -79,11 +115,39 @@ WSGI_APPLICATION = 'libreria.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# En producción la base se configura con DATABASE_URL (ver
+# settings_produccion.py).
+
+SQLITE_OPCIONES = {
+    # SQLite no tiene SELECT ... FOR UPDATE: las transacciones toman el
+    # bloqueo de escritura al comenzar, así dos movimientos concurrentes
+    # se ejecutan uno después del otro en lugar de fallar al escribir
+    'transaction_mode': 'IMMEDIATE',
+}
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPCIONES,
+        # Base de pruebas en archivo: la de memoria compartida entre hilos no
+        # espera los bloqueos, y las pruebas de concurrencia usan varios hilos
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# locmem sirve con un solo proceso; con varios workers la caché debe ser
+# compartida para que las invalidaciones lleguen a todos, por ejemplo:
+#   'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#   'LOCATION': 'redis://127.0.0.1:6379',
+# o 'django.core.cache.backends.filebased.FileBasedCache' en un solo servidor.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -107,6 +171,42 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated',
+    ],
+}
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+# inventario.consultas: presupuestos de consultas superados, consultas
+# repetidas y lentas (ver inventario/consultas.py)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'inventario': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 